@@ -0,0 +1,186 @@
+import argparse
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rich.console import Console
+from rich.progress import Progress
+from rich.table import Table
+
+from main import (add_pipeline_arguments, analyze_apk, load_scan_rules, load_tools_config, report_base_dir,
+                  sig_key_alias, sig_key_password, sig_key_path)
+from source.operations.sign_apk import sign_apks
+from source.ui.banner import banner
+
+# Console bound to the real stdout, so batch progress never lands in an APK log
+console = Console(file=sys.stdout)
+
+batch_base_dir = os.path.join(report_base_dir, 'batch')
+
+# Sends what worker threads print to their APK's log file, like the Tee class of testmain.py.
+# A context variable rather than a thread local, so the stage threads of an APK inherit its log file.
+class ThreadOutput:
+    def __init__(self, stream):
+        self.stream = stream
+        self.log_file = contextvars.ContextVar("log_file", default=None)
+
+    def target(self):
+        return self.log_file.get() or self.stream
+
+    def write(self, data):
+        return self.target().write(data)
+
+    def flush(self):
+        self.target().flush()
+
+    def isatty(self):
+        return self.target() is self.stream and self.stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def collect_apks(source):
+    """
+    Return the APK paths of a batch.
+
+    :param source: A directory (searched recursively for .apk files) or a text
+                   file listing one APK path per line (blank lines and # comments ignored)
+    """
+    if os.path.isdir(source):
+        apks = []
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            apks.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith('.apk'))
+        return apks
+
+    with open(source, 'r', encoding='utf-8') as list_file:
+        return [line.strip() for line in list_file if line.strip() and not line.strip().startswith('#')]
+
+def report_dirs(apks):
+    """Give every APK its own output directory, even when file names collide."""
+    used = {}
+    dirs = []
+    for apk_path in apks:
+        apk_name = os.path.splitext(os.path.basename(apk_path))[0]
+        used[apk_name] = used.get(apk_name, 0) + 1
+        suffix = f"_{used[apk_name]}" if used[apk_name] > 1 else ""
+        dirs.append(os.path.join(batch_base_dir, f"{apk_name}{suffix}"))
+    return dirs
+
+def run_one(apk_path, report_dir, args, config, rules, output, jvm_slot, python_slot):
+    os.makedirs(report_dir, exist_ok=True)
+    started = time.perf_counter()
+    with open(os.path.join(report_dir, 'run.log'), 'w', encoding='utf-8') as log_file:
+        token = output.log_file.set(log_file)
+        try:
+            # Signing is left to sign_batch, which signs every APK with a single key load
+            summary = analyze_apk(apk_path, args, config, report_dir, jvm_slot, python_slot, sign=False, rules=rules)
+        except Exception as e:
+            log_file.write(f"\n[-] Error: {e}\n")
+            summary = {"apk": apk_path, "status": "failed", "findings": 0, "files_patched": 0,
+                       "report_dir": report_dir, "error": str(e)}
+        finally:
+            output.log_file.reset(token)
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    return summary
+
+def sign_batch(summaries, workers):
+    """Sign every rebuilt APK of the batch together, the key is loaded once and shared by the workers."""
+    unsigned = [summary for summary in summaries if summary.get("unsigned_apk")]
+    if not unsigned:
+        return
+    errors = sign_apks([summary["unsigned_apk"] for summary in unsigned], sig_key_path, sig_key_alias,
+                       sig_key_password, workers)
+    for summary in unsigned:
+        apk_path = summary.pop("unsigned_apk")
+        error = errors.get(apk_path)
+        if error:
+            summary["status"] = "failed"
+            summary["error"] = f"Signing failed: {error}"
+        else:
+            summary["signed_apk"] = apk_path
+
+def print_summary(summaries):
+    table = Table(title="[green]Batch Summary[/green]", show_header=True, header_style="bold magenta")
+    table.add_column("APK", style="cyan")
+    table.add_column("Status")
+    table.add_column("Findings", justify="right")
+    table.add_column("Patched Files", justify="right")
+    table.add_column("Seconds", justify="right")
+    table.add_column("Output", style="cyan")
+
+    for summary in summaries:
+        status_text = "[green]ok[/green]" if summary["status"] == "ok" else f"[red]{summary['status']}[/red]"
+        table.add_row(os.path.basename(summary["apk"]), status_text, str(summary["findings"]),
+                      str(summary["files_patched"]), f"{summary['seconds']:.2f}", summary["report_dir"])
+    console.print(table)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Analyze, harden and re-sign a batch of APKs.")
+    parser.add_argument("source", help="Directory containing APKs, or a text file listing one APK path per line")
+    parser.add_argument("--workers", type=int, default=4, help="APKs processed at the same time")
+    parser.add_argument("--jvm-slots", type=int, default=2,
+                        help="Concurrent JVM heavy stages (decompile, recompile)")
+    parser.add_argument("--python-slots", type=int, default=os.cpu_count() or 1,
+                        help="Concurrent Python stages (info, scan); also the signing worker processes")
+    add_pipeline_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    config = load_tools_config()
+    # Compiled once and shared by every APK of the batch
+    rules = load_scan_rules(args.rules)
+
+    banner()
+
+    if not os.path.exists(args.source):
+        console.print(f"[red][-][/red] [bold red]Error:[/bold red] Batch source not found: {args.source}")
+        sys.exit(1)
+
+    apks = collect_apks(args.source)
+    if not apks:
+        console.print("[yellow][!][/yellow] No APKs found.")
+        sys.exit(1)
+
+    jvm_slot = threading.BoundedSemaphore(args.jvm_slots)
+    python_slot = threading.BoundedSemaphore(args.python_slots)
+
+    # Per APK output goes to Report/batch/<apk>/run.log instead of the terminal
+    output = ThreadOutput(sys.stdout)
+    sys.stdout = output
+    summaries = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(run_one, apk_path, report_dir, args, config, rules, output, jvm_slot, python_slot)
+                       for apk_path, report_dir in zip(apks, report_dirs(apks))]
+
+            # Leave stdout alone, the worker threads' output is already routed to their logs
+            with Progress(console=console, redirect_stdout=False, redirect_stderr=False) as progress:
+                task = progress.add_task("[bold green]Analyzing APKs...[/bold green]", total=len(apks))
+                for future in as_completed(futures):
+                    summaries.append(future.result())
+                    progress.advance(task)
+    finally:
+        sys.stdout = output.stream
+
+    # Keep the input order in the summary so it is stable between runs
+    order = {apk_path: index for index, apk_path in enumerate(apks)}
+    summaries.sort(key=lambda summary: (order[summary["apk"]], summary["report_dir"]))
+    sign_batch(summaries, args.python_slots)
+    print_summary(summaries)
+
+    summary_path = os.path.join(batch_base_dir, 'summary.json')
+    with open(summary_path, 'w', encoding='utf-8') as summary_file:
+        json.dump(summaries, summary_file, indent=4)
+    console.print(f"[green][+][/green] Batch summary saved: {summary_path}")
+
+    if any(summary["status"] != "ok" for summary in summaries):
+        sys.exit(1)
+
+# Run the main function
+if __name__ == "__main__":
+    main()
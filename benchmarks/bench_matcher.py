@@ -0,0 +1,82 @@
+"""
+Microbenchmark: line by line `in` loop vs. MultiPatternMatcher.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_matcher
+"""
+import random
+import string
+import time
+
+from source.scanner.matcher import MultiPatternMatcher
+
+# The real search words, used as the base of every generated pattern set
+BASE_PATTERNS = [
+    'android:debuggable="true"', 'android:allowBackup="true"', 'android:usesCleartextTrafic="true"',
+    'android:exported="true"', '.setJavaScriptEnabled(true)', '"google_api_key"',
+    '"Google_Api_Key"', '"google_crash_reporting_api_key"',
+    'websettings.setAllowFileAccess(true)', 'setPluginState()', '.firebaseio.com'
+]
+
+PATTERN_COUNTS = [10, 100, 1000]
+LINE_COUNT = 20000
+
+def random_word(rng, length):
+    return ''.join(rng.choice(string.ascii_letters + '_.') for _ in range(length))
+
+def make_patterns(rng, count):
+    patterns = BASE_PATTERNS[:count]
+    while len(patterns) < count:
+        patterns.append(f'"{random_word(rng, rng.randint(8, 24))}"')
+    return patterns
+
+def make_text(rng, patterns):
+    lines = []
+    for _ in range(LINE_COUNT):
+        line = f'    <item name="{random_word(rng, 12)}" value="{random_word(rng, 30)}" />'
+        if rng.random() < 0.01:
+            line += ' ' + rng.choice(patterns)
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+def loop_scan(text, patterns):
+    found = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        for index, pattern in enumerate(patterns):
+            if pattern in line:
+                found.append((line_number, index))
+    return found
+
+def matcher_scan(text, matcher):
+    return matcher.find_lines(text)
+
+def best_of(function, *args, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    rng = random.Random(1234)
+    print(f"{'patterns':>9} {'loop (s)':>10} {'compile (s)':>12} {'matcher (s)':>12} {'speedup':>8}")
+    for count in PATTERN_COUNTS:
+        patterns = make_patterns(rng, count)
+        text = make_text(rng, patterns)
+
+        loop_time, loop_found = best_of(loop_scan, text, patterns)
+        compile_time, matcher = best_of(MultiPatternMatcher, patterns)
+        matcher_time, matcher_found = best_of(matcher_scan, text, matcher)
+
+        if loop_found != matcher_found:
+            raise SystemExit(f"Result mismatch at {count} patterns")
+
+        print(f"{count:>9} {loop_time:>10.4f} {compile_time:>12.4f} {matcher_time:>12.4f} "
+              f"{loop_time / matcher_time:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark of the scan / patch / screenshot path on synthetic decoded trees.
+
+Times searching_the_secret_word, modify_secret_word, the evidence page rendering
+of images mode and save_output_as_image without apktool or a JVM, and stores the results as JSON
+so two revisions can be compared. Run from the repository root:
+
+    python -m benchmarks.bench_pipeline --files 5000 --label before
+    python -m benchmarks.bench_pipeline --files 5000 --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from itertools import islice
+
+from benchmarks.synthetic_tree import DEFAULT_OPTIONS, HIT_WORDS, generate_tree
+from main import default_rules_path, modify_secret_word, searching_the_secret_word
+from source.scanner.rules import RuleSet, load_rules
+from source.operations.decompile_apk import save_output_as_image
+from source.operations.evidence import EvidenceBundle
+from source.operations.findings import FindingsSink, iter_findings
+from source.operations.screenshot import evidence_pages, page_filename, render_page
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def timed(function, setup=None, repeat=3):
+    """Run function repeat times (setup untimed before each run); return (timings, last result)."""
+    timings, result = [], None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+def summarize(timings, **extra):
+    return {"best": min(timings), "mean": sum(timings) / len(timings), "runs": timings, **extra}
+
+def bench_scan(tree, work_dir, args):
+    findings_path = os.path.join(work_dir, "findings.ndjson")
+
+    def run():
+        evidence = None
+        if args.evidence == "text":
+            evidence = EvidenceBundle(os.path.join(work_dir, "evidence.json"), "synthetic", work_dir)
+        with FindingsSink(findings_path) as findings:
+            searching_the_secret_word(tree, os.path.join(work_dir, "screenshots"), args.scan_rules,
+                                      findings, args.jobs, None, args.render_workers, evidence)
+        if evidence is not None:
+            evidence.write(findings_path, findings.total)
+        return findings.total
+
+    os.makedirs(os.path.join(work_dir, "screenshots"), exist_ok=True)
+    timings, total = timed(run, repeat=args.repeat)
+    sample = [(finding["file"], finding["line"], finding["context"])
+              for finding in islice(iter_findings(findings_path), args.screenshots)]
+    return summarize(timings, hits=total), sample
+
+def bench_modify(pristine, tree, args):
+    # Every run patches a fresh copy of the tree; the copy is not timed
+    def reset():
+        shutil.rmtree(tree, ignore_errors=True)
+        shutil.copytree(pristine, tree)
+
+    timings, patch_stats = timed(lambda: modify_secret_word(tree, args.scan_rules, args.jobs),
+                                 setup=reset, repeat=args.repeat)
+    return summarize(timings, files_patched=patch_stats.get("files_patched", 0))
+
+def bench_screenshots(sample, work_dir, args):
+    # What images mode does per file: merge the hits into pages, name them by content, draw them
+    screenshot_dir = os.path.join(work_dir, "evidence_pages")
+    os.makedirs(screenshot_dir, exist_ok=True)
+    hits_by_file = {}
+    for filepath, line_number, context in sample:
+        hits_by_file.setdefault(filepath, []).append((line_number, context))
+
+    def run():
+        pages = 0
+        for hits in hits_by_file.values():
+            for rows in evidence_pages(hits):
+                render_page(rows, os.path.join(screenshot_dir, page_filename(rows)))
+                pages += 1
+        return pages
+
+    timings, pages = timed(run, repeat=args.repeat)
+    per_page = [timing / pages for timing in timings] if pages else timings
+    return summarize(per_page, hits=len(sample), images=pages, unit="seconds per image")
+
+def bench_output_image(work_dir, args):
+    output = "\n".join(f"I: Decoding file-resources {index}..." for index in range(args.output_lines))
+    image_path = os.path.join(work_dir, "decompile.png")
+    timings, _ = timed(lambda: save_output_as_image(output, image_path), repeat=args.repeat)
+    return summarize(timings, lines=args.output_lines)
+
+def compare(results, previous_path):
+    with open(previous_path, "r", encoding="utf-8") as previous_file:
+        previous = json.load(previous_file)
+    print(f"\nCompared with {previous['revision']} ({previous.get('label') or previous_path}):")
+    print(f"{'benchmark':<28} {'before (s)':>11} {'after (s)':>11} {'change':>8}")
+    for name, result in results["results"].items():
+        before = previous["results"].get(name)
+        if not before:
+            continue
+        change = (result["best"] - before["best"]) / before["best"] * 100 if before["best"] else 0.0
+        print(f"{name:<28} {before['best']:>11.4f} {result['best']:>11.4f} {change:>+7.1f}%")
+    if previous.get("config") != results["config"]:
+        print("Warning: the two runs used different tree options, the numbers are not directly comparable.")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark the scan/patch/screenshot path on a synthetic decoded tree.")
+    for option, default in DEFAULT_OPTIONS.items():
+        parser.add_argument(f"--{option.replace('_', '-')}", type=type(default), default=default)
+    parser.add_argument("--jobs", type=int, default=1, help="Scan worker processes")
+    parser.add_argument("--render-workers", type=int, default=1, help="Screenshot worker processes in image mode")
+    parser.add_argument("--evidence", choices=["text", "images"], default="text", help="Evidence mode of the scan")
+    parser.add_argument("--screenshots", type=int, default=20, help="Hits rendered by the evidence image benchmark")
+    parser.add_argument("--output-lines", type=int, default=40, help="Lines of fake apktool output to render")
+    parser.add_argument("--rules", default=default_rules_path,
+                        help="Rule file to scan with; 'all' matches every search word in every file")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--label", default="", help="Free text stored with the results")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare with")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated tree and outputs")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    args.scan_rules = RuleSet.from_words(HIT_WORDS) if args.rules == "all" else load_rules(args.rules)
+    tree_options = {option: getattr(args, option) for option in DEFAULT_OPTIONS}
+    work_dir = tempfile.mkdtemp(prefix="apkmech-bench-")
+    pristine = os.path.join(work_dir, "pristine")
+    tree = os.path.join(work_dir, "tree")
+
+    try:
+        start = time.perf_counter()
+        generate_tree(pristine, **tree_options)
+        print(f"Generated {args.files} files in {time.perf_counter() - start:.2f}s: {pristine}")
+
+        results = {}
+        results["searching_the_secret_word"], sample = bench_scan(pristine, work_dir, args)
+        results["modify_secret_word"] = bench_modify(pristine, tree, args)
+        results["render_evidence"] = bench_screenshots(sample, work_dir, args)
+        results["save_output_as_image"] = bench_output_image(work_dir, args)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'benchmark':<28} {'best (s)':>10} {'mean (s)':>10}")
+    for name, result in results.items():
+        print(f"{name:<28} {result['best']:>10.4f} {result['mean']:>10.4f}")
+
+    record = {
+        "revision": git_revision(),
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {**tree_options, "rules": args.scan_rules.version, "jobs": args.jobs, "evidence": args.evidence, "render_workers": args.render_workers},
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{record['revision']}.json")
+    with open(results_path, "w", encoding="utf-8") as results_file:
+        json.dump(record, results_file, indent=4)
+    print(f"\nResults saved: {results_path}")
+
+    if args.compare:
+        compare(record, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Synthetic decoded-APK trees for the benchmarks, laid out like apktool output:
+AndroidManifest.xml, apktool.yml, res/ (xml and binary drawables), smali*/,
+assets/ and lib/. Generated from a seed, so the same options always give the same tree.
+"""
+import os
+import random
+import string
+
+# Search words planted in text files, the same ones main.py looks for
+HIT_WORDS = [
+    'android:debuggable="true"', 'android:allowBackup="true"', 'android:usesCleartextTrafic="true"',
+    'android:exported="true"', '.setJavaScriptEnabled(true)', '"google_api_key"',
+    '"Google_Api_Key"', '"google_crash_reporting_api_key"',
+    'websettings.setAllowFileAccess(true)', 'setPluginState()', '.firebaseio.com'
+]
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+ELF_HEADER = b"\x7fELF\x02\x01\x01\x00"
+
+DEFAULT_OPTIONS = {
+    "files": 2000,          # Files besides the manifest and apktool.yml
+    "smali_ratio": 0.6,     # Share of the files that are smali
+    "xml_ratio": 0.25,      # Share that are res/ xml
+    "binary_ratio": 0.1,    # Share that are binary (drawables, native libraries); the rest are assets
+    "lines": 200,           # Lines per text file
+    "binary_kb": 16,        # Size of each binary file
+    "hit_density": 0.001,   # Probability that a text line carries a search word
+    "seed": 1234,
+}
+
+def _word(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+def _maybe_hit(rng, line, hit_density):
+    if rng.random() < hit_density:
+        return f"{line} {rng.choice(HIT_WORDS)}"
+    return line
+
+def _smali_lines(rng, class_name, lines, hit_density):
+    out = [f".class public L{class_name};", ".super Ljava/lang/Object;", ""]
+    while len(out) < lines:
+        method = _word(rng, 8)
+        out += [f".method public {method}()V", "    .locals 2"]
+        for _ in range(min(6, lines - len(out))):
+            line = f'    const-string v0, "{_word(rng, 16)}"'
+            out.append(_maybe_hit(rng, line, hit_density))
+        out += ["    return-void", ".end method", ""]
+    return out[:lines]
+
+def _xml_lines(rng, lines, hit_density):
+    out = ['<?xml version="1.0" encoding="utf-8"?>', "<resources>"]
+    while len(out) < lines - 1:
+        line = f'    <string name="{_word(rng, 10)}">{_word(rng, 24)}</string>'
+        out.append(_maybe_hit(rng, line, hit_density))
+    out.append("</resources>")
+    return out
+
+def _asset_lines(rng, lines, hit_density):
+    return [_maybe_hit(rng, f'var {_word(rng, 6)} = "{_word(rng, 30)}";', hit_density) for _ in range(lines)]
+
+def _write_text(path, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+
+def _write_binary(rng, path, header, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(header + rng.randbytes(max(0, size - len(header))))
+
+def generate_tree(root_directory, **options):
+    """
+    Write a synthetic decoded tree under root_directory.
+
+    :param options: Any of DEFAULT_OPTIONS
+    """
+    options = {**DEFAULT_OPTIONS, **options}
+    rng = random.Random(options["seed"])
+    lines, hit_density = options["lines"], options["hit_density"]
+
+    _write_text(os.path.join(root_directory, "apktool.yml"), ["version: 2.7.0", "apkFileName: synthetic.apk"])
+    manifest = ['<?xml version="1.0" encoding="utf-8"?>',
+                '<manifest xmlns:android="http://schemas.android.com/apk/res/android" package="com.synthetic.app">',
+                '    <application android:debuggable="true" android:allowBackup="true">']
+    for index in range(20):
+        manifest.append(f'        <activity android:name=".Activity{index}" android:exported="{"true" if index % 4 == 0 else "false"}"/>')
+    manifest += ["    </application>", "</manifest>"]
+    _write_text(os.path.join(root_directory, "AndroidManifest.xml"), manifest)
+
+    files = options["files"]
+    smali_count = int(files * options["smali_ratio"])
+    xml_count = int(files * options["xml_ratio"])
+    binary_count = int(files * options["binary_ratio"])
+    asset_count = max(0, files - smali_count - xml_count - binary_count)
+    binary_size = options["binary_kb"] * 1024
+
+    for index in range(smali_count):
+        package = f"com/synthetic/p{index % 50}"
+        class_name = f"{package}/Class{index}"
+        smali_dir = "smali" if index % 3 else "smali_classes2"
+        _write_text(os.path.join(root_directory, smali_dir, f"{class_name}.smali"),
+                    _smali_lines(rng, class_name, lines, hit_density))
+    for index in range(xml_count):
+        kind = ("values", "layout", "xml")[index % 3]
+        if kind == "values":
+            # One strings.xml per values directory, like qualifiers (values-de, values-night, ...)
+            path = os.path.join(root_directory, "res", f"values-q{index}", "strings.xml")
+        else:
+            path = os.path.join(root_directory, "res", f"{kind}-{index % 7}", f"file{index}.xml")
+        _write_text(path, _xml_lines(rng, lines, hit_density))
+    for index in range(binary_count):
+        if index % 5:
+            path, header = os.path.join(root_directory, "res", f"drawable-{index % 4}", f"image{index}.png"), PNG_HEADER
+        else:
+            path, header = os.path.join(root_directory, "lib", "arm64-v8a", f"lib{index}.so"), ELF_HEADER
+        _write_binary(rng, path, header, binary_size)
+    for index in range(asset_count):
+        _write_text(os.path.join(root_directory, "assets", f"script{index}.js"), _asset_lines(rng, lines, hit_density))
@@ -1,17 +1,37 @@
 import os
 import json
 import sys
+import argparse
+from contextlib import nullcontext
+from itertools import chain
 from rich.console import Console
+from rich.table import Table
 
 # Importing  functions from source directories
 from source.ui.banner import banner
+from source.ui.status import live_progress, status
+from source.utils.metrics import RunMetrics
+from source.utils.tool_runner import ToolError, tool_options
+from source.pipeline.scheduler import StageGraph, StageError
 from source.operations.decompile_apk import decompile_apk
+from source.operations.decompile_cache import DEFAULT_CACHE_MAX_MB
 from source.operations.recompile_apk import recompile_apk
-from source.operations.modify_code import modify_code
-from source.operations.screenshot import take_screenshot
+from source.operations.incremental_build import incremental_recompile, snapshot_tree
+from source.operations.screenshot import ScreenshotPool
+from source.operations.evidence import EvidenceBundle
+from source.operations.findings import FindingsSink
+from source.operations.report import FPDF, apk_info, write_report
 from source.operations.sign_apk import sign_apk
+from source.operations.manifest_patch import boolean_flips, patch_apk_manifest
+from source.scanner.apk_scan import scan_apk
+from source.scanner.dex_scan import scan_apk_code
+from source.scanner.rules import load_rules
+from source.scanner.scan_cache import ScanCache, cache_version
+from source.scanner.scan_index import FIXED, UNCHANGED, ScanIndex, scan_version
+from source.scanner.scan import scan_buffer, scan_tree, sources_required
 
 #iporting functions from APK_INFO directories
+from source.APK_INFO.apk_metadata import load_apk_metadata, save_apk_metadata_json
 from source.APK_INFO.apk_activities import get_apk_activities
 from source.APK_INFO.apk_info import get_apk_info
 from source.APK_INFO.apk_permissions import get_apk_permissions
@@ -21,128 +41,630 @@ from source.APK_INFO.apk_services import get_apk_services
 console = Console()
 
 report_base_dir = os.path.join(os.getcwd(),'Report')
+cache_base_dir = os.path.join(report_base_dir, '.cache')
 
-search_words_before_modification = [
-        'android:debuggable="true"', 'android:allowBackup="true"', 'android:usesCleartextTrafic="true"', 
-        'android:exported="true"', '.setJavaScriptEnabled(true)', '"google_api_key"', 
-        '"Google_Api_Key"', '"google_crash_reporting_api_key"', 
-        'websettings.setAllowFileAccess(true)', 'setPluginState()', '.firebaseio.com'
-    ]
+# Key every rebuilt APK is signed with
+sig_key_path = os.path.join(os.getcwd(), 'sign_key.jks')
+sig_key_alias = 'root_alias'
+sig_key_password = 'root@123'
+
+# Scan rules (pattern, path globs, file types), see source/scanner/rules.py
+default_rules_path = 'rules.json'
+
+# Hits of one file sharing an evidence image at most; noisier files get several groups
+MAX_GROUP_HITS = 256
 
 def collect_apk_info(apk_path):
-    get_apk_info(apk_path)
-    get_apk_activities(apk_path)
-    get_apk_permissions(apk_path)
-    get_apk_services(apk_path)
+    # Parse the APK once and hand the same metadata to every table
+    metadata = load_apk_metadata(apk_path, os.path.join(cache_base_dir, 'metadata'))
+    get_apk_info(metadata)
+    get_apk_activities(metadata)
+    get_apk_permissions(metadata)
+    get_apk_services(metadata)
     console.print("\n" * 1)
+    return metadata
+
 
 
+def record_findings(hits, screenshot_dir, findings, render_workers=None, evidence=None, metrics=None, screenshots=None,
+                    index=None):
+    """
+    Stream every (search_word, filepath, line_number, context) hit to the FindingsSink as it
+    arrives and render its evidence; nothing is accumulated in memory beyond the hits of one file.
+    The hits of a file (consecutive in the scan output) share one image highlighting every hit
+    line, rendered by a background pool of render_workers processes; each finding records its image.
+    When an EvidenceBundle is given (text evidence mode), no image is rendered.
+    With RunMetrics, the wait for the render pool once all hits are in is recorded as the screenshots stage.
+    When a ScreenshotPool is given, it is used instead and left open for the caller to close.
+    With a ScanIndex, every hit is marked new or unchanged, only new ones get a screenshot,
+    and the findings of the last scan that are gone are written last, marked fixed.
+    """
+    owned = screenshots is None and evidence is None
+    if owned:
+        screenshots = ScreenshotPool(render_workers)
+    # Hits of the file being streamed, written once its image is queued
+    group = []
 
-def searching_the_secret_word(root_directory, screenshot_dir, search_words):
-    found_any = False  # Flag to track if any word has been found
-    found_words = []  # List to store found words
-    for dirpath, _, filenames in os.walk(root_directory):
-        for filename in filenames:
-            filepath = os.path.join(dirpath, filename)
-            
-            # Skip files with a .smali extension
-            if filename.endswith('.smali'):
+    def write_group():
+        shown = [(line_number, context) for _, _, line_number, context, status in group if status != UNCHANGED]
+        images = screenshots.submit_file(screenshot_dir, shown) if shown else {}
+        for search_word, filepath, line_number, context, status in group:
+            findings.add(search_word, filepath, line_number, context, status,
+                         images.get(line_number) if status != UNCHANGED else None)
+        group.clear()
+
+    try:
+        for search_word, filepath, line_number, context in hits:
+            # The scanner hands over the original lines, so patched files still show the hit
+            status = index.mark(search_word, filepath, line_number, context) if index else None
+            if screenshots is None:
+                findings.add(search_word, filepath, line_number, context, status)
                 continue
-            
-            with open(filepath, "r", encoding="utf-8", errors="replace") as file:
-                for line_number, line in enumerate(file, start=1):
-                    for search_word in search_words:
-                        if search_word in line:
-                            if not found_any:  # Print scanning message only once
-                                found_any = True
-                            take_screenshot(filepath, screenshot_dir, line_number, search_word)
-                            found_words.append((search_word, filepath, line_number))  # Store found word with filepath and line number
-                            
-    return found_any, found_words
-
-def modify_secret_word(root_directory, search_words):
-    for dirpath, _, filenames in os.walk(root_directory):
-        for filename in filenames:
-            filepath = os.path.join(dirpath, filename)
-            with open(filepath, "r", encoding="utf-8", errors="replace") as file:
-                for _, line in enumerate(file, start=1):
-                    for search_word in search_words:
-                        if search_word in line:
-                            modify_code(filepath)
+            if group and (group[0][1] != filepath or len(group) >= MAX_GROUP_HITS):
+                write_group()
+            group.append((search_word, filepath, line_number, context, status))
+        if group:
+            write_group()
+        if index:
+            for relpath, search_word, line_number, context in index.fixed():
+                findings.add(search_word, relpath, line_number, context, FIXED)
+    finally:
+        if owned:
+            with metrics.stage("screenshots") if metrics else nullcontext({}) as counters:
+                screenshots.close()
+                counters.update(images_rendered=screenshots.rendered, images_reused=screenshots.reused)
 
-def main():
+    return findings
+
+def searching_the_secret_word(root_directory, screenshot_dir, rules, findings, jobs=1, patch_stats=None,
+                              render_workers=None, evidence=None, metrics=None, screenshots=None, apk_path=None,
+                              index=None, scan_cache=None):
+    """
+    Scan the decoded tree with the rules (a RuleSet, or a list of search words matched everywhere)
+    and stream every hit to findings (see record_findings), with a live progress bar of the files
+    scanned and the findings so far.
+
+    When apk_path is given, the dex files of that APK are also matched against the code rules.
+    With a ScanIndex, files unchanged since the last scan of the package are skipped (see scan_tree),
+    and with a ScanCache so are files whose content was scanned before in any APK.
+
+    When patch_stats is a dict, every scanned file containing a replacement_dict key
+    is also patched during the same pass, and the files and bytes touched are recorded in it.
+    """
+    patch = patch_stats is not None
+
+    with live_progress(console, "[bold magenta]Scanning files[/bold magenta]") as update:
+        progress = lambda done, total: update(completed=done, total=total, findings=findings.total)
+        # Hits come back in a deterministic order, whether scanned here or in worker processes
+        hits = scan_tree(root_directory, rules, jobs, patch, patch_stats, progress, index, scan_cache)
+        if apk_path:
+            hits = chain(hits, scan_apk_code(apk_path, rules, patch_stats, index))
+        return record_findings(hits, screenshot_dir, findings, render_workers, evidence, metrics, screenshots, index)
+
+def modify_secret_word(root_directory, rules, jobs=1):
+    """Patch the decoded tree without taking screenshots; every file is rewritten at most once."""
+    patch_stats = {}
+    for _ in scan_tree(root_directory, rules, jobs, True, patch_stats):
+        pass
+    return patch_stats
+
+def prepare_evidence(report_dir, apk_name, render_images):
+    """Return the screenshot directory and, in text evidence mode, a new EvidenceBundle."""
+    screenshot_dir = os.path.join(report_dir, f"{apk_name}_screenshots")
+
+    evidence = None
+    if render_images:
+        if not os.path.exists(screenshot_dir):
+            os.makedirs(screenshot_dir)
+            console.print(f"[green][+][/green] Created directory: {screenshot_dir}")
+    else:
+        evidence_path = os.path.join(report_dir, f"{apk_name}_evidence.json")
+        evidence = EvidenceBundle(evidence_path, apk_name, screenshot_dir)
+    return screenshot_dir, evidence
+
+def findings_path(report_dir, apk_name):
+    return os.path.join(report_dir, f"{apk_name}_findings.ndjson")
+
+def print_findings(findings, evidence, top_files=10):
+    """Print aggregated counts per rule and for the files with the most hits; every hit is in the NDJSON file."""
+    if evidence is not None:
+        evidence.write(findings.ndjson_path, findings.total)
+        console.print(f"[green][+][/green] Evidence bundle saved: {evidence.bundle_path} ({evidence.html_path})")
+        console.print(f"[cyan][*][/cyan] Render images later with: python render_evidence.py {evidence.bundle_path}")
+
+    if findings.total:
+        console.print(f"[green][+][/green] {findings.total} secret word(s) found in {len(findings.by_file)} file(s), "
+                      f"{'screenshots taken' if evidence is None else 'evidence recorded'}.")
+        console.print(f"[green][+][/green] Every finding streamed to: {findings.ndjson_path}")
+
+        table = Table(title="[cyan]Findings per rule[/cyan]", show_header=True, header_style="bold magenta")
+        table.add_column("Rule", style="yellow")
+        table.add_column("Hits", justify="right")
+        for word, count in findings.by_rule.most_common():
+            table.add_row(word, str(count))
+        console.print(table)
+
+        table = Table(title=f"[cyan]Top {top_files} files[/cyan]", show_header=True, header_style="bold magenta")
+        table.add_column("File", style="cyan")
+        table.add_column("Hits", justify="right")
+        for filepath, count in findings.by_file.most_common(top_files):
+            table.add_row(filepath, str(count))
+        console.print(table)
+    else:
+        console.print("[yellow][!][/yellow] No secret words were found.")
+    if findings.by_status:
+        console.print(f"[green][+][/green] Since the last scan: [red]{findings.by_status['new']} new[/red], "
+                      f"[yellow]{findings.by_status['unchanged']} unchanged[/yellow], "
+                      f"[green]{findings.by_status['fixed']} fixed[/green].")
+    console.print("\n" * 2)
+
+def record_summary(summary, findings, top_files=20):
+    """Copy the finding counts into the run summary, where the report reads them."""
+    counts = findings.summary(top_files)
+    summary["findings"] = counts["total"]
+    summary["findings_by_rule"] = counts["by_rule"]
+    summary["findings_by_file"] = counts["by_file"]
+    summary["findings_by_status"] = counts["by_status"]
+    summary["findings_ndjson"] = counts["ndjson"]
+
+def write_apk_report(summary, args, report_dir, apk_name, metrics):
+    """Write report.html and report.pdf of the APK from its summary and findings (see ReportBuilder)."""
+    if args.report == "none":
+        return
+    formats = ("html", "pdf") if args.report == "both" else (args.report,)
+    if "pdf" in formats and FPDF is None:
+        console.print("[yellow][!][/yellow] fpdf is not installed, writing the HTML report only.")
+        formats = ("html",)
+    screenshot_dir = os.path.join(report_dir, f"{apk_name}_screenshots") if args.evidence == "images" else None
+    with metrics.stage("report") as counters:
+        paths = write_report(summary, report_dir, apk_name, screenshot_dir, formats)
+        counters["findings"] = summary.get("findings", 0)
+    summary["reports"] = paths
+    summary["stage_seconds"] = metrics.wall_times()
+    for path in paths:
+        console.print(f"[green][+][/green] [bold green]Report saved as:[/bold green] {path}")
+
+def open_scan_index(metadata, rules, mode, bases, args, report_dir):
+    """
+    Index of the last scan of the same package in this mode (see ScanIndex),
+    or None when the package name is unknown. --full-scan rescans every file.
+    """
+    if not metadata or not metadata.get("package"):
+        return None
+    index_path = os.path.join(cache_base_dir, 'index', f"{metadata['package']}_{mode}.json")
+    return ScanIndex(index_path, scan_version(rules, mode), bases, not args.full_scan, report_dir)
+
+def open_scan_cache(rules, args):
+    """The fleet wide ScanCache of these rules, unless --no-scan-cache."""
+    if args.no_scan_cache:
+        return None
+    os.makedirs(cache_base_dir, exist_ok=True)
+    return ScanCache(os.path.join(cache_base_dir, 'scan_cache.sqlite'), cache_version(rules))
+
+def close_scan_cache(scan_cache, counters, summary):
+    """Write the new results and record the hit rate of this scan."""
+    if scan_cache is None:
+        return
+    scan_cache.close()
+    counters.update(cache_hits=scan_cache.stats["hits"], cache_misses=scan_cache.stats["misses"],
+                    cache_bytes_reused=scan_cache.stats["bytes_reused"])
+    summary["scan_cache_hit_rate"] = round(scan_cache.hit_rate(), 4)
+
+def print_cache_stats(scan_cache):
+    if scan_cache is None:
+        return
+    looked_up = scan_cache.stats["hits"] + scan_cache.stats["misses"]
+    console.print(f"[cyan][*][/cyan] Scan cache: [cyan]{scan_cache.stats['hits']}[/cyan]/{looked_up} file(s) "
+                  f"already scanned in an earlier APK ({scan_cache.hit_rate():.0%}), "
+                  f"[cyan]{scan_cache.stats['bytes_reused']}[/cyan] bytes not matched again.")
+
+def save_scan_index(index, metadata, apk_path, report_dir):
+    if index is None:
+        return
+    index.save({"apk": apk_path, "sha256": metadata.get("sha256"), "version_name": metadata.get("version_name"),
+                "version_code": metadata.get("version_code"), "report_dir": report_dir})
+
+def print_index_stats(index):
+    if index is None:
+        return
+    previous = index.previous_run
+    if previous is None:
+        console.print("[cyan][*][/cyan] No earlier scan of this package with these rules, every file was scanned.")
+        return
+    console.print(f"[cyan][*][/cyan] Compared with the scan of version [cyan]{previous.get('version_name')}[/cyan] "
+                  f"({previous.get('time')}): [cyan]{index.stats['files_reused']}[/cyan] unchanged file(s) reused, "
+                  f"[cyan]{index.stats['files_rescanned']}[/cyan] scanned.")
+    for origin in sorted(path for path in index.origins if path):
+        console.print(f"[cyan][*][/cyan] Evidence of {index.origins[origin]} unchanged finding(s) is in: {origin}")
+
+def print_patch_stats(patch_stats):
+    files_patched = patch_stats.get("files_patched", 0)
+    bytes_written = patch_stats.get("bytes_written", 0)
+    if files_patched:
+        console.print(f"[green][+][/green] Patched [cyan]{files_patched}[/cyan] file(s), [cyan]{bytes_written}[/cyan] bytes written.")
+        for filepath in patch_stats["patched_files"]:
+            console.print(f"[white]\\_[/white][cyan]{filepath}[/cyan]")
+    else:
+        console.print("[yellow][!][/yellow] Nothing to modify.")
+
+def add_pipeline_arguments(parser):
+    """Options shared by the single APK and the batch entry points."""
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Worker processes for the secret word scan (0 = all CPU cores)")
+    parser.add_argument("--render-workers", type=int, default=0,
+                        help="Worker processes rendering screenshots in the background (0 = all CPU cores)")
+    parser.add_argument("--evidence", choices=["text", "images"], default="text",
+                        help="Write findings to a text evidence bundle (default) or render a PNG per hit")
+    parser.add_argument("--with-sources", action="store_true",
+                        help="Always baksmali the dex files, even when no scan rule reads smali")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Always rebuild the whole APK with apktool instead of reusing untouched entries")
+    parser.add_argument("--fast-manifest", action="store_true",
+                        help="Manifest-only hardening: patch the binary manifest in place, no apktool round trip")
+    parser.add_argument("--from-apk", action="store_true",
+                        help="Triage only: scan the entries straight from the APK zip, no decoding, rebuild or JVM")
+    parser.add_argument("--no-scan-cache", action="store_true",
+                        help="Do not reuse nor record results in the fleet wide scan cache (Report/.cache/scan_cache.sqlite)")
+    parser.add_argument("--full-scan", action="store_true",
+                        help="Scan every file again, even those unchanged since the last scan of the same package")
+    parser.add_argument("--rules", default=default_rules_path,
+                        help="Scan rule file: patterns with the path globs and file types they apply to")
+    parser.add_argument("--report", choices=["both", "html", "pdf", "none"], default="both",
+                        help="Report written to <report>/report.html and report.pdf from the findings and stage metrics")
+    parser.add_argument("--profile", action="store_true",
+                        help="Dump cProfile stats of the Python stages to <report>/profile/<stage>.prof")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Analyze, harden and re-sign an APK.")
+    parser.add_argument("apk_path", nargs="?", help="Path of the APK to analyze")
+    parser.add_argument("--json", dest="json_path", help="Also write the APK metadata to this JSON file")
+    add_pipeline_arguments(parser)
+    return parser.parse_args()
+
+def load_tools_config():
     # Load tool paths from configuration file
-    with console.status("[bold green]Loading tool configuration...[/bold green]") as status:
+    with status(console, "[bold green]Loading tool configuration...[/bold green]"):
         try:
             with open('tools_config.json', 'r') as config_file:
-                config = json.load(config_file)
+                return json.load(config_file)
         except FileNotFoundError:
             console.print("[red][!][/red] [bold red]Error:[/bold red] [bold red]tools_config.json file not found![/bold red]")
             sys.exit(1)
 
-    banner()
-
-    if len(sys.argv) < 2:
-        console.print("[red][-][/red] [bold red]Error:[/bold red] APK path is required!", style="bold red")
+def load_scan_rules(rules_path=default_rules_path):
+    # Load the scan rules and compile their routing index
+    try:
+        return load_rules(rules_path)
+    except FileNotFoundError:
+        console.print(f"[red][!][/red] [bold red]Error:[/bold red] [bold red]{rules_path} file not found![/bold red]")
+        sys.exit(1)
+    except ValueError as e:
+        console.print(f"[red][!][/red] [bold red]Error:[/bold red] [bold red]Invalid rule file {rules_path}: {e}[/bold red]")
         sys.exit(1)
 
-    apk_path = sys.argv[1]
+def analyze_apk(apk_path, args, config, report_dir=report_base_dir, jvm_slot=nullcontext(), python_slot=nullcontext(),
+                sign=True, rules=None):
+    """
+    Run every stage (info, decompile, scan and patch, recompile, sign) for one APK.
+    With --from-apk only info and a scan of the APK zip itself run (see scan_apk_only).
+
+    :param apk_path: Path of the APK to analyze
+    :param args: Parsed command line options (see add_pipeline_arguments)
+    :param config: Content of tools_config.json
+    :param report_dir: Directory receiving every output of this APK
+    :param jvm_slot: Context manager held around the JVM heavy stages (decompile, recompile)
+    :param python_slot: Context manager held around the Python stages (info, scan, sign)
+    :param sign: Sign the rebuilt APK; when False it is left unsigned for the caller to sign
+    :param rules: RuleSet to scan with, loaded from args.rules when not given
+    :return: Summary dict with status, findings, files_patched and the output paths
+    """
     apk_name = os.path.splitext(os.path.basename(apk_path))[0]
-    output_dir = os.path.join(report_base_dir, apk_name)
+    output_dir = os.path.join(report_dir, apk_name)
+    summary = {"apk": apk_path, "status": "failed", "findings": 0, "files_patched": 0, "report_dir": report_dir}
 
-    # Collect APK Info
-    console.print("[cyan][+][/cyan][bold cyan] Collecting APK info ...[/bold cyan]")
-    collect_apk_info(apk_path)
-    console.print("\n" * 1)
+    # Every stage appends its timings and counters to metrics.jsonl
+    profile_dir = os.path.join(report_dir, 'profile') if args.profile else None
+    metrics = RunMetrics(os.path.join(report_dir, 'metrics.jsonl'), apk_path, profile_dir)
+    summary["metrics"] = metrics.metrics_path
+    rules = rules or load_scan_rules(args.rules)
+
+    # Stages run as soon as their inputs are ready: info (androguard) alongside the apktool decode,
+    # and the screenshot rendering alongside the rebuild and signing
+    graph = StageGraph()
 
-    # Decompile APK
-    console.print("[cyan][+][/cyan][bold cyan] Decompiling APK...[/bold cyan]")
-    decompile_img_path = os.path.join(report_base_dir,'decompile.png')
-    decompile_apk(apk_path, output_dir, decompile_img_path)
+    def info_stage(results):
+        # Collect APK Info
+        console.print("[cyan][+][/cyan][bold cyan] Collecting APK info ...[/bold cyan]")
+        with python_slot, metrics.stage("info", profile=True):
+            metadata = collect_apk_info(apk_path)
+        summary["apk_info"] = apk_info(metadata)
+        console.print("\n" * 1)
 
-    root_directory = os.path.join(output_dir)
-    screenshot_dir = os.path.join(report_base_dir, f"{apk_name}_screenshots")
+        if getattr(args, "json_path", None):
+            save_apk_metadata_json(metadata, args.json_path)
+            console.print(f"[green][+][/green] APK metadata saved as JSON: {args.json_path}")
+        return metadata
 
-    if not os.path.exists(screenshot_dir):
-        os.makedirs(screenshot_dir)
-        console.print(f"[green][+][/green] Created directory: {screenshot_dir}")
+    graph.add("info", info_stage)
 
-    # Search and modify secret words
-    console.print("[magenta][*][/magenta][bold magenta] Searching for secret words...[/bold magenta]")
-    found_any, found_words = searching_the_secret_word(root_directory, screenshot_dir, search_words_before_modification)
+    if args.from_apk:
+        graph.add("scan", lambda results: scan_apk_only(apk_path, args, report_dir, summary, metrics, rules,
+                                                        python_slot, results["info"]), after=("info",))
+        run_stages(graph, summary, metrics)
+        write_apk_report(summary, args, report_dir, apk_name, metrics)
+        return summary
+
+    if args.fast_manifest:
+        if boolean_flips() is not None:
+            graph.add("harden", lambda results: harden_manifest_only(apk_path, args, report_dir, summary, metrics,
+                                                                      rules, python_slot, sign))
+            run_stages(graph, summary, metrics)
+            write_apk_report(summary, args, report_dir, apk_name, metrics)
+            return summary
+        console.print("[yellow][!][/yellow] Some replacements are not manifest flags, using the apktool round trip.")
+
+    render_images = args.evidence == "images"
+    screenshot_dir, evidence = prepare_evidence(report_dir, apk_name, render_images)
+    render_workers = args.render_workers or os.cpu_count()
+    # Owned here rather than by the scan, so rendering can go on while the APK is rebuilt
+    screenshots = ScreenshotPool(render_workers) if render_images else None
+    patch_stats = {}
+    recompile_apk_path = os.path.join(report_dir, f"new_{apk_name}.apk")
+    # JVM, apktool, timeout and memory limit settings of the external tools
+    tool_settings = tool_options(config)
+
+    def decompile_stage(results):
+        # Decompile APK
+        console.print("[cyan][+][/cyan][bold cyan] Decompiling APK...[/bold cyan]")
+        # Text evidence mode does no image work at all, including the apktool output image
+        draw_output = render_images and tool_settings["tool_output_image"]
+        decompile_img_path = os.path.join(report_dir,'decompile.png') if draw_output else None
+        decode_cache_dir = os.path.join(cache_base_dir, 'decoded')
+        cache_max_mb = config.get('decode_cache_max_mb', DEFAULT_CACHE_MAX_MB)
+        # Baksmaling every dex is the slowest part of decoding; skip it when nothing reads smali
+        decode_options = []
+        if not (args.with_sources or sources_required(rules)):
+            decode_options = ['--no-src']
+            console.print("[cyan][*][/cyan] No scan rule reads smali, decoding resources only (original dex is reused).")
+        with jvm_slot, metrics.stage("decompile") as counters:
+            try:
+                counters["cache_hit"] = decompile_apk(apk_path, output_dir, decompile_img_path, decode_cache_dir,
+                                                      cache_max_mb, decode_options, tool_settings,
+                                                      os.path.join(report_dir, 'apktool_decode.log'))
+            except ToolError as e:
+                raise StageError(f"Decompilation failed: {e}")
+        if counters["cache_hit"]:
+            console.print("[green][+][/green] Reused cached decoded tree, apktool was skipped.")
+        # Remember the decoded state so the rebuild only redoes what gets modified
+        return snapshot_tree(output_dir) if os.path.exists(output_dir) else {}
+
+    def scan_stage(results):
+        # Search and modify secret words
+        console.print("[magenta][*][/magenta][bold magenta] Searching for secret words...[/bold magenta]")
+        jobs = args.jobs or os.cpu_count()
+        # Only the files changed since the last scan of this package are scanned again
+        index = open_scan_index(results["info"], rules, "tree", (output_dir + os.sep, f"{apk_path}!/"), args,
+                                report_dir)
+        scan_cache = open_scan_cache(rules, args)
+        with python_slot, metrics.stage("scan", profile=True) as counters:
+            try:
+                with FindingsSink(findings_path(report_dir, apk_name)) as findings:
+                    searching_the_secret_word(output_dir, screenshot_dir, rules, findings, jobs, patch_stats,
+                                              render_workers, evidence, metrics, screenshots, apk_path, index,
+                                              scan_cache)
+            finally:
+                close_scan_cache(scan_cache, counters, summary)
+            save_scan_index(index, results["info"], apk_path, report_dir)
+            counters.update(files_scanned=patch_stats.get("files_scanned", 0),
+                            bytes_scanned=patch_stats.get("bytes_scanned", 0),
+                            dex_files=patch_stats.get("dex_files", 0),
+                            files_reused=index.stats["files_reused"] if index else 0,
+                            hits=findings.total, files_patched=patch_stats.get("files_patched", 0))
+        console.print("\n" * 1)
+
+        print_index_stats(index)
+        print_cache_stats(scan_cache)
+
+        for name in patch_stats.get("undecoded", []):
+            console.print(f"[yellow][!][/yellow] Could not parse [cyan]{name}[/cyan], its code was not scanned.")
+        print_findings(findings, evidence)
+        record_summary(summary, findings)
+
+        console.print("[red][+][/red][bold red] Modifying secret words...[/bold red]")
+        # Files were already patched during the scan; report what was touched
+        print_patch_stats(patch_stats)
+        console.print("\n" * 1)
+        summary["files_patched"] = patch_stats.get("files_patched", 0)
+        return findings
+
+    def screenshots_stage(results):
+        # Wait for the images still being rendered, while the rebuild goes on
+        with metrics.stage("screenshots") as counters:
+            screenshots.close()
+            counters.update(images_rendered=screenshots.rendered, images_reused=screenshots.reused)
+
+    def recompile_stage(results):
+        # Check if the directory exists before recompiling
+        if not os.path.exists(output_dir):
+            raise StageError(f"APK decompilation directory not found: {output_dir}")
+
+        # Recompile the APK
+        console.print("[cyan][+][/cyan][bold cyan] Recompiling APK ...[/bold cyan]")
+        build_log_path = os.path.join(report_dir, 'apktool_build.log')
+        with jvm_slot, metrics.stage("recompile"):
+            try:
+                if args.full_rebuild:
+                    recompile_apk(output_dir, recompile_apk_path, tool_settings, build_log_path)
+                else:
+                    try:
+                        rebuild = incremental_recompile(output_dir, apk_path, recompile_apk_path, results["decompile"],
+                                                        patch_stats.get("patched_files", []), tool_settings,
+                                                        build_log_path)
+                        console.print(f"[green]APK rebuilt incrementally ({rebuild}): {recompile_apk_path}[/green]")
+                    except ToolError:
+                        # A full build would hit the same limit
+                        raise
+                    except (ValueError, RuntimeError) as e:
+                        console.print(f"[yellow][!][/yellow] Incremental rebuild failed ({e}), running a full apktool build.")
+                        recompile_apk(output_dir, recompile_apk_path, tool_settings, build_log_path)
+            except ToolError as e:
+                raise StageError(f"Recompilation failed: {e}")
+        console.print("\n" * 1)
+
+    graph.add("decompile", decompile_stage)
+    # The package name from info selects the index of its last scan
+    graph.add("scan", scan_stage, after=("decompile", "info"))
+    if screenshots is not None:
+        graph.add("screenshots", screenshots_stage, after=("scan",))
+    graph.add("recompile", recompile_stage, after=("scan",))
+    # Signing the recompiled APK
+    graph.add("sign", lambda results: finish_apk(recompile_apk_path, summary, metrics, sign, python_slot),
+              after=("recompile",))
+
+    try:
+        run_stages(graph, summary, metrics)
+    finally:
+        if screenshots is not None:
+            screenshots.close()
+    # Once every screenshot is rendered, so the report can embed them
+    write_apk_report(summary, args, report_dir, apk_name, metrics)
+    return summary
+
+def run_stages(graph, summary, metrics):
+    """Run the stage graph of one APK; a StageError marks the APK as failed instead of raising."""
+    try:
+        graph.run()
+    except StageError as e:
+        console.print(f"[red][-][/red] [bold red]Error:[/bold red] {e}")
+        summary["status"] = "failed"
+        summary["error"] = str(e)
+    summary["stage_seconds"] = metrics.wall_times()
+    return summary
+
+def harden_manifest_only(apk_path, args, report_dir, summary, metrics, rules, python_slot=nullcontext(), sign=True):
+    """
+    Fast path for manifest-only hardening: flip the flags in the binary AndroidManifest.xml
+    inside the APK, copy every other entry untouched and sign, without apktool.
+    Only the manifest is scanned for findings.
+    """
+    apk_name = os.path.splitext(os.path.basename(apk_path))[0]
+    screenshot_dir, evidence = prepare_evidence(report_dir, apk_name, args.evidence == "images")
+    recompile_apk_path = os.path.join(report_dir, f"new_{apk_name}.apk")
+    manifest_location = f"{apk_path}!/AndroidManifest.xml"
+
+    console.print("[red][+][/red][bold red] Patching binary manifest (no apktool round trip)...[/bold red]")
+    render_workers = args.render_workers or os.cpu_count()
+    with python_slot, metrics.stage("manifest_patch", profile=True) as counters:
+        try:
+            manifest_text, counts = patch_apk_manifest(apk_path, recompile_apk_path)
+        except ValueError as e:
+            raise StageError(f"Binary manifest patching failed: {e}")
+        hits = scan_buffer(manifest_text, rules, manifest_location, 'AndroidManifest.xml')
+        with FindingsSink(findings_path(report_dir, apk_name)) as findings:
+            record_findings(hits, screenshot_dir, findings, render_workers, evidence, metrics)
+        counters.update(files_scanned=1, bytes_scanned=len(manifest_text), hits=findings.total)
     console.print("\n" * 1)
 
-    if found_any:
-        console.print(f"[green][+][/green] Secret words found and screenshots taken.")
-        console.print("[cyan]Found words:[/cyan]")
-        for word, filepath, line_number in found_words:
-            console.print(f"[white]\\_[/white][yellow]{word}[/yellow] found in [cyan]{filepath}[/cyan] at line [green]{line_number}[/green]")
-    else:
-        console.print("[yellow][!][/yellow] No secret words were found.")
-    console.print("\n" * 2)
+    print_findings(findings, evidence)
+    record_summary(summary, findings)
 
-    console.print("[red][+][/red][bold red] Modifying secret words...[/bold red]")
-    modify_secret_word(root_directory, search_words_before_modification)
+    if counts:
+        for attribute, count in sorted(counts.items()):
+            console.print(f"[white]\\_[/white][yellow]android:{attribute}[/yellow] flipped [green]{count}[/green] time(s)")
+        summary["files_patched"] = 1
+    else:
+        console.print("[yellow][!][/yellow] Nothing to modify.")
     console.print("\n" * 1)
 
-    # Check if the directory exists before recompiling
-    if not os.path.exists(output_dir):
-        console.print(f"[red][-][/red] [bold red]Error:[/bold red] APK decompilation directory not found: {output_dir}")
-        sys.exit(1)
+    # Signing the patched APK
+    return finish_apk(recompile_apk_path, summary, metrics, sign, python_slot)
 
-    # Recompile the APK
-    console.print("[cyan][+][/cyan][bold cyan] Recompiling APK ...[/bold cyan]")
-    recompile_apk_path = os.path.join(report_base_dir, f"new_{apk_name}.apk")
-    recompile_apk(output_dir, recompile_apk_path)
+def scan_apk_only(apk_path, args, report_dir, summary, metrics, rules, python_slot=nullcontext(), metadata=None):
+    """
+    Triage mode: scan the APK entries straight from the zip (see scan_apk), with binary XML and
+    resources.arsc decoded in memory. Nothing is written besides the findings and their evidence,
+    and no APK is rebuilt or signed. With the metadata of the info stage, entries unchanged since
+    the last scan of the package are not read again.
+    """
+    apk_name = os.path.splitext(os.path.basename(apk_path))[0]
+    screenshot_dir, evidence = prepare_evidence(report_dir, apk_name, args.evidence == "images")
+    render_workers = args.render_workers or os.cpu_count()
+    scan_stats = {}
+    index = open_scan_index(metadata, rules, "apk", (f"{apk_path}!/",), args, report_dir)
+    scan_cache = open_scan_cache(rules, args)
+
+    console.print("[magenta][*][/magenta][bold magenta] Searching for secret words inside the APK...[/bold magenta]")
+    with python_slot, metrics.stage("scan", profile=True) as counters:
+        try:
+            with FindingsSink(findings_path(report_dir, apk_name)) as findings:
+                with live_progress(console, "[bold magenta]Scanning entries[/bold magenta]") as update:
+                    progress = lambda done, total: update(completed=done, total=total, findings=findings.total)
+                    hits = scan_apk(apk_path, rules, scan_stats, progress, index, scan_cache)
+                    record_findings(hits, screenshot_dir, findings, render_workers, evidence, metrics, index=index)
+        finally:
+            close_scan_cache(scan_cache, counters, summary)
+        save_scan_index(index, metadata or {}, apk_path, report_dir)
+        counters.update(files_scanned=scan_stats.get("files_scanned", 0),
+                        bytes_scanned=scan_stats.get("bytes_scanned", 0),
+                        files_reused=index.stats["files_reused"] if index else 0, hits=findings.total)
     console.print("\n" * 1)
 
-    # Signing the recompiled APK
-    console.print("[cyan][+][/cyan][bold cyan] Signing APK ...[/bold cyan]")
-    sig_key_path = os.path.join(os.getcwd(), 'sign_key.jks')
-    sign_apk(recompile_apk_path, sig_key_path, 'root_alias', 'root@123')
+    print_index_stats(index)
+    print_cache_stats(scan_cache)
+
+    for name in scan_stats.get("undecoded", []):
+        console.print(f"[yellow][!][/yellow] Could not decode [cyan]{name}[/cyan], its content was not scanned.")
+    print_findings(findings, evidence)
+    record_summary(summary, findings)
+
+    console.print("[green][+][/green] [bold green]Scan completed, no APK was rebuilt.[/bold green]")
+    summary["status"] = "ok"
+    return summary
+
+def finish_apk(recompile_apk_path, summary, metrics, sign=True, python_slot=nullcontext()):
+    """
+    Sign the rebuilt APK (in process, see sign_apk) and complete the summary; a signing error raises StageError.
+    With sign=False the caller signs it later, e.g. batch.py signs all its APKs together.
+    """
+    if sign:
+        console.print("[cyan][+][/cyan][bold cyan] Signing APK ...[/bold cyan]")
+        with python_slot, metrics.stage("sign", profile=True):
+            error = sign_apk(recompile_apk_path, sig_key_path, sig_key_alias, sig_key_password)
+        if error:
+            raise StageError(f"Signing failed: {error}")
+        summary["signed_apk"] = recompile_apk_path
+    else:
+        summary["unsigned_apk"] = recompile_apk_path
 
     console.print("\n" * 1)
     console.print("[green][+][/green] [bold green]Process completed successfully![/bold green]")
+    summary["status"] = "ok"
+    return summary
+
+def print_stage_metrics(summary):
+    table = Table(title="[green]Stage Timings[/green]", show_header=True, header_style="bold magenta")
+    table.add_column("Stage", style="cyan")
+    table.add_column("Seconds", justify="right")
+    for stage, seconds in summary.get("stage_seconds", {}).items():
+        table.add_row(stage, f"{seconds:.2f}")
+    console.print(table)
+    console.print(f"[green][+][/green] Stage metrics saved: {summary['metrics']}")
+
+def main():
+    args = parse_arguments()
+    config = load_tools_config()
+
+    banner()
+
+    if not args.apk_path:
+        console.print("[red][-][/red] [bold red]Error:[/bold red] APK path is required!", style="bold red")
+        sys.exit(1)
+
+    summary = analyze_apk(args.apk_path, args, config)
+    if "stage_seconds" in summary:
+        print_stage_metrics(summary)
+    if summary["status"] != "ok":
+        sys.exit(1)
 
 # Run the main function
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+import argparse
+import os
+import sys
+from rich.console import Console
+
+from source.operations.evidence import render_evidence
+
+# Initialize console for rich output
+console = Console()
+
+def main():
+    parser = argparse.ArgumentParser(description="Render PNG screenshots from an APK evidence bundle.")
+    parser.add_argument("bundle_path", help="Evidence bundle JSON written by main.py")
+    parser.add_argument("--ids", type=int, nargs="+", help="Ids of the findings to render (default: all)")
+    parser.add_argument("--output-dir", help="Directory for the images (default: the bundle's screenshot directory)")
+    parser.add_argument("--workers", type=int, default=0, help="Rendering processes (0 = all CPU cores)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.bundle_path):
+        console.print(f"[red][-][/red] [bold red]Error:[/bold red] Evidence bundle not found: {args.bundle_path}")
+        sys.exit(1)
+
+    with console.status("[bold green]Rendering evidence images, please wait...[/bold green]", spinner="dots"):
+        rendered = render_evidence(args.bundle_path, args.ids, args.output_dir, args.workers or os.cpu_count())
+
+    console.print(f"[green][+][/green] Rendered [cyan]{rendered}[/cyan] evidence image(s).")
+
+# Run the main function
+if __name__ == "__main__":
+    main()
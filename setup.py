@@ -39,7 +39,17 @@ class CustomInstallCommand(install):
         # Save paths to a configuration file
         config = {
             'apktool_dir': apktool_dir,
-           
+            'decode_cache_max_mb': 10240,
+            # JVM and apktool settings, see DEFAULT_TOOL_OPTIONS in source/utils/tool_runner.py
+            'java': 'java',
+            'jvm_heap_mb': None,
+            'jvm_threads': None,
+            'jvm_options': [],
+            'apktool_jobs': os.cpu_count(),
+            'tool_temp_dir': None,
+            'tool_timeout_seconds': 3600,
+            'tool_memory_limit_mb': None,
+            'tool_output_image': True,
         }
         with open(os.path.join(current_dir, 'tools_config.json'), 'w') as config_file:
             json.dump(config, config_file)
@@ -52,7 +62,8 @@ setup(
     packages=find_packages(),
     install_requires=[
         'rich',
-        'androguard'
+        'androguard',
+        'cryptography'
     ],
     cmdclass={
         'install': CustomInstallCommand,
@@ -1,16 +1,12 @@
-from androguard.core.bytecodes.apk import APK
 from rich.console import Console
 from rich.table import Table
 
-def get_apk_activities(apk_path):
+def get_apk_activities(metadata):
     # Initialize Rich Console
     console = Console()
 
-    # Load the APK
-    apk = APK(apk_path)
-
-    # Retrieve activities
-    activities = apk.get_activities()
+    # Retrieve activities from the already parsed APK metadata
+    activities = metadata["activities"]
 
     # Create a Rich table for activities
     table = Table(title="[green]APK Activities[/green]", show_header=True, header_style="bold magenta")
@@ -1,16 +1,12 @@
-from androguard.core.bytecodes.apk import APK
 from rich.console import Console
 from rich.table import Table
 
-def get_apk_info(apk_path):
+def get_apk_info(metadata):
     # Initialize Rich Console
     console = Console()
 
-    # Load the APK
-    apk = APK(apk_path)
-
     # Check if the APK is signed and retrieve signature information
-    signatures = apk.get_signature_names()
+    signatures = metadata["signatures"]
     is_signed = "True" if signatures else "False"
 
     # Placeholder for signature versions
@@ -21,8 +17,8 @@ def get_apk_info(apk_path):
     # Create a Rich table for APK info
     table = Table(title="[green]APK Standard Information[/green]", show_header=False)
     # Add rows to the table for each APK detail
-    table.add_row("[green]Package Name:[/green]", apk.get_package())
-    table.add_row("[green]App Name:[/green]", apk.get_app_name())
+    table.add_row("[green]Package Name:[/green]", metadata["package"])
+    table.add_row("[green]App Name:[/green]", metadata["app_name"])
     table.add_row("[green]Is App Signed:[/green]", is_signed)
 
     # Nested table for signature versions
@@ -0,0 +1,71 @@
+import json
+import os
+from androguard.core.bytecodes.apk import APK
+
+from source.utils.hashing import file_sha256
+
+# Metadata already built during this run, keyed by the APK's SHA-256
+_metadata_cache = {}
+
+def build_apk_metadata(apk_path, sha256=None):
+    """
+    Parse the APK once with androguard and collect everything the reporters need.
+
+    :param apk_path: Path to the APK file
+    :param sha256: Digest of the APK if the caller already computed it
+    :return: Plain dict so it can be printed, cached and dumped as JSON
+    """
+    apk = APK(apk_path)
+
+    return {
+        "apk_path": os.path.abspath(apk_path),
+        "sha256": sha256 or file_sha256(apk_path),
+        "package": apk.get_package(),
+        "app_name": apk.get_app_name(),
+        "version_name": apk.get_androidversion_name(),
+        "version_code": apk.get_androidversion_code(),
+        "signatures": list(apk.get_signature_names()),
+        "activities": list(apk.get_activities()),
+        "permissions": list(apk.get_permissions()),
+        "services": list(apk.get_services()),
+        "receivers": list(apk.get_receivers()),
+        "providers": list(apk.get_providers()),
+    }
+
+def load_apk_metadata(apk_path, cache_dir=None):
+    """
+    Return the metadata for an APK, parsing it only the first time it is seen.
+
+    :param apk_path: Path to the APK file
+    :param cache_dir: Optional directory holding <sha256>.json files from earlier runs
+    """
+    sha256 = file_sha256(apk_path)
+    if sha256 in _metadata_cache:
+        return _metadata_cache[sha256]
+
+    cache_path = os.path.join(cache_dir, f"{sha256}.json") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            metadata = json.load(cache_file)
+        metadata["apk_path"] = os.path.abspath(apk_path)
+    else:
+        metadata = build_apk_metadata(apk_path, sha256)
+        if cache_path:
+            save_apk_metadata_json(metadata, cache_path)
+
+    _metadata_cache[sha256] = metadata
+    return metadata
+
+def save_apk_metadata_json(metadata, json_path):
+    """
+    Write the metadata dict to a JSON file.
+
+    :param metadata: Dict returned by load_apk_metadata
+    :param json_path: Output path of the JSON file
+    """
+    json_dir = os.path.dirname(json_path)
+    if json_dir and not os.path.exists(json_dir):
+        os.makedirs(json_dir)
+
+    with open(json_path, "w", encoding="utf-8") as json_file:
+        json.dump(metadata, json_file, indent=4)
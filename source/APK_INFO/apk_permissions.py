@@ -1,16 +1,12 @@
-from androguard.core.bytecodes.apk import APK
 from rich.console import Console
 from rich.table import Table
 
-def get_apk_permissions(apk_path):
+def get_apk_permissions(metadata):
     # Initialize Rich Console
     console = Console()
 
-    # Load the APK
-    apk = APK(apk_path)
-
-    # Retrieve permissions
-    permissions = apk.get_permissions()
+    # Retrieve permissions from the already parsed APK metadata
+    permissions = metadata["permissions"]
 
     # Create a Rich table for permissions
     table = Table(title="[green]APK Permissions[/green]", show_header=True, header_style="bold magenta")
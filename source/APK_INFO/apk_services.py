@@ -1,16 +1,12 @@
-from androguard.core.bytecodes.apk import APK
 from rich.console import Console
 from rich.table import Table
 
-def get_apk_services(apk_path):
+def get_apk_services(metadata):
     # Initialize Rich Console
     console = Console()
 
-    # Load the APK
-    apk = APK(apk_path)
-
-    # Retrieve services
-    services = apk.get_services()
+    # Retrieve services from the already parsed APK metadata
+    services = metadata["services"]
 
     # Create a Rich table for services
     table = Table(title="[green]APK Services[/green]", show_header=True, header_style="bold magenta")
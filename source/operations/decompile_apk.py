@@ -1,6 +1,18 @@
 import os
-import subprocess
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
+from rich.console import Console
+
+from source.operations import decompile_cache
+from source.ui.status import status_lines
+from source.utils.hashing import file_sha256
+from source.utils.tool_runner import ToolError, apktool_command, apktool_path, run_tool, tool_options
+
+# Initialize console for rich output
+console = Console()
+
+# Pixels between two lines of apktool output in the output image
+OUTPUT_LINE_HEIGHT = 25
 
 def get_default_font():
     """Return a default font path based on the OS."""
@@ -9,25 +21,31 @@ def get_default_font():
     else:
         return "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf"  # Common on Linux
 
+@lru_cache(maxsize=None)
+def load_fonts(font_path):
+    """Load the text, title and footer fonts once per font path."""
+    try:
+        return (ImageFont.truetype(font_path, 20), ImageFont.truetype(font_path, 30),
+                ImageFont.truetype(font_path, 18))
+    except IOError:
+        font = ImageFont.load_default()
+        return font, font, font
+
 def save_output_as_image(output, image_path, font_path=None):
     # If no font path is provided, use the default
     if font_path is None or not os.path.exists(font_path):
         font_path = get_default_font()
-    
-    try:
-        font = ImageFont.truetype(font_path, 20)
-    except IOError:
-        font = ImageFont.load_default()
+    font, title_font, footer_font = load_fonts(font_path)
 
     # Create an image with a creative background (light gradient)
     width, height = 1000, 1000
-    image = Image.new('RGB', (width, height), 'white')
-    draw = ImageDraw.Draw(image)
 
-    # Create a background gradient (light blue to white)
-    for y in range(height):
-        r, g, b = 255, 255 - int(255 * (y / height)), 255
-        draw.line([(0, y), (width, y)], fill=(r, g, b))
+    # Create a background gradient (light blue to white): one column of the green channel,
+    # stretched to the full width instead of drawing a line per row
+    column = Image.frombytes('L', (1, height), bytes(255 - int(255 * (y / height)) for y in range(height)))
+    white = Image.new('L', (width, height), 255)
+    image = Image.merge('RGB', (white, column.resize((width, height), Image.NEAREST), white))
+    draw = ImageDraw.Draw(image)
 
     # Draw a border around the image for style
     border_color = (0, 0, 128)  # Navy blue
@@ -35,47 +53,77 @@ def save_output_as_image(output, image_path, font_path=None):
     draw.rectangle([0, 0, width, height], outline=border_color, width=border_thickness)
 
     # Add a title to the image
-    title_font = ImageFont.truetype(font_path, 30)
     draw.text((width // 2 - 150, 10), "APK Decompile Output", fill="navy", font=title_font)
 
-    # Split the output into multiple lines for better readability
-    lines = output.split('\n')
+    # Split the output into multiple lines for better readability; only the lines above the footer are drawn
+    lines = output.split('\n')[:(height - 150) // OUTPUT_LINE_HEIGHT]
     y_text = 100
     for line in lines:
         draw.text((20, y_text), line, fill='black', font=font)
-        y_text += 25  # Adjust line height as needed
-    
+        y_text += OUTPUT_LINE_HEIGHT
+
     # Add a footer (optional)
-    footer_font = ImageFont.truetype(font_path, 18)
     draw.text((width // 2 - 100, height - 50), "Generated by APKTool", fill="gray", font=footer_font)
 
     # Save the final image
     image.save(image_path)
 
-def run_command(command):
-    try:
-        # Capture both stdout and stderr
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        return result.stdout + result.stderr  # Concatenate and return the output
-    except subprocess.CalledProcessError as e:
-        return f"Error executing command: {e}"
-
-def decompile_apk(apk_path,output_dir,decompile_img_path):
-
-    # For Windows, use 'apktool.bat' and specify full path if necessary
-    apktool_bat_path = os.path.join(os.getcwd(), "tools", "apktool", "apktool.bat")
-    
-    if os.name == 'nt':
-        if os.path.exists(apktool_bat_path):
-            command = f'"{apktool_bat_path}" d "{apk_path}"'
-        else:
-            return
-    else:
-        apk_tool_for_linux = os.path.join(os.getcwd(), "tools", "apktool","apktool.jar")
-        command = f"java -jar {apk_tool_for_linux} d {apk_path} -o {output_dir}"  # For Linux/Unix systems
+def decompile_apk(apk_path, output_dir, decompile_img_path, cache_dir=None,
+                  cache_max_mb=decompile_cache.DEFAULT_CACHE_MAX_MB, decode_options=None, options=None, log_path=None):
+    """
+    Decode an APK with apktool, reusing a cached decoded tree when the same
+    APK was already decoded with the same apktool build and options.
+
+    :param apk_path: Path of the APK to decode
+    :param output_dir: Working directory the decoded tree is placed in
+    :param decompile_img_path: Path of the image showing the apktool output, or None to skip it
+    :param cache_dir: Root of the decode cache, or None to always run apktool
+    :param cache_max_mb: Size cap of the decode cache in megabytes
+    :param decode_options: Extra apktool decode options, part of the cache key
+    :param options: tool_options() with the JVM and apktool settings, defaults when None
+    :param log_path: File receiving the whole apktool output, or None
+    :return: True when the tree came from the cache; raises ToolError when apktool fails
+    """
+    decode_options = decode_options or []
+    options = options or tool_options()
+
+    # For Windows, apktool.bat must be installed
+    tool_path = apktool_path()
+    if os.name == 'nt' and not os.path.exists(tool_path):
+        return False
+
+    key = None
+    if cache_dir:
+        # apktool -j and the JVM settings do not change the decoded tree, they are not part of the key
+        key = decompile_cache.decode_cache_key(file_sha256(apk_path), tool_path, decode_options)
+        entry_dir = decompile_cache.lookup(cache_dir, key)
+        if entry_dir:
+            # Cache hit: hand out a hardlinked working copy instead of running apktool
+            decompile_cache.materialize(entry_dir, output_dir)
+            if decompile_img_path:
+                save_output_as_image(decompile_cache.cached_output(cache_dir, key), f'{decompile_img_path}')
+            return True
+
+    # Decode into the cache staging area first so the result can be stored
+    target_dir = decompile_cache.staging_dir(cache_dir, key) if key else output_dir
+    command, env = apktool_command(options, "d", [apk_path, "-o", target_dir] + decode_options)
+
+    # Run the command, its output streamed to the log and shown as it comes
+    with status_lines(console, "[bold green]Decompiling APK, please wait...[/bold green]") as progress:
+        result = run_tool(command, log_path, options["tool_timeout_seconds"], options["tool_memory_limit_mb"], env,
+                          progress)
+    if result.returncode:
+        # A failed or partial tree is never cached nor handed out
+        if key:
+            decompile_cache.discard_staging(target_dir)
+        where = f", see {log_path}" if log_path else ""
+        raise ToolError(f"apktool exited with code {result.returncode}{where}")
 
-    # Run the command
-    output = run_command(command)
+    if key and os.path.isdir(target_dir):
+        entry_dir = decompile_cache.store(cache_dir, key, target_dir, result.output, cache_max_mb)
+        decompile_cache.materialize(entry_dir, output_dir)
 
     # Save the output as a creative image
-    save_output_as_image(output, f'{decompile_img_path}')
+    if decompile_img_path:
+        save_output_as_image(result.output, f'{decompile_img_path}')
+    return False
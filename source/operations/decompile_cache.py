@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from source.utils.hashing import file_sha256
+
+# Default size cap of the decoded-tree cache, overridable in tools_config.json
+DEFAULT_CACHE_MAX_MB = 10 * 1024
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+
+# Threads of this process (batch workers) take turns on the index; the lock file covers other processes
+_index_thread_lock = threading.Lock()
+
+# Tool digests are reused for the lifetime of the process
+_tool_digests = {}
+
+def tool_digest(tool_path):
+    """Return a digest identifying the apktool build, recomputed only when the jar changes."""
+    if not os.path.exists(tool_path):
+        return "missing"
+
+    stat = os.stat(tool_path)
+    marker = (tool_path, stat.st_size, stat.st_mtime_ns)
+    if marker not in _tool_digests:
+        _tool_digests[marker] = file_sha256(tool_path)
+    return _tool_digests[marker]
+
+def decode_cache_key(apk_sha256, tool_path, options):
+    """
+    Build the cache key of a decoded tree.
+
+    :param apk_sha256: SHA-256 of the APK being decoded
+    :param tool_path: Path of the apktool jar/bat used for decoding
+    :param options: List of extra apktool decode options
+    """
+    material = "\n".join([apk_sha256, tool_digest(tool_path), " ".join(sorted(options))])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def _load_index(cache_dir):
+    index_path = os.path.join(cache_dir, INDEX_FILE)
+    try:
+        with open(index_path, "r", encoding="utf-8") as index_file:
+            return json.load(index_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_index(cache_dir, index):
+    # Write to a temp file of our own first so a crash or another writer never leaves a half written index
+    fd, temp_path = tempfile.mkstemp(prefix=f"{INDEX_FILE}.", suffix=".tmp", dir=cache_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file, indent=4)
+    os.replace(temp_path, os.path.join(cache_dir, INDEX_FILE))
+
+@contextmanager
+def _locked_index(cache_dir):
+    """Hold the cache lock around a read-modify-write of the index, across threads and processes."""
+    os.makedirs(cache_dir, exist_ok=True)
+    with _index_thread_lock, open(os.path.join(cache_dir, LOCK_FILE), "a+") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _tree_size(directory):
+    total = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            total += os.lstat(os.path.join(dirpath, filename)).st_size
+    return total
+
+def _log_path(cache_dir, key):
+    # The log sits next to the entry so the decoded tree is copied untouched
+    return os.path.join(cache_dir, f"{key}.log")
+
+def lookup(cache_dir, key):
+    """
+    Return the cached decoded tree for a key, or None on a miss.
+    A hit refreshes the entry's position in the LRU order.
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isdir(cache_dir):
+        return None
+    with _locked_index(cache_dir):
+        index = _load_index(cache_dir)
+        if key not in index or not os.path.isdir(entry_dir):
+            return None
+
+        index[key]["last_used"] = time.time()
+        _save_index(cache_dir, index)
+    return entry_dir
+
+def staging_dir(cache_dir, key):
+    """
+    Return a path apktool can decode into before the tree is stored. Every call gets its own
+    parent directory, so runs decoding the same APK side by side never share one.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    # apktool refuses to decode into an existing directory, so the tree goes one level down
+    return os.path.join(tempfile.mkdtemp(prefix=f"{key}.", suffix=".partial", dir=cache_dir), "tree")
+
+def discard_staging(decoded_dir):
+    """Remove a staging directory whose decode failed, so nothing of it is ever cached."""
+    shutil.rmtree(os.path.dirname(decoded_dir), ignore_errors=True)
+
+def store(cache_dir, key, decoded_dir, output, max_mb=DEFAULT_CACHE_MAX_MB):
+    """
+    Move a freshly decoded tree into the cache and evict old entries.
+
+    :param cache_dir: Root directory of the decode cache
+    :param key: Cache key from decode_cache_key
+    :param decoded_dir: Directory apktool decoded into, from staging_dir; removed afterwards
+    :param output: Console output of apktool, kept to redraw the decompile image on hits
+    :param max_mb: Size cap of the whole cache in megabytes
+    :return: Path of the cache entry
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    with _locked_index(cache_dir):
+        index = _load_index(cache_dir)
+        if key in index and os.path.isdir(entry_dir):
+            # Another run stored the same tree meanwhile; keep that one
+            index[key]["last_used"] = time.time()
+        else:
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.replace(decoded_dir, entry_dir)
+            with open(_log_path(cache_dir, key), "w", encoding="utf-8") as log_file:
+                log_file.write(output)
+            index[key] = {"size": _tree_size(entry_dir), "last_used": time.time()}
+            evict(cache_dir, index, max_mb * 1024 * 1024, keep=key)
+        _save_index(cache_dir, index)
+    discard_staging(decoded_dir)
+    return entry_dir
+
+def evict(cache_dir, index, max_bytes, keep=None):
+    """Drop least recently used entries from the index and disk until it fits under max_bytes."""
+    total = sum(entry["size"] for entry in index.values())
+    for key in sorted(index, key=lambda k: index[k]["last_used"]):
+        if total <= max_bytes:
+            break
+        if key == keep:
+            continue
+        total -= index[key]["size"]
+        del index[key]
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        if os.path.exists(_log_path(cache_dir, key)):
+            os.remove(_log_path(cache_dir, key))
+
+def cached_output(cache_dir, key):
+    """Return the apktool output recorded when the entry was decoded."""
+    log_path = _log_path(cache_dir, key)
+    if not os.path.exists(log_path):
+        return ""
+    with open(log_path, "r", encoding="utf-8", errors="replace") as log_file:
+        return log_file.read()
+
+def _link_or_copy(src, dst):
+    # Hardlinks are instant and take no space; fall back to a copy across filesystems
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def materialize(entry_dir, output_dir):
+    """
+    Give the caller a working copy of a cached tree made of hardlinks.
+    Files are only ever replaced, never edited in place, so the cache stays intact.
+    """
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    shutil.copytree(entry_dir, output_dir, copy_function=_link_or_copy)
@@ -0,0 +1,95 @@
+import html
+import json
+import os
+from itertools import groupby
+
+from source.operations.findings import iter_findings
+from source.operations.screenshot import ScreenshotPool
+
+class EvidenceBundle:
+    """
+    Turns the streamed findings (see FindingsSink) into one JSON file plus a browsable
+    HTML page, instead of rendering a PNG per hit. Both are written finding by finding,
+    so the findings never have to sit in memory together.
+    Images can be rendered later from the JSON with render_evidence().
+    """
+
+    def __init__(self, bundle_path, apk_name, screenshot_dir):
+        """
+        :param bundle_path: Path of the JSON bundle; the HTML page is written next to it
+        :param apk_name: Name of the analyzed APK, shown in the page title
+        :param screenshot_dir: Default directory for images rendered later
+        """
+        self.bundle_path = bundle_path
+        self.html_path = os.path.splitext(bundle_path)[0] + ".html"
+        self.apk_name = apk_name
+        self.screenshot_dir = screenshot_dir
+
+    def write(self, findings_path, count):
+        """
+        :param findings_path: NDJSON file written by FindingsSink
+        :param count: Number of findings in it, shown at the top of the page
+        """
+        bundle_dir = os.path.dirname(self.bundle_path)
+        if bundle_dir and not os.path.exists(bundle_dir):
+            os.makedirs(bundle_dir)
+
+        with open(self.bundle_path, "w", encoding="utf-8") as bundle_file, \
+                open(self.html_path, "w", encoding="utf-8") as html_file:
+            header = json.dumps({"apk": self.apk_name, "screenshot_dir": self.screenshot_dir}, indent=4)
+            bundle_file.write(header[:-2] + ',\n    "findings": [')
+            html_file.write(html_header(self.apk_name, count))
+            for index, finding in enumerate(iter_findings(findings_path)):
+                bundle_file.write(("," if index else "") + "\n        " + json.dumps(finding))
+                html_file.write(html_finding(finding))
+            bundle_file.write("\n    ]\n}\n")
+            html_file.write(HTML_FOOTER)
+
+HTML_FOOTER = "</body></html>\n"
+
+def html_header(apk_name, count):
+    title = html.escape(f"APK evidence: {apk_name}")
+    return "\n".join([
+        "<!DOCTYPE html>",
+        f"<html><head><meta charset=\"utf-8\"><title>{title}</title>",
+        "<style>body{font-family:sans-serif}pre{background:#f4f4f4;padding:8px;overflow-x:auto}"
+        ".finding{border-bottom:1px solid #ccc;margin-bottom:16px}</style></head><body>",
+        f"<h1>{title}</h1>",
+        f"<p>{count} finding(s)</p>",
+    ]) + "\n"
+
+def html_finding(finding):
+    status = f" [{finding['status']}]" if finding.get("status") else ""
+    return (
+        f"<div class=\"finding\" id=\"finding-{finding['id']}\">"
+        f"<h3>#{finding['id']} {html.escape(finding['word'])}{status}</h3>"
+        f"<p>{html.escape(finding['file'])} at line {finding['line']}</p>"
+        f"<pre>{html.escape(finding['context'] or '')}</pre></div>\n"
+    )
+
+def load_evidence(bundle_path):
+    with open(bundle_path, "r", encoding="utf-8") as bundle_file:
+        return json.load(bundle_file)
+
+def render_evidence(bundle_path, finding_ids=None, screenshot_dir=None, workers=None):
+    """
+    Render the evidence images of the findings of a bundle, one per file with every hit line
+    highlighted; identical snippets are rendered once.
+
+    :param bundle_path: JSON bundle written by EvidenceBundle
+    :param finding_ids: Ids of the findings to render, or None for all of them
+    :param screenshot_dir: Output directory, defaults to the one recorded in the bundle
+    :param workers: Number of rendering processes
+    :return: Number of images rendered
+    """
+    bundle = load_evidence(bundle_path)
+    screenshot_dir = screenshot_dir or bundle["screenshot_dir"]
+    wanted = set(finding_ids) if finding_ids else None
+
+    with ScreenshotPool(workers) as screenshots:
+        findings = (finding for finding in bundle["findings"]
+                    if finding.get("status") != "fixed" and (wanted is None or finding["id"] in wanted))
+        # Findings of a file follow each other in the bundle, as the scanner produced them
+        for _, file_findings in groupby(findings, key=lambda finding: finding["file"]):
+            screenshots.submit_file(screenshot_dir, [(finding["line"], finding["context"]) for finding in file_findings])
+    return screenshots.rendered
@@ -0,0 +1,77 @@
+import json
+import os
+from collections import Counter
+
+class FindingsSink:
+    """
+    Streams findings to an NDJSON file (one JSON object per line) as they are produced.
+    Only aggregated counts per rule and per file stay in memory, however many hits there are.
+    """
+
+    def __init__(self, ndjson_path):
+        ndjson_dir = os.path.dirname(ndjson_path)
+        if ndjson_dir and not os.path.exists(ndjson_dir):
+            os.makedirs(ndjson_dir)
+        self.ndjson_path = ndjson_path
+        self.total = 0
+        self.written = 0
+        self.by_rule = Counter()
+        self.by_file = Counter()
+        self.by_status = Counter()
+        self.file = open(ndjson_path, "w", encoding="utf-8")
+
+    def add(self, search_word, filepath, line_number, context=None, status=None, image=None):
+        """
+        Write one finding and return its id (1-based, in output order).
+
+        :param status: "new", "unchanged" or "fixed" when compared with the package's last scan
+                       (see ScanIndex); fixed findings are written but not counted in total
+        :param image: File name of the evidence image showing the hit, in the screenshot directory
+        """
+        self.written += 1
+        finding = {
+            "id": self.written,
+            "word": search_word,
+            "file": filepath,
+            "line": line_number,
+            "context": context,
+        }
+        if image:
+            finding["image"] = image
+        if status:
+            finding["status"] = status
+            self.by_status[status] += 1
+        if status != "fixed":
+            self.total += 1
+            self.by_rule[search_word] += 1
+            self.by_file[filepath] += 1
+        self.file.write(json.dumps(finding) + "\n")
+        return self.written
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def summary(self, top_files=20):
+        """Counts per rule and for the top_files files with the most hits."""
+        return {
+            "total": self.total,
+            "by_rule": dict(self.by_rule.most_common()),
+            "by_file": dict(self.by_file.most_common(top_files)),
+            "files_with_findings": len(self.by_file),
+            "by_status": dict(self.by_status),
+            "ndjson": self.ndjson_path,
+        }
+
+def iter_findings(ndjson_path):
+    """Yield the findings of an NDJSON file one at a time."""
+    with open(ndjson_path, "r", encoding="utf-8") as ndjson_file:
+        for line in ndjson_file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,125 @@
+import os
+import re
+import tempfile
+
+from source.operations.manifest_patch import MANIFEST_NAME, boolean_flips, is_signature_file, patch_manifest_xml, read_manifest
+from source.operations.recompile_apk import recompile_apk
+from source.operations.zip_raw import read_central_directory, read_entry, rewrite_zip
+
+# Decoded files that map 1:1 to an APK entry and can be packed without apktool
+RAW_PREFIXES = ("assets/", "lib/", "kotlin/")
+UNKNOWN_PREFIX = "unknown/"
+
+SMALI_DIR = re.compile(r"^smali(?:_(classes\d+))?/")
+
+def snapshot_tree(root_directory):
+    """
+    Record (size, mtime) of every decoded file, right after decoding, so the
+    rebuild can tell which files were modified afterwards.
+    """
+    snapshot = {}
+    for dirpath, _, filenames in os.walk(root_directory):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            stat = os.stat(filepath)
+            relpath = os.path.relpath(filepath, root_directory).replace(os.sep, "/")
+            snapshot[relpath] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+def changed_files(root_directory, snapshot):
+    """Return the decoded paths added, removed or modified since the snapshot."""
+    current = snapshot_tree(root_directory)
+    return {path for path in set(snapshot) | set(current) if snapshot.get(path) != current.get(path)}
+
+def _entry_name(relpath):
+    # apktool keeps files it does not understand under unknown/, they sit at the APK root
+    if relpath.startswith(UNKNOWN_PREFIX):
+        return relpath[len(UNKNOWN_PREFIX):]
+    return relpath
+
+def _raw_replacements(root_directory, paths):
+    # Content of modified raw files, and the entries of raw files that were deleted
+    replacements, removed = {}, set()
+    for relpath in paths:
+        filepath = os.path.join(root_directory, relpath)
+        if os.path.exists(filepath):
+            with open(filepath, "rb") as file:
+                replacements[_entry_name(relpath)] = file.read()
+        else:
+            removed.add(_entry_name(relpath))
+    return replacements, removed
+
+def _rebuilt_entries(rebuilt_apk, wanted):
+    # Uncompressed content of the entries of the apktool build that wanted() accepts
+    entries = {}
+    with open(rebuilt_apk, "rb") as apk_file:
+        for entry in read_central_directory(apk_file):
+            if wanted(entry.name):
+                entries[entry.name] = read_entry(apk_file, entry)
+    return entries
+
+def incremental_recompile(decoded_dir, original_apk, output_apk, snapshot, patched_files=(), options=None,
+                          log_path=None):
+    """
+    Rebuild an APK from the original one, rebuilding only what the modified decoded files affect.
+
+    - nothing modified: the original entries are copied as they are
+    - only the manifest, and only by the replacement_dict patcher: its flags are flipped in the binary manifest
+    - raw files (assets/, lib/, unknown/): their new content is packed directly
+    - anything else (res/, smali, apktool.yml, manual manifest edits): apktool b runs once, and only the
+      manifest, resources.arsc, res/ and the dex files of modified smali directories are taken from its output
+
+    Every other entry, including unchanged classes*.dex, lib/ and assets/, is copied byte for byte
+    from the original APK. Old signature files are dropped.
+
+    :param snapshot: snapshot_tree() taken right after decoding
+    :param patched_files: Files rewritten by the replacement_dict patcher
+    :param options: tool_options() for the apktool build, when one is needed
+    :param log_path: File receiving the apktool build output
+    :return: Short description of the rebuild that was done
+    """
+    changed = changed_files(decoded_dir, snapshot)
+    patched = {os.path.relpath(path, decoded_dir).replace(os.sep, "/") for path in patched_files}
+
+    raw = {path for path in changed if path.startswith(RAW_PREFIXES + (UNKNOWN_PREFIX,))}
+    manifest_by_patcher = MANIFEST_NAME in changed and MANIFEST_NAME in patched and boolean_flips() is not None
+    needs_apktool = changed - raw - ({MANIFEST_NAME} if manifest_by_patcher else set())
+
+    replacements, removed = _raw_replacements(decoded_dir, raw)
+    drop = lambda name: is_signature_file(name) or name in removed
+
+    if not needs_apktool:
+        if manifest_by_patcher:
+            replacements[MANIFEST_NAME], _ = patch_manifest_xml(read_manifest(original_apk), boolean_flips())
+        rewrite_zip(original_apk, output_apk, replacements, drop)
+        if not changed:
+            return "no changes, original entries copied"
+        return f"{len(changed)} file(s) repacked without apktool"
+
+    # Full apktool build once, then keep only the artifacts the modified files affect
+    rebuilt_dex = set()
+    for path in needs_apktool:
+        match = SMALI_DIR.match(path)
+        if match:
+            rebuilt_dex.add(f"{match.group(1) or 'classes'}.dex")
+
+    fd, rebuilt_apk = tempfile.mkstemp(suffix=".apk", dir=os.path.dirname(os.path.abspath(output_apk)))
+    os.close(fd)
+    try:
+        recompile_apk(decoded_dir, rebuilt_apk, options, log_path)
+        if os.path.getsize(rebuilt_apk) == 0:
+            raise RuntimeError("apktool did not produce an APK")
+        wanted = lambda name: (name in (MANIFEST_NAME, "resources.arsc") or name.startswith("res/")
+                               or name in rebuilt_dex)
+        rebuilt = _rebuilt_entries(rebuilt_apk, wanted)
+    finally:
+        os.remove(rebuilt_apk)
+
+    if MANIFEST_NAME not in rebuilt:
+        raise RuntimeError("apktool output has no AndroidManifest.xml")
+
+    # Resource paths may differ from the original (obfuscated names), so res/ is replaced as a whole
+    replacements.update(rebuilt)
+    drop = lambda name: is_signature_file(name) or name in removed or name.startswith("res/")
+    rewrite_zip(original_apk, output_apk, replacements, drop)
+    return f"{len(changed)} file(s) changed, rebuilt {', '.join(sorted(rebuilt_dex | {MANIFEST_NAME, 'resources'}))}"
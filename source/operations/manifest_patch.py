@@ -0,0 +1,165 @@
+import re
+import struct
+
+from androguard.core.bytecodes.axml import AXMLPrinter
+
+from source.operations.modify_code import replacement_dict
+from source.operations.zip_raw import read_central_directory, read_entry, rewrite_zip
+
+MANIFEST_NAME = "AndroidManifest.xml"
+ANDROID_NAMESPACE = "http://schemas.android.com/apk/res/android"
+
+# Binary XML chunk types and the boolean value type (ResourceTypes.h)
+RES_XML_TYPE = 0x0003
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+RES_XML_START_ELEMENT_TYPE = 0x0102
+TYPE_INT_BOOLEAN = 0x12
+UTF8_FLAG = 0x100
+NO_INDEX = 0xFFFFFFFF
+
+# Framework resource ids of the manifest attributes replacement_dict flips
+ATTRIBUTE_IDS = {
+    "debuggable": 0x0101000f,
+    "allowBackup": 0x01010280,
+    "usesCleartextTraffic": 0x010104ec,
+    "exported": 0x01010010,
+}
+
+BOOLEAN_REPLACEMENT = re.compile(r'^android:(\w+)="(true|false)"$')
+
+def boolean_flips():
+    """
+    Translate replacement_dict into {attribute name: new boolean value}.
+    Returns None when a replacement is not a boolean manifest attribute flip,
+    in which case the binary fast path cannot apply it.
+    """
+    flips = {}
+    for search_word, replacement_word in replacement_dict.items():
+        before, after = BOOLEAN_REPLACEMENT.match(search_word), BOOLEAN_REPLACEMENT.match(replacement_word)
+        if not before or not after or before.group(1) != after.group(1) or before.group(1) not in ATTRIBUTE_IDS:
+            return None
+        flips[before.group(1)] = after.group(2) == "true"
+    return flips
+
+def _read_string(data, pool_offset, header_size, index):
+    # One string of a string pool chunk, UTF-8 or UTF-16 encoded
+    # Chunk header, then string count, style count, flags and the offset of the string data
+    _, _, _, _, _, flags, strings_start = struct.unpack_from("<HHIIIII", data, pool_offset)
+    offset = struct.unpack_from("<I", data, pool_offset + header_size + index * 4)[0]
+    position = pool_offset + strings_start + offset
+
+    if flags & UTF8_FLAG:
+        position += 2 if data[position] & 0x80 else 1  # Length in characters
+        length = data[position]
+        if length & 0x80:
+            length = ((length & 0x7F) << 8) | data[position + 1]
+            position += 1
+        position += 1
+        return data[position:position + length].decode("utf-8", errors="replace")
+
+    length = struct.unpack_from("<H", data, position)[0]
+    position += 2
+    if length & 0x8000:
+        length = ((length & 0x7FFF) << 16) | struct.unpack_from("<H", data, position)[0]
+        position += 2
+    return data[position:position + length * 2].decode("utf-16-le", errors="replace")
+
+def patch_manifest_xml(data, flips):
+    """
+    Flip boolean attributes of a binary AndroidManifest.xml (AXML) in place.
+    Only the 4-byte value of each attribute changes, so the chunk layout stays intact.
+
+    :param data: Binary manifest bytes
+    :param flips: {attribute name: new boolean value}, see boolean_flips()
+    :return: (patched bytes, {attribute name: number of values changed})
+    """
+    patched = bytearray(data)
+    chunk_type, header_size, file_size = struct.unpack_from("<HHI", patched, 0)
+    if chunk_type != RES_XML_TYPE:
+        raise ValueError("Not a binary XML document")
+
+    wanted_ids = {ATTRIBUTE_IDS[name]: name for name in flips}
+    resource_ids = []
+    pool = None
+    counts = {}
+
+    position = header_size
+    end = min(file_size, len(patched))
+    while position + 8 <= end:
+        chunk_type, chunk_header_size, chunk_size = struct.unpack_from("<HHI", patched, position)
+        if chunk_size < 8:
+            raise ValueError("Corrupt binary XML chunk")
+
+        if chunk_type == RES_STRING_POOL_TYPE:
+            pool = (position, chunk_header_size)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            count = (chunk_size - chunk_header_size) // 4
+            resource_ids = list(struct.unpack_from(f"<{count}I", patched, position + chunk_header_size))
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            attribute_start, attribute_size, attribute_count = struct.unpack_from(
+                "<HHH", patched, position + chunk_header_size + 8)
+            first = position + chunk_header_size + attribute_start
+            for index in range(attribute_count):
+                attribute = first + index * attribute_size
+                namespace, name, _, _, _, value_type, value = struct.unpack_from("<IIIHBBI", patched, attribute)
+
+                # Match on the framework resource id, or on the name when the id map is stripped
+                attribute_name = None
+                if name < len(resource_ids) and resource_ids[name] in wanted_ids:
+                    attribute_name = wanted_ids[resource_ids[name]]
+                elif name >= len(resource_ids) and pool and namespace != NO_INDEX:
+                    candidate = _read_string(patched, pool[0], pool[1], name)
+                    if candidate in flips and _read_string(patched, pool[0], pool[1], namespace) == ANDROID_NAMESPACE:
+                        attribute_name = candidate
+                if attribute_name is None or value_type != TYPE_INT_BOOLEAN:
+                    continue
+
+                new_value = 0xFFFFFFFF if flips[attribute_name] else 0
+                if value != new_value:
+                    struct.pack_into("<I", patched, attribute + 16, new_value)
+                    counts[attribute_name] = counts.get(attribute_name, 0) + 1
+
+        position += chunk_size
+
+    return bytes(patched), counts
+
+def decode_manifest(data):
+    """Return the manifest as XML text using androguard's AXML printer."""
+    printer = AXMLPrinter(data)
+    return printer.get_xml().decode("utf-8", errors="replace")
+
+def is_signature_file(name):
+    """Old v1 signature files, invalid once any entry changes; the APK is signed again afterwards."""
+    if not name.startswith("META-INF/"):
+        return False
+    upper = name.upper()
+    return upper == "META-INF/MANIFEST.MF" or upper.endswith((".SF", ".RSA", ".DSA", ".EC")) or upper.startswith("META-INF/SIG-")
+
+def read_manifest(apk_path):
+    with open(apk_path, "rb") as apk_file:
+        for entry in read_central_directory(apk_file):
+            if entry.name == MANIFEST_NAME:
+                return read_entry(apk_file, entry)
+    raise ValueError(f"{MANIFEST_NAME} not found in {apk_path}")
+
+def patch_apk_manifest(apk_path, output_apk_path):
+    """
+    Harden an APK without apktool: flip the replacement_dict manifest flags directly
+    in the binary manifest and copy every other entry through untouched.
+    Old signature files are dropped; the output still has to be signed.
+
+    :return: (original manifest as XML text, {attribute name: number of values changed})
+    """
+    flips = boolean_flips()
+    if flips is None:
+        raise ValueError("replacement_dict contains replacements that are not manifest boolean flips")
+
+    original = read_manifest(apk_path)
+    patched, counts = patch_manifest_xml(original, flips)
+
+    if not AXMLPrinter(patched).is_valid():
+        raise ValueError("Patched manifest failed to parse")
+
+    rewrite_zip(apk_path, output_apk_path, {MANIFEST_NAME: patched}, drop=is_signature_file)
+    return decode_manifest(original), counts
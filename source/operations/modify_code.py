@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 
 replacement_dict = {
     'android:debuggable="true"': 'android:debuggable="false"',
@@ -6,21 +9,50 @@ replacement_dict = {
     'android:exported="true"': 'android:exported="false"'
 }
 
-def modify_code(filepath):
-    with open(filepath, "r+", encoding="utf-8", errors="ignore") as file:
-        lines = file.readlines()
-        modified_lines = []
+# Same replacements as raw bytes, used by the byte level scanner
+byte_replacements = [(key.encode("utf-8"), value.encode("utf-8")) for key, value in replacement_dict.items()]
+
+def replace_file(filepath, content):
+    """
+    Write the new content next to the file and rename it over the original.
+    Replacing instead of editing in place keeps hardlinked copies (decode cache) untouched.
+    """
+    directory = os.path.dirname(filepath) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".apkmech-")
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(content)
+        shutil.copymode(filepath, temp_path)
+        os.replace(temp_path, filepath)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def apply_replacements(content):
+    """Return the bytes with every replacement_dict key replaced by its value."""
+    for search_word, replacement_word in byte_replacements:
+        if search_word in content:
+            content = content.replace(search_word, replacement_word)
+    return content
 
-        for line in lines:
-            modified_line = line
-            for search_word, replacement_word in replacement_dict.items():
-                if search_word in line:
-                    modified_line = modified_line.replace(search_word, replacement_word)
+def patch_file(filepath, content=None):
+    """
+    Rewrite a file once with all replacements applied, only if a key is present.
 
-            modified_lines.append(modified_line)
+    :param filepath: File to patch
+    :param content: Current bytes of the file when the caller already read them
+    :return: Number of bytes written, 0 when the file was left alone
+    """
+    if content is None:
+        with open(filepath, "rb") as file:
+            content = file.read()
 
-        file.seek(0)
-        file.truncate()
+    modified = apply_replacements(content)
+    if modified == content:
+        return 0
 
-        for modified_line in modified_lines:
-            file.write(modified_line)
\ No newline at end of file
+    replace_file(filepath, modified)
+    return len(modified)
+
+def modify_code(filepath):
+    return patch_file(filepath)
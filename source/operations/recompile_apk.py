@@ -1,39 +1,38 @@
-import subprocess
 import os
 from rich.console import Console
 
+from source.ui.status import status_lines
+from source.utils.tool_runner import ToolError, apktool_command, apktool_path, run_tool, tool_options
+
 # Initialize console for rich output
 console = Console()
 
-def run_command(command):
-    try:
-        with open(os.devnull, 'w') as devnull:
-            subprocess.check_call(command, shell=True, stdout=devnull, stderr=devnull)
-    except subprocess.CalledProcessError as e:
-        console.print(f"[red]Error executing command: {e}[/red]")
-
-def recompile_apk(decompiled_apk_dir, recompile_apk_path):
+def recompile_apk(decompiled_apk_dir, recompile_apk_path, options=None, log_path=None):
     """
     Function to recompile APK using apktool.
     
     :param decompiled_apk_dir: Directory where APK has been decompiled
     :param recompile_apk_path: Output path where the recompiled APK will be saved
+    :param options: tool_options() with the JVM and apktool settings, defaults when None
+    :param log_path: File receiving the whole apktool output, or None
+    :raises ToolError: apktool failed, timed out or went over the memory limit
     """
-    apktool_bat_path = os.path.join(os.getcwd(), "tools", "apktool", "apktool.bat")
-    
-    if os.name == 'nt':
-        if os.path.exists(apktool_bat_path):
-            command = f"java -jar {apktool_bat_path} b {decompiled_apk_dir} -o {recompile_apk_path}"
-        else:
-            console.print("[red]apktool.bat not found[/red]")
-            return
-    else:
-        apk_tool_for_linux = os.path.join(os.getcwd(), "tools", "apktool", "apktool.jar")
-        command = f"java -jar {apk_tool_for_linux} b {decompiled_apk_dir} -o {recompile_apk_path}"
-    
+    options = options or tool_options()
+    if os.name == 'nt' and not os.path.exists(apktool_path()):
+        raise ToolError("apktool.bat not found")
+
+    # An APK left by an earlier run must never pass for the output of this build
+    if os.path.exists(recompile_apk_path):
+        os.remove(recompile_apk_path)
+
+    command, env = apktool_command(options, "b", [decompiled_apk_dir, "-o", recompile_apk_path])
+
     # Display progress message while recompiling the APK
-    with console.status("[bold green]Recompiling APK, please wait...[/bold green]", spinner="dots"):
-        run_command(command)
-    
-    console.print(f"[green]APK recompiled successfully: {recompile_apk_path}[/green]")
+    with status_lines(console, "[bold green]Recompiling APK, please wait...[/bold green]") as progress:
+        result = run_tool(command, log_path, options["tool_timeout_seconds"], options["tool_memory_limit_mb"], env,
+                          progress)
 
+    if result.returncode:
+        where = f", see {log_path}" if log_path else ""
+        raise ToolError(f"apktool exited with code {result.returncode}{where}")
+    console.print(f"[green]APK recompiled successfully: {recompile_apk_path}[/green]")
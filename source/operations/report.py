@@ -0,0 +1,241 @@
+import hashlib
+import html
+import os
+
+from PIL import Image
+
+from source.operations.findings import iter_findings
+
+try:
+    from fpdf import FPDF
+except ImportError:  # PDF output is optional, the HTML report needs nothing extra
+    FPDF = None
+
+# Bounds that keep the report small whatever the number of findings; the NDJSON file has them all
+MAX_DETAILED_FINDINGS = 300
+MAX_THUMBNAILS = 100
+MAX_PDF_PAGES = 60
+THUMBNAIL_WIDTH = 480
+THUMBNAIL_QUALITY = 60
+CONTEXT_LINE_CHARS = 110
+
+def apk_info(metadata):
+    """The part of the APK metadata shown in the report, kept in the run summary."""
+    return {
+        "package": metadata.get("package"),
+        "app_name": metadata.get("app_name"),
+        "version_name": metadata.get("version_name"),
+        "version_code": metadata.get("version_code"),
+        "sha256": metadata.get("sha256"),
+        "permissions": len(metadata.get("permissions", [])),
+        "activities": len(metadata.get("activities", [])),
+        "services": len(metadata.get("services", [])),
+    }
+
+def short_context(context):
+    """Context lines cut to CONTEXT_LINE_CHARS, minified code is often a single huge line."""
+    lines = (context or "").rstrip("\n").splitlines()
+    return "\n".join(line if len(line) <= CONTEXT_LINE_CHARS else line[:CONTEXT_LINE_CHARS] + "..." for line in lines)
+
+def latin1(text):
+    # The core PDF fonts only cover Latin-1
+    return str(text).encode("latin-1", "replace").decode("latin-1")
+
+class Thumbnails:
+    """
+    Downscaled JPEG copies of the screenshots, named after the digest of the screenshot, so an
+    image rendered for several hits is stored once and embedded once (fpdf reuses an image by path).
+    """
+
+    def __init__(self, thumbnail_dir, limit=MAX_THUMBNAILS):
+        self.thumbnail_dir = thumbnail_dir
+        self.limit = limit
+        self.made = {}
+
+    def get(self, screenshot_path):
+        """Return the thumbnail of a screenshot, or None when there is none or the limit is reached."""
+        if not os.path.exists(screenshot_path):
+            return None
+        with open(screenshot_path, "rb") as screenshot_file:
+            digest = hashlib.sha256(screenshot_file.read()).hexdigest()[:16]
+        if digest in self.made:
+            return self.made[digest]
+        if len(self.made) >= self.limit:
+            return None
+
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+        thumbnail_path = os.path.join(self.thumbnail_dir, f"{digest}.jpg")
+        if not os.path.exists(thumbnail_path):
+            with Image.open(screenshot_path) as image:
+                image = image.convert("RGB")
+                if image.width > THUMBNAIL_WIDTH:
+                    image = image.resize((THUMBNAIL_WIDTH, max(1, image.height * THUMBNAIL_WIDTH // image.width)))
+                image.save(thumbnail_path, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        self.made[digest] = thumbnail_path
+        return thumbnail_path
+
+class ReportBuilder:
+    """
+    Builds the report of one APK from structured data: the run summary (APK info, stage
+    timings, counts per rule, status and file) and the findings NDJSON, which is streamed so
+    thousands of findings never sit in memory. Only the first max_findings are detailed, with
+    the thumbnail of their screenshot when one was rendered; the others are in the counts.
+    """
+
+    def __init__(self, report_dir, apk_name, screenshot_dir=None, max_findings=MAX_DETAILED_FINDINGS,
+                 max_pages=MAX_PDF_PAGES):
+        """
+        :param report_dir: Directory of the APK's outputs, receiving report.html, report.pdf and thumbnails/
+        :param apk_name: Name shown in the title
+        :param screenshot_dir: Directory of the screenshots, in images evidence mode
+        :param max_findings: Findings detailed at most, in output order
+        :param max_pages: PDF pages at most; the findings that do not fit are left to the HTML report
+        """
+        self.report_dir = report_dir
+        self.apk_name = apk_name
+        self.screenshot_dir = screenshot_dir
+        self.max_findings = max_findings
+        self.max_pages = max_pages
+        self.html_path = os.path.join(report_dir, "report.html")
+        self.pdf_path = os.path.join(report_dir, "report.pdf")
+        self.thumbnails = Thumbnails(os.path.join(report_dir, "thumbnails"))
+
+    def detailed_findings(self, findings_path):
+        """Yield (finding, thumbnail or None) for the findings to detail, the thumbnail of a file after its first hit."""
+        if not findings_path or not os.path.exists(findings_path):
+            return
+        previous = None
+        for count, finding in enumerate(iter_findings(findings_path)):
+            if count >= self.max_findings:
+                return
+            thumbnail = None
+            # Only new findings have an image in this report; the hits of a file share one, shown once
+            if self.screenshot_dir and finding.get("image") and finding["image"] != previous:
+                thumbnail = self.thumbnails.get(os.path.join(self.screenshot_dir, finding["image"]))
+            previous = finding.get("image")
+            yield finding, thumbnail
+
+    def sections(self, summary):
+        """Yield (heading, rows) of the summary tables, shared by both formats."""
+        info = summary.get("apk_info") or {}
+        yield "APK", [("APK", summary["apk"])] + [(key.replace("_", " ").capitalize(), value)
+                                                 for key, value in info.items() if value not in (None, "")]
+
+        rows = [("Status", summary.get("status")), ("Findings", summary.get("findings", 0)),
+                ("Files patched", summary.get("files_patched", 0))]
+        rows += [(f"Findings {status}", count) for status, count in sorted(summary.get("findings_by_status", {}).items())]
+        if summary.get("scan_cache_hit_rate") is not None:
+            rows.append(("Scan cache hit rate", f"{summary['scan_cache_hit_rate']:.0%}"))
+        output_apk = summary.get("signed_apk") or summary.get("unsigned_apk")
+        if output_apk:
+            rows.append(("Output APK", output_apk))
+        if summary.get("error"):
+            rows.append(("Error", summary["error"]))
+        yield "Result", rows
+
+        if summary.get("stage_seconds"):
+            yield "Stage timings (s)", [(stage, f"{seconds:.2f}") for stage, seconds in summary["stage_seconds"].items()]
+        if summary.get("findings_by_rule"):
+            yield "Findings per rule", sorted(summary["findings_by_rule"].items(), key=lambda item: -item[1])
+        if summary.get("findings_by_file"):
+            yield f"Top {len(summary['findings_by_file'])} files", list(summary["findings_by_file"].items())
+
+    def remaining_note(self, summary, shown):
+        written = summary.get("findings", 0) + summary.get("findings_by_status", {}).get("fixed", 0)
+        if written <= shown:
+            return None
+        return f"{written - shown} more finding(s) are not detailed here, every one is in {summary.get('findings_ndjson')}"
+
+    def write_html(self, summary):
+        """Write report.html, finding by finding."""
+        title = html.escape(f"APK report: {self.apk_name}")
+        with open(self.html_path, "w", encoding="utf-8") as html_file:
+            html_file.write(
+                f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{title}</title><style>"
+                "body{font-family:sans-serif;max-width:1100px;margin:auto}table{border-collapse:collapse}"
+                "td{border:1px solid #ccc;padding:4px 8px}pre{background:#f4f4f4;padding:8px;overflow-x:auto}"
+                ".new{color:#c00}.unchanged{color:#a60}.fixed{color:#080}"
+                f"</style></head><body>\n<h1>{title}</h1>\n")
+            for heading, rows in self.sections(summary):
+                html_file.write(f"<h2>{html.escape(heading)}</h2>\n<table>\n")
+                for row in rows:
+                    html_file.write("<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>\n")
+                html_file.write("</table>\n")
+
+            html_file.write("<h2>Findings</h2>\n")
+            shown = 0
+            for finding, thumbnail in self.detailed_findings(summary.get("findings_ndjson")):
+                shown += 1
+                status = finding.get("status")
+                badge = f" <span class=\"{status}\">[{status}]</span>" if status else ""
+                html_file.write(f"<h3>#{finding['id']} {html.escape(finding['word'])}{badge}</h3>\n"
+                                f"<p>{html.escape(finding['file'])} at line {finding['line']}</p>\n"
+                                f"<pre>{html.escape(short_context(finding['context']))}</pre>\n")
+                if thumbnail:
+                    relative = os.path.relpath(thumbnail, self.report_dir).replace(os.sep, "/")
+                    html_file.write(f"<img src=\"{html.escape(relative)}\" loading=\"lazy\">\n")
+            note = self.remaining_note(summary, shown)
+            if note:
+                html_file.write(f"<p><em>{html.escape(note)}</em></p>\n")
+            html_file.write("</body></html>\n")
+        return self.html_path
+
+    def write_pdf(self, summary):
+        """Write report.pdf; returns None when fpdf is not installed."""
+        if FPDF is None:
+            return None
+        pdf = FPDF()
+        pdf.set_auto_page_break(auto=True, margin=15)
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 16)
+        pdf.cell(0, 10, latin1(f"APK report: {self.apk_name}"), ln=True, align="C")
+
+        for heading, rows in self.sections(summary):
+            pdf.set_font("Arial", "B", 13)
+            pdf.cell(0, 9, latin1(heading), ln=True)
+            pdf.set_font("Arial", "", 9)
+            for label, value in rows:
+                pdf.cell(60, 5, latin1(str(label)[-40:]))
+                pdf.cell(0, 5, latin1(str(value)[:95]), ln=True)
+            pdf.ln(3)
+
+        pdf.set_font("Arial", "B", 13)
+        pdf.cell(0, 9, "Findings", ln=True)
+        shown = 0
+        for finding, thumbnail in self.detailed_findings(summary.get("findings_ndjson")):
+            if pdf.page_no() >= self.max_pages:
+                break
+            shown += 1
+            status = f" [{finding['status']}]" if finding.get("status") else ""
+            pdf.set_font("Arial", "B", 10)
+            pdf.multi_cell(0, 5, latin1(f"#{finding['id']} {finding['word']}{status}"))
+            pdf.set_font("Arial", "", 8)
+            pdf.multi_cell(0, 4, latin1(f"{finding['file']} at line {finding['line']}"))
+            if thumbnail:
+                pdf.image(thumbnail, w=120)
+            else:
+                pdf.set_font("Courier", "", 7)
+                pdf.multi_cell(0, 3.5, latin1(short_context(finding["context"])))
+            pdf.ln(2)
+
+        note = self.remaining_note(summary, shown)
+        if note:
+            pdf.set_font("Arial", "I", 9)
+            pdf.multi_cell(0, 5, latin1(note))
+        pdf.output(self.pdf_path)
+        return self.pdf_path
+
+def write_report(summary, report_dir, apk_name, screenshot_dir=None, formats=("html", "pdf")):
+    """
+    Write the report of one APK in the given formats and return the paths written.
+    PDF is skipped when fpdf is not installed.
+    """
+    builder = ReportBuilder(report_dir, apk_name, screenshot_dir)
+    paths = []
+    if "html" in formats:
+        paths.append(builder.write_html(summary))
+    if "pdf" in formats:
+        pdf_path = builder.write_pdf(summary)
+        if pdf_path:
+            paths.append(pdf_path)
+    return paths
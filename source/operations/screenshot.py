@@ -1,6 +1,26 @@
+import hashlib
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 
+from source.scanner.scan import CONTEXT_BEFORE
+from source.utils.process_pool import pool_context
+
+# Space around the drawn text
+MARGIN = 5
+
+# Number of queued renders after which finished futures are dropped
+PRUNE_EVERY = 1024
+
+# Grouped evidence: rows per image, characters kept per line and colors of the hit lines
+PAGE_ROWS = 120
+LINE_CHARS = 200
+GUTTER_CHARS = 7
+HIT_BACKGROUND = (255, 236, 140)
+GAP_ROW = (None, "...", False)
+
 def get_default_font():
     """Return a default font path based on the OS or use the built-in PIL font."""
     if os.name == 'nt':  # Windows
@@ -8,42 +28,157 @@ def get_default_font():
     else:
         return "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"  # Common on Linux
 
-def take_screenshot(filepath, screenshot_dir, line_number, search_word):
+@lru_cache(maxsize=None)
+def load_fonts():
+    """Load the evidence font once per process."""
+    try:
+        return ImageFont.truetype(get_default_font(), 20)
+    except IOError:
+        return ImageFont.load_default()  # Fallback to default font
 
-    with open(filepath, "r", encoding="utf-8", errors="replace") as file:
-        # Ensure the screenshot directory exists
-        if not os.path.exists(screenshot_dir):
-            os.makedirs(screenshot_dir)
+def evidence_blocks(hits):
+    """
+    Merge the contexts of the hits of one file into blocks of consecutive lines, so lines
+    shared by neighbouring hits are drawn once. Returns (first_line, lines, hit_lines, window)
+    blocks, window being False for a context that is not lines of the file.
+
+    :param hits: (line_number, context) pairs, context being the lines around the hit as the scanner read them
+    """
+    blocks = []
+    mergeable = False
+    for line_number, context in sorted(set(hits)):
+        lines = (context or "").splitlines() or [""]
+        first_line = max(1, line_number - CONTEXT_BEFORE + 1)
+        window = 1 <= line_number and line_number - first_line < len(lines)
+        if not window:
+            # Not a window of the file (code hits show the method and the instruction), kept on its own
+            first_line = line_number
+        elif mergeable:
+            block_first, block_lines, hit_lines, _ = blocks[-1]
+            overlap = block_lines[first_line - block_first:]
+            if first_line <= block_first + len(block_lines) and lines[:len(overlap)] == overlap:
+                block_lines.extend(lines[len(overlap):])
+                hit_lines.add(line_number)
+                continue
+        blocks.append((first_line, lines, {line_number}, window))
+        mergeable = window
+    return blocks
+
+def evidence_pages(hits, page_rows=PAGE_ROWS):
+    """
+    Split the blocks of one file into pages of at most page_rows (line_number, text, is_hit) rows,
+    a "..." row standing for the lines skipped between two blocks.
+    """
+    rows = []
+    for first_line, lines, hit_lines, window in evidence_blocks(hits):
+        if rows:
+            rows.append(GAP_ROW)
+        for offset, text in enumerate(lines):
+            text = text if len(text) <= LINE_CHARS else text[:LINE_CHARS] + "..."
+            if window:
+                rows.append((first_line + offset, text.expandtabs(4), first_line + offset in hit_lines))
+            else:
+                # Only the hit line of a code context has a line number
+                rows.append((None if offset else first_line, text.expandtabs(4), not offset))
+    return [rows[start:start + page_rows] for start in range(0, len(rows), page_rows)]
+
+def page_filename(rows):
+    """Images are named after their content, so identical snippets are rendered and stored once."""
+    return hashlib.sha256(json.dumps(rows).encode("utf-8")).hexdigest()[:16] + ".png"
 
-        lines = file.readlines()
-        start_line = max(0, line_number - 5)
-        end_line = min(len(lines), line_number + 5)
+def render_page(rows, screenshot_path):
+    """Draw one page of evidence rows, line numbers in a gutter and the hit lines highlighted."""
+    font = load_fonts()
+    measure = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+    row_height = measure.textbbox((0, 0), "Ag", font=font)[3] + 4
+    gutter = measure.textlength("0" * GUTTER_CHARS, font=font)
+    longest = max((text for _, text, _ in rows), key=len, default="")
+    width = int(gutter + measure.textlength(longest or " ", font=font) * 1.1) + 2 * MARGIN
+    height = len(rows) * row_height + 2 * MARGIN
 
-        relevant_line = lines[start_line:end_line]
-        relevant_content = ''.join(relevant_line)
+    image = Image.new('RGB', (width, height), color='white')
+    draw = ImageDraw.Draw(image)
+    for index, (line_number, text, is_hit) in enumerate(rows):
+        y = MARGIN + index * row_height
+        if is_hit:
+            draw.rectangle((0, y, width, y + row_height - 1), fill=HIT_BACKGROUND)
+        if line_number:
+            draw.text((MARGIN, y), str(line_number), fill=(128, 128, 128), font=font)
+        draw.text((MARGIN + gutter, y), text, fill=(0, 0, 0), font=font)
+    # A few colors are enough for text on white, and keep the PNG small
+    image.convert('P', palette=Image.Palette.ADAPTIVE, colors=16).save(screenshot_path, optimize=True)
+    return screenshot_path
 
-        # Clean up the search word for the filename
-        secret_word = search_word.replace('android', '').replace('=', '_').replace('"', '_')
+class ScreenshotPool:
+    """
+    Renders screenshots in background worker processes so the scan never
+    waits for PIL drawing or PNG encoding. Each worker loads the fonts once.
 
-        # Create the filename and path for the screenshot
-        filename = f'{secret_word}_{os.path.basename(filepath)}_{line_number}.png'
-        screenshot_path = os.path.join(screenshot_dir, filename)
+    Use as a context manager; leaving the block waits for every pending image
+    and re-raises the first rendering error.
+    """
 
-        # Define font path or use a fallback if not found
-        font_path = get_default_font()
+    def __init__(self, workers=None):
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(), initializer=load_fonts)
+        self.futures = []
+        # Images queued by this pool, and how many pages were identical to one of them
+        self.images = set()
+        self.reused = 0
 
+    @property
+    def rendered(self):
+        return len(self.images)
+
+    def submit_file(self, screenshot_dir, hits):
+        """
+        Render the evidence of one file: every hit line highlighted on one image, or on a few
+        pages for very noisy files. Pages already rendered (same snippet in another file or an
+        earlier run) are not drawn again.
+
+        :param hits: (line_number, context) of the hits of the file
+        :return: {line_number: image filename} for every hit line
+        """
+        if not os.path.exists(screenshot_dir):
+            os.makedirs(screenshot_dir, exist_ok=True)
+        images = {}
+        for rows in evidence_pages(hits):
+            filename = page_filename(rows)
+            screenshot_path = os.path.join(screenshot_dir, filename)
+            if filename in self.images or os.path.exists(screenshot_path):
+                self.reused += 1
+            else:
+                self.images.add(filename)
+                self._track(self.executor.submit(render_page, rows, screenshot_path))
+            images.update((line_number, filename) for line_number, _, is_hit in rows if is_hit)
+        return images
+
+    def _track(self, future):
+        self.futures.append(future)
+
+        # Drop finished futures now and then so a noisy app does not pile them up
+        if len(self.futures) >= PRUNE_EVERY:
+            pending = []
+            for queued in self.futures:
+                if queued.done():
+                    queued.result()
+                else:
+                    pending.append(queued)
+            self.futures = pending
+
+    def close(self):
         try:
-            font = ImageFont.truetype(font_path, 20)
-        except IOError:
-            font = ImageFont.load_default()  # Fallback to default font
-
-        # Create the image and draw the text
-        image = Image.new('RGB', (3000, 600), color='white')
-        draw = ImageDraw.Draw(image)
-        
-        # Draw the relevant content and the file location
-        draw.text((5, 100), relevant_content, fill=(0, 0, 0), font=font)
-        draw.text((5, 50), f'File location: {filepath}', fill=(0, 0, 0), font=ImageFont.truetype(font_path, 30))
-
-        # Save the image
-        image.save(screenshot_path)
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown(wait=True)
+            self.futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            return False
+        self.close()
+        return False
@@ -2,45 +2,91 @@ import subprocess
 import os
 from rich.console import Console
 
+from source.signing.apk_signer import sign_apk_file, sign_apk_files
+from source.signing.keystore import load_signing_key
+from source.ui.status import status
+from source.utils.tool_runner import run_tool
+
 # Initialize console for rich output
 console = Console()
 
+def jarsigner_sign(apk_path, keystore_path, key_alias, keystore_password):
+    """
+    Sign an APK with jarsigner (v1 only). Used for keystores the in-process
+    signer cannot read, such as the legacy JKS format.
+    """
+    command = ["jarsigner", "-keystore", keystore_path, "-storepass", keystore_password, apk_path, key_alias]
+    result = run_tool(command)
+    if result.returncode:
+        raise subprocess.CalledProcessError(result.returncode, command[0], result.output)
+
 def sign_apk(apk_path, keystore_path, key_alias, keystore_password):
     """
-    Function to sign an APK using jarsigner.
+    Function to zipalign and sign an APK in place with v1, v2 and v3 signatures.
     
     :param apk_path: Path to the APK to be signed
     :param keystore_path: Path to the keystore file
     :param key_alias: Alias of the key in the keystore
     :param keystore_password: Password for the keystore
+    :return: Error message, or None when the APK was signed
     """
     # Check if the APK file exists
     if not os.path.exists(apk_path):
         console.print(f"[red]APK file not found: {apk_path}[/red]")
-        return
+        return f"APK file not found: {apk_path}"
     
     # Check if the keystore file exists
     if not os.path.exists(keystore_path):
         console.print(f"[red]Keystore file not found: {keystore_path}[/red]")
-        return
+        return f"Keystore file not found: {keystore_path}"
 
     try:
-        # Command to sign the APK using jarsigner
-        command = (
-            f"jarsigner -verbose -keystore {keystore_path} "
-            f"-storepass {keystore_password} "
-            f"{apk_path} {key_alias}"
-        )
-        
         # Display processing message in green
-        with console.status("[bold green]Signing APK, please wait...[/bold green]", spinner="dots"):
-            # Execute the command using subprocess, but discard the output
-            with open(os.devnull, 'w') as devnull:
-                subprocess.check_call(command, shell=True, stdout=devnull, stderr=devnull)
-        
+        with status(console, "[bold green]Signing APK, please wait...[/bold green]", spinner="dots"):
+            try:
+                signing_key = load_signing_key(keystore_path, key_alias, keystore_password)
+            except ValueError as e:
+                console.print(f"[yellow][!][/yellow] Keystore not readable in process ({e}), falling back to jarsigner.")
+                jarsigner_sign(apk_path, keystore_path, key_alias, keystore_password)
+                console.print("[green]APK signed successfully (v1, jarsigner).[/green]")
+                return None
+            sign_apk_file(apk_path, apk_path, signing_key)
+
         # Once done, print success message
-        console.print("[green]APK signed successfully.[/green]")
-        
-    except subprocess.CalledProcessError as e:
+        console.print("[green]APK signed successfully (v1, v2, v3, zipaligned).[/green]")
+        return None
+
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
         console.print(f"[red]Error signing APK: {e}[/red]")
+        return str(e)
+
+def sign_apks(apk_paths, keystore_path, key_alias, keystore_password, workers=None):
+    """
+    Sign a batch of APKs in place, loading the key once and spreading the APKs over worker processes.
+
+    :param workers: Worker processes, defaults to the number of cores
+    :return: {apk path: error message or None}
+    """
+    if not os.path.exists(keystore_path):
+        console.print(f"[red]Keystore file not found: {keystore_path}[/red]")
+        return {apk_path: "keystore not found" for apk_path in apk_paths}
+
+    try:
+        signing_key = load_signing_key(keystore_path, key_alias, keystore_password)
+    except ValueError as e:
+        console.print(f"[yellow][!][/yellow] Keystore not readable in process ({e}), falling back to jarsigner.")
+        results = {}
+        for apk_path in apk_paths:
+            try:
+                jarsigner_sign(apk_path, keystore_path, key_alias, keystore_password)
+                results[apk_path] = None
+            except (subprocess.CalledProcessError, OSError) as error:
+                results[apk_path] = str(error)
+        return results
+
+    with status(console, f"[bold green]Signing {len(apk_paths)} APK(s), please wait...[/bold green]", spinner="dots"):
+        results = sign_apk_files(apk_paths, signing_key, workers)
 
+    signed = sum(1 for error in results.values() if error is None)
+    console.print(f"[green][+][/green] Signed [green]{signed}[/green]/{len(apk_paths)} APK(s) (v1, v2, v3, zipaligned).")
+    return results
@@ -0,0 +1,186 @@
+import struct
+import zlib
+
+# Zip record signatures and fixed sizes (APPNOTE.TXT)
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+CENTRAL_HEADER_SIGNATURE = 0x02014b50
+END_OF_CENTRAL_DIR_SIGNATURE = 0x06054b50
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+LOCAL_HEADER_SIZE = 30
+CENTRAL_HEADER_SIZE = 46
+END_OF_CENTRAL_DIR_SIZE = 22
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+class ZipEntry:
+    """One central directory record, kept as raw bytes so it can be copied as is."""
+
+    def __init__(self, record):
+        self.record = record
+        (_, _, _, self.flags, self.method, _, _, self.crc, self.compressed_size, self.size,
+         name_length, _, _, _, _, _, self.header_offset) = struct.unpack("<IHHHHHHIIIHHHHHII", record[:CENTRAL_HEADER_SIZE])
+        self.raw_name = record[CENTRAL_HEADER_SIZE:CENTRAL_HEADER_SIZE + name_length]
+        self.name = self.raw_name.decode("utf-8" if self.flags & 0x800 else "cp437")
+
+    def fingerprint(self):
+        """CRC-32 and size of the content, enough to tell a changed entry without reading it."""
+        return f"{self.crc:08x}:{self.size}"
+
+def read_central_directory(file):
+    """
+    Return the ZipEntry list of an open zip file, in central directory order.
+    Raises ValueError for archives this raw copier cannot handle (ZIP64).
+    """
+    file.seek(0, 2)
+    file_size = file.tell()
+    tail_size = min(file_size, END_OF_CENTRAL_DIR_SIZE + 0xFFFF)
+    file.seek(file_size - tail_size)
+    tail = file.read(tail_size)
+
+    eocd = tail.rfind(struct.pack("<I", END_OF_CENTRAL_DIR_SIGNATURE))
+    if eocd < 0:
+        raise ValueError("Not a zip file: end of central directory not found")
+
+    _, _, _, _, entry_count, cd_size, cd_offset, _ = struct.unpack(
+        "<IHHHHIIH", tail[eocd:eocd + END_OF_CENTRAL_DIR_SIZE])
+    if entry_count == 0xFFFF or cd_offset == 0xFFFFFFFF:
+        raise ValueError("ZIP64 archives are not supported by the raw zip copier")
+
+    file.seek(cd_offset)
+    central_directory = file.read(cd_size)
+    entries, position = [], 0
+    for _ in range(entry_count):
+        name_length, extra_length, comment_length = struct.unpack(
+            "<HHH", central_directory[position + 28:position + 34])
+        end = position + CENTRAL_HEADER_SIZE + name_length + extra_length + comment_length
+        entries.append(ZipEntry(central_directory[position:end]))
+        position = end
+    return entries
+
+def read_entry(file, entry):
+    """Return the uncompressed content of one entry."""
+    _, data = _read_local(file, entry)
+    if entry.method == METHOD_STORED:
+        return data
+    if entry.method == METHOD_DEFLATED:
+        return zlib.decompress(data, -15)
+    raise ValueError(f"Unsupported compression method {entry.method} for {entry.name}")
+
+def read_local_header(file, entry):
+    """Return the local header of an entry (with name and extra field), leaving the file at its data."""
+    file.seek(entry.header_offset)
+    header = file.read(LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    return header + file.read(name_length + extra_length)
+
+def _read_local(file, entry):
+    # Returns (local header with name and extra field, compressed data)
+    header = read_local_header(file, entry)
+    return header, file.read(entry.compressed_size)
+
+def read_descriptor(file, entry):
+    """Return the data descriptor following the entry's data, with or without its optional signature."""
+    if not entry.flags & FLAG_DATA_DESCRIPTOR:
+        return b""
+    descriptor = file.read(16)
+    if descriptor[:4] == struct.pack("<I", DATA_DESCRIPTOR_SIGNATURE):
+        return descriptor
+    return descriptor[:12]
+
+def central_record(entry, offset, **fields):
+    """Copy of the entry's central record with a new local header offset and optional new values."""
+    record = bytearray(entry.record)
+    struct.pack_into("<I", record, 42, offset)
+    if fields:
+        struct.pack_into("<H", record, 8, fields["flags"])
+        struct.pack_into("<H", record, 10, fields["method"])
+        struct.pack_into("<III", record, 16, fields["crc"], fields["compressed_size"], fields["size"])
+    return bytes(record)
+
+def _compress(content, method):
+    if method == METHOD_STORED:
+        return content
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return compressor.compress(content) + compressor.flush()
+
+def new_entry(name, content, offset, method=METHOD_DEFLATED):
+    """Return (local header + data, central record) of an entry that is not in the source zip."""
+    raw_name = name.encode("utf-8")
+    flags = FLAG_UTF8 if not name.isascii() else 0
+    data = _compress(content, method)
+    crc = zlib.crc32(content) & 0xFFFFFFFF
+    dos_date = 0x0021  # 1980-01-01, like apktool and zipalign for reproducible output
+    local = struct.pack("<IHHHHHIIIHH", LOCAL_HEADER_SIGNATURE, 20, flags, method, 0, dos_date,
+                        crc, len(data), len(content), len(raw_name), 0) + raw_name
+    central = struct.pack("<IHHHHHHIIIHHHHHII", CENTRAL_HEADER_SIGNATURE, 20, 20, flags, method, 0, dos_date,
+                          crc, len(data), len(content), len(raw_name), 0, 0, 0, 0, 0, offset) + raw_name
+    return local + data, central
+
+def rewrite_zip(src_path, dst_path, replacements=None, drop=None):
+    """
+    Write a copy of a zip where every entry is copied byte for byte, without
+    decompressing or recompressing, except the replaced ones.
+
+    :param src_path: Source zip/APK
+    :param dst_path: Output path
+    :param replacements: Dict of entry name -> new uncompressed bytes; names missing
+                         from the source are appended as new entries
+    :param drop: Optional predicate on entry names; matching entries are left out
+                 unless they are replaced
+    :return: Number of entries written
+    """
+    replacements = replacements or {}
+    written = 0
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        entries = read_central_directory(src)
+        central_records = []
+
+        # Copy in archive order so untouched data keeps its relative layout
+        for entry in sorted(entries, key=lambda e: e.header_offset):
+            if entry.name not in replacements and drop and drop(entry.name):
+                continue
+
+            offset = dst.tell()
+            if entry.name in replacements:
+                content = replacements[entry.name]
+                # Keep the entry's compression, e.g. resources.arsc must stay stored
+                method = entry.method if entry.method in (METHOD_STORED, METHOD_DEFLATED) else METHOD_DEFLATED
+                data = _compress(content, method)
+                crc = zlib.crc32(content) & 0xFFFFFFFF
+                flags = entry.flags & ~FLAG_DATA_DESCRIPTOR
+
+                local_header, _ = _read_local(src, entry)
+                header = bytearray(local_header)
+                struct.pack_into("<HH", header, 6, flags, method)
+                struct.pack_into("<III", header, 14, crc, len(data), len(content))
+                dst.write(header)
+                dst.write(data)
+                central_records.append(central_record(entry, offset, flags=flags, method=method, crc=crc,
+                                                       compressed_size=len(data), size=len(content)))
+            else:
+                local_header, data = _read_local(src, entry)
+                dst.write(local_header)
+                dst.write(data)
+                dst.write(read_descriptor(src, entry))
+                central_records.append(central_record(entry, offset))
+            written += 1
+
+        existing = {entry.name for entry in entries}
+        for name in sorted(set(replacements) - existing):
+            local, central = new_entry(name, replacements[name], dst.tell())
+            dst.write(local)
+            central_records.append(central)
+            written += 1
+
+        cd_offset = dst.tell()
+        for record in central_records:
+            dst.write(record)
+        dst.write(end_of_central_directory(len(central_records), dst.tell() - cd_offset, cd_offset))
+    return written
+
+def end_of_central_directory(entry_count, cd_size, cd_offset):
+    """End of central directory record, without comment."""
+    return struct.pack("<IHHHHIIH", END_OF_CENTRAL_DIR_SIGNATURE, 0, 0, entry_count, entry_count, cd_size, cd_offset, 0)
@@ -0,0 +1,62 @@
+import asyncio
+
+from source.ui.status import allow_live_display, live_display_allowed, reset_live_display
+
+class StageGraph:
+    """
+    Dependency graph of pipeline stages.
+
+    Every stage runs in a worker thread as soon as the stages it depends on are done,
+    so independent stages overlap: the Python process keeps working (androguard parsing,
+    screenshot rendering) while apktool runs in its JVM. Stages that do not depend on
+    each other must not touch the same files.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, function, after=()):
+        """
+        :param name: Stage name
+        :param function: Called with the dict of results of the finished stages; its return value is the stage result
+        :param after: Names of the stages that must be done first; they have to be added before
+        """
+        for dependency in after:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+        self.stages[name] = (function, tuple(after))
+
+    def run(self):
+        """
+        Run every stage and return {stage name: result}.
+        A failed stage skips the stages depending on it; independent stages still run to the end,
+        then the first error (in the order stages were added) is raised.
+        """
+        # Stage threads inherit the caller's right to show spinners and progress bars
+        token = allow_live_display(live_display_allowed())
+        try:
+            return asyncio.run(self._run())
+        finally:
+            reset_live_display(token)
+
+    async def _run(self):
+        results = {}
+        tasks = {}
+
+        async def run_stage(name, function, after):
+            for dependency in after:
+                await tasks[dependency]
+            results[name] = await asyncio.to_thread(function, results)
+            return results[name]
+
+        for name, (function, after) in self.stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(name, function, after))
+
+        outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        return results
+
+class StageError(Exception):
+    """A stage could not produce its output; the APK is reported as failed."""
@@ -0,0 +1,135 @@
+import struct
+
+from androguard.core.bytecodes.axml import ARSCParser, AXMLPrinter, ResParserError
+
+from source.operations.zip_raw import read_central_directory, read_entry
+from source.scanner.dex_scan import DEX_NAME, scan_dex
+from source.scanner.scan import BINARY_EXTENSIONS, as_rule_set, scan_buffer
+
+# Binary XML (AXML) documents start with a RES_XML_TYPE chunk header
+AXML_MAGIC = b"\x03\x00\x08\x00"
+
+ARSC_NAME = "resources.arsc"
+
+# What androguard raises on damaged or obfuscated binary XML and resource tables: its own
+# ResParserError, or the struct, value and index errors of reading past a bad offset
+DECODE_ERRORS = (ResParserError, struct.error, ValueError, IndexError)
+
+# Top level entries apktool decodes in place; anything else ends up under unknown/
+DECODED_PREFIXES = ("res/", "assets/", "lib/", "kotlin/")
+ROOT_ENTRIES = ("AndroidManifest.xml", ARSC_NAME)
+
+def decoded_path(name):
+    """
+    Path an APK entry gets in the tree apktool decodes, so the rules route the
+    same way whether the scan reads the decoded tree or the APK itself.
+    """
+    if name in ROOT_ENTRIES or name.startswith(DECODED_PREFIXES):
+        return name
+    if name.startswith("META-INF/"):
+        return f"original/{name}"
+    if name.startswith("classes") and name.endswith(".dex"):
+        return name
+    return f"unknown/{name}"
+
+def decode_xml(content):
+    """Binary XML as text, like apktool writes it; text XML is returned unchanged."""
+    if not content.startswith(AXML_MAGIC):
+        return content
+    printer = AXMLPrinter(content)
+    if not printer.is_valid():
+        return content
+    return printer.get_xml()
+
+def _values_dir(locale):
+    # ARSCParser names locales "de", "pt-rBR", ... and the default one "\x00\x00"
+    return "values" if locale == "\x00\x00" else f"values-{locale}"
+
+def resource_strings(content):
+    """
+    Decode resources.arsc in memory into (relpath, xml bytes) pairs, one
+    res/values*/strings.xml per package and locale, as apktool would write them.
+    """
+    arsc = ARSCParser(content)
+    for package in arsc.get_packages_names():
+        for locale in sorted(arsc.get_locales(package)):
+            yield f"res/{_values_dir(locale)}/strings.xml", arsc.get_string_resources(package, locale)
+
+def scan_apk(apk_path, rules, stats=None, progress=None, index=None, scan_cache=None):
+    """
+    Scan an APK without decoding it to disk and yield (search_word, filepath, line_number, context)
+    tuples like scan_tree. Entries are read one at a time from the zip: binary XML is decoded with
+    androguard, resources.arsc is turned into its strings.xml files, the dex files are matched
+    against the code rules (see scan_dex), and text entries are scanned as they are. Entries are routed to the rules by the path apktool would decode them to, and
+    only read when a rule applies. Findings point into the APK as <apk>!/<entry>.
+
+    :param apk_path: Path of the APK to scan
+    :param rules: RuleSet, or a list of literal words to look for in every entry
+    :param stats: Optional dict receiving files_scanned, bytes_scanned (uncompressed) and
+                  undecoded, the entries androguard could not parse
+    :param progress: Optional callable(entries_done, entries_total)
+    :param index: Optional ScanIndex of the package; entries whose CRC and size did not change
+                  since its last scan are not read, their findings are carried forward
+    :param scan_cache: Optional ScanCache; decoded content scanned before, in any APK, is not matched again
+    """
+    rules = as_rule_set(rules)
+    files_scanned = bytes_scanned = 0
+    undecoded = []
+
+    with open(apk_path, "rb") as apk_file:
+        entries = [entry for entry in read_central_directory(apk_file) if not entry.name.endswith("/")]
+        for done, entry in enumerate(entries, start=1):
+            relpath = decoded_path(entry.name)
+            location = f"{apk_path}!/{entry.name}"
+            previous = None
+            if index is not None and (entry.name == ARSC_NAME or DEX_NAME.match(entry.name)
+                                      or rules.route(relpath)):
+                previous = index.carry(entry.name, entry.fingerprint())
+
+            if previous is not None:
+                for inner, word, line_number, context in previous:
+                    yield word, f"{apk_path}!/{inner}", line_number, context
+            elif entry.name == ARSC_NAME:
+                # Parsing the resource table is only worth it when a rule reads res/
+                if rules.walks("res"):
+                    try:
+                        values = list(resource_strings(read_entry(apk_file, entry)))
+                    except DECODE_ERRORS:
+                        # Obfuscated or damaged resource tables are skipped, the other entries still count
+                        undecoded.append(entry.name)
+                        values = []
+                    for values_path, xml in values:
+                        if rules.route(values_path):
+                            files_scanned += 1
+                            bytes_scanned += len(xml)
+                            yield from scan_buffer(xml, rules, f"{location}!/{values_path}", values_path, scan_cache)
+            elif DEX_NAME.match(entry.name):
+                # Code rules read the dex string and method tables, no smali is involved
+                if rules.code_rules():
+                    content = read_entry(apk_file, entry)
+                    files_scanned += 1
+                    bytes_scanned += len(content)
+                    try:
+                        yield from scan_dex(content, rules, location)
+                    except ValueError:
+                        undecoded.append(entry.name)
+            elif not entry.name.lower().endswith(BINARY_EXTENSIONS) and rules.route(relpath):
+                content = read_entry(apk_file, entry)
+                if entry.name.endswith(".xml"):
+                    try:
+                        content = decode_xml(content)
+                    except DECODE_ERRORS:
+                        undecoded.append(entry.name)
+                        content = None
+                if content is not None:
+                    files_scanned += 1
+                    bytes_scanned += len(content)
+                    yield from scan_buffer(content, rules, location, relpath, scan_cache)
+
+            if progress:
+                progress(done, len(entries))
+
+    if stats is not None:
+        stats["files_scanned"] = files_scanned
+        stats["bytes_scanned"] = bytes_scanned
+        stats["undecoded"] = undecoded
@@ -0,0 +1,283 @@
+import re
+import struct
+from array import array
+
+from source.operations.zip_raw import read_central_directory, read_entry
+from source.scanner.matcher import MultiPatternMatcher
+from source.scanner.scan import as_rule_set
+
+# Dex files at the root of an APK: classes.dex, classes2.dex, ...
+DEX_NAME = re.compile(r"^classes\d*\.dex$")
+
+DEX_MAGIC = b"dex\n"
+
+# Instructions referencing a string or a method (Dalvik bytecode formats 21c, 31c, 35c, 3rc)
+CONST_STRING, CONST_STRING_JUMBO = 0x1a, 0x1b
+INVOKE_NAMES = {
+    0x6e: "invoke-virtual", 0x6f: "invoke-super", 0x70: "invoke-direct", 0x71: "invoke-static",
+    0x72: "invoke-interface", 0x74: "invoke-virtual/range", 0x75: "invoke-super/range",
+    0x76: "invoke-direct/range", 0x77: "invoke-static/range", 0x78: "invoke-interface/range",
+}
+
+# Size in 16-bit code units of every opcode, to step from one instruction to the next
+_SIZES = bytearray([1]) * 256
+for _opcodes, _size in (((0x02, 0x05, 0x08, 0x13, 0x15, 0x16, 0x19, 0x1a, 0x1c, 0x1f, 0x20, 0x22, 0x23, 0x29,
+                          0xfe, 0xff), 2),
+                        ((0x03, 0x06, 0x09, 0x14, 0x17, 0x1b, 0x24, 0x25, 0x26, 0x2a, 0x2b, 0x2c, 0xfc, 0xfd), 3),
+                        ((0xfa, 0xfb), 4), ((0x18,), 5)):
+    for _opcode in _opcodes:
+        _SIZES[_opcode] = _size
+for _first, _last, _size in ((0x2d, 0x3d, 2), (0x44, 0x6d, 2), (0x6e, 0x72, 3), (0x74, 0x78, 3),
+                             (0x90, 0xaf, 2), (0xd0, 0xe2, 2)):
+    _SIZES[_first:_last + 1] = bytes([_size]) * (_last - _first + 1)
+
+# nop followed by one of these idents starts a switch or array data table
+PACKED_SWITCH, SPARSE_SWITCH, FILL_ARRAY_DATA = 0x0100, 0x0200, 0x0300
+
+def _uleb128(data, position):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+def _sleb128(data, position):
+    start = position
+    value, position = _uleb128(data, position)
+    bits = 7 * (position - start)
+    if value & (1 << (bits - 1)):
+        value -= 1 << bits
+    return value, position
+
+class DexTables:
+    """
+    The deduplicated string and method reference tables of one dex file, read once.
+    Code is only walked to locate the references that matched a rule.
+    """
+
+    def __init__(self, data):
+        if data[:4] != DEX_MAGIC:
+            raise ValueError("Not a dex file")
+        self.data = data
+        (string_count, string_offset, type_count, type_offset, proto_count, proto_offset,
+         _, _, method_count, method_offset, class_count, class_offset) = struct.unpack_from("<12I", data, 56)
+
+        self.strings = [self._string(offset)
+                        for offset in struct.unpack_from(f"<{string_count}I", data, string_offset)]
+        self.types = [self.strings[index] for index in struct.unpack_from(f"<{type_count}I", data, type_offset)]
+        self.protos = [struct.unpack_from("<III", data, proto_offset + index * 12) for index in range(proto_count)]
+        self.methods = [struct.unpack_from("<HHI", data, method_offset + index * 8) for index in range(method_count)]
+        self.class_offset, self.class_count = class_offset, class_count
+
+    def _string(self, offset):
+        # string_data_item: UTF-16 length, then MUTF-8 bytes up to a NUL
+        _, start = _uleb128(self.data, offset)
+        return self.data[start:self.data.index(b"\0", start)].decode("utf-8", errors="replace")
+
+    def method_reference(self, index):
+        """Smali notation of a method reference, e.g. Landroid/webkit/WebSettings;->setJavaScriptEnabled(Z)V"""
+        class_index, proto_index, name_index = self.methods[index]
+        _, return_type, parameters_offset = self.protos[proto_index]
+        parameters = ""
+        if parameters_offset:
+            count = struct.unpack_from("<I", self.data, parameters_offset)[0]
+            parameters = "".join(self.types[type_index]
+                                 for type_index in struct.unpack_from(f"<{count}H", self.data, parameters_offset + 4))
+        return f"{self.types[class_index]}->{self.strings[name_index]}({parameters}){self.types[return_type]}"
+
+    def code_items(self):
+        """Yield (method index, code offset) of every method with code, class by class."""
+        for index in range(self.class_count):
+            class_data_offset = struct.unpack_from("<I", self.data, self.class_offset + index * 32 + 24)[0]
+            if not class_data_offset:
+                continue
+            sizes, position = [], class_data_offset
+            for _ in range(4):
+                size, position = _uleb128(self.data, position)
+                sizes.append(size)
+            for _ in range(sizes[0] + sizes[1]):
+                _, position = _uleb128(self.data, position)
+                _, position = _uleb128(self.data, position)
+            for count in sizes[2:]:
+                method_index = 0
+                for _ in range(count):
+                    difference, position = _uleb128(self.data, position)
+                    _, position = _uleb128(self.data, position)
+                    code_offset, position = _uleb128(self.data, position)
+                    method_index += difference
+                    if code_offset:
+                        yield method_index, code_offset
+
+    def references(self, code_offset, wanted_strings, wanted_methods):
+        """Yield (address, instruction, 'string' or 'method', index) for the wanted references of one method."""
+        unit_count = struct.unpack_from("<I", self.data, code_offset + 12)[0]
+        units = array("H", self.data[code_offset + 16:code_offset + 16 + unit_count * 2])
+        address = 0
+        while address < unit_count:
+            unit = units[address]
+            opcode = unit & 0xff
+            if opcode == 0 and unit in (PACKED_SWITCH, SPARSE_SWITCH, FILL_ARRAY_DATA):
+                size = units[address + 1]
+                if unit == PACKED_SWITCH:
+                    address += 4 + size * 2
+                elif unit == SPARSE_SWITCH:
+                    address += 2 + size * 4
+                else:
+                    count = units[address + 2] | (units[address + 3] << 16)
+                    address += 4 + (size * count + 1) // 2
+                continue
+            if opcode == CONST_STRING and units[address + 1] in wanted_strings:
+                yield address, "const-string", "string", units[address + 1]
+            elif opcode == CONST_STRING_JUMBO:
+                index = units[address + 1] | (units[address + 2] << 16)
+                if index in wanted_strings:
+                    yield address, "const-string/jumbo", "string", index
+            elif opcode in INVOKE_NAMES and units[address + 1] in wanted_methods:
+                yield address, INVOKE_NAMES[opcode], "method", units[address + 1]
+            address += _SIZES[opcode]
+
+    def source_lines(self, code_offset):
+        """Return a function mapping a code address to its source line, from the method's debug info."""
+        debug_offset = struct.unpack_from("<I", self.data, code_offset + 8)[0]
+        positions = []
+        if debug_offset:
+            line, position = _uleb128(self.data, debug_offset)
+            parameter_count, position = _uleb128(self.data, position)
+            for _ in range(parameter_count):
+                _, position = _uleb128(self.data, position)
+            address = 0
+            while True:
+                opcode = self.data[position]
+                position += 1
+                if opcode == 0x00:  # DBG_END_SEQUENCE
+                    break
+                if opcode == 0x01:  # DBG_ADVANCE_PC
+                    step, position = _uleb128(self.data, position)
+                    address += step
+                elif opcode == 0x02:  # DBG_ADVANCE_LINE
+                    step, position = _sleb128(self.data, position)
+                    line += step
+                elif opcode in (0x03, 0x04):  # DBG_START_LOCAL(_EXTENDED): register, name, type(, signature)
+                    for _ in range(3 if opcode == 0x03 else 4):
+                        _, position = _uleb128(self.data, position)
+                elif opcode in (0x05, 0x06, 0x09):  # DBG_END_LOCAL, DBG_RESTART_LOCAL, DBG_SET_FILE
+                    _, position = _uleb128(self.data, position)
+                elif opcode >= 0x0a:  # Special opcode: advance both and emit a position
+                    adjusted = opcode - 0x0a
+                    line += -4 + adjusted % 15
+                    address += adjusted // 15
+                    positions.append((address, line))
+
+        def line_at(address):
+            found = 0
+            for position_address, line in positions:
+                if position_address > address:
+                    break
+                found = line
+            return found
+        return line_at
+
+def _table_hits(entries, matcher):
+    # One matcher pass over the whole table, one table entry per line
+    buffer = "\n".join(entry.replace("\n", " ") for entry in entries)
+    return [(line_number - 1, pattern_index) for line_number, pattern_index in matcher.find_lines(buffer)]
+
+def _class_name(descriptor):
+    # Lcom/example/Foo; -> com.example.Foo
+    return descriptor[1:-1].replace("/", ".") if descriptor.startswith("L") else descriptor
+
+def scan_dex(data, rules, location):
+    """
+    Match the code rules against one dex file and yield (search_word, filepath, line_number, context)
+    like scan_tree. The string pool and the method reference table are each matched in a single
+    pass; only when something matched is the bytecode walked, to find the methods using it.
+
+    A hit is reported once per using method, as <location>!/<class name> with the source line from
+    the debug info (0 when stripped) and the method and instruction as context. References no code
+    uses (e.g. strings only found in annotations) are reported against the dex itself.
+
+    Raises ValueError for a malformed dex, before any hit of it is yielded.
+
+    :param data: Dex file content
+    :param rules: RuleSet; only its rules with a code literal apply
+    :param location: Path shown for the dex file, e.g. <apk>!/classes.dex
+    """
+    rules = as_rule_set(rules)
+    if not rules.code_rules():
+        return
+    try:
+        hits = list(_dex_hits(DexTables(data), rules, location))
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Malformed dex file: {e}")
+    yield from hits
+
+def _dex_hits(dex, rules, location):
+    code_rules = rules.code_rules()
+    matcher = MultiPatternMatcher([rules.rules[index].code for index in code_rules])
+    wanted_strings, wanted_methods = {}, {}
+    for index, pattern_index in _table_hits(dex.strings, matcher):
+        wanted_strings.setdefault(index, []).append(code_rules[pattern_index])
+    method_references = [dex.method_reference(index) for index in range(len(dex.methods))]
+    for index, pattern_index in _table_hits(method_references, matcher):
+        wanted_methods.setdefault(index, []).append(code_rules[pattern_index])
+    if not wanted_strings and not wanted_methods:
+        return
+
+    used = set()
+    for method_index, code_offset in dex.code_items():
+        references = list(dex.references(code_offset, wanted_strings, wanted_methods))
+        if not references:
+            continue
+        line_at = dex.source_lines(code_offset)
+        class_index = dex.methods[method_index][0]
+        filepath = f"{location}!/{_class_name(dex.types[class_index])}"
+        seen = set()
+        for address, instruction, kind, index in references:
+            used.add((kind, index))
+            target = f'"{dex.strings[index]}"' if kind == "string" else method_references[index]
+            context = f"{method_references[method_index]}\n    {instruction} {target}\n"
+            for rule_index in (wanted_strings if kind == "string" else wanted_methods)[index]:
+                if (rule_index, kind, index) not in seen:
+                    seen.add((rule_index, kind, index))
+                    yield rules.rules[rule_index].pattern, filepath, line_at(address), context
+
+    for kind, wanted, table in (("string", wanted_strings, dex.strings), ("method", wanted_methods, method_references)):
+        for index, rule_indices in sorted(wanted.items()):
+            if (kind, index) not in used:
+                for rule_index in rule_indices:
+                    yield rules.rules[rule_index].pattern, location, 0, f"{table[index]}\n"
+
+def scan_apk_code(apk_path, rules, stats=None, index=None):
+    """
+    Run the code rules over every classes*.dex of an APK, read straight from the zip,
+    so code is covered without baksmaling anything.
+
+    :param stats: Optional dict whose dex_files and dex_bytes are incremented; dex files
+                  that fail to parse are appended to its undecoded list and skipped
+    :param index: Optional ScanIndex of the package; dex files whose CRC and size did not change
+                  since its last scan are not read, their findings are carried forward
+    """
+    rules = as_rule_set(rules)
+    if not rules.code_rules():
+        return
+    with open(apk_path, "rb") as apk_file:
+        for entry in read_central_directory(apk_file):
+            if not DEX_NAME.match(entry.name):
+                continue
+            previous = index.carry(entry.name, entry.fingerprint()) if index is not None else None
+            if previous is not None:
+                for inner, word, line_number, context in previous:
+                    yield word, f"{apk_path}!/{inner}", line_number, context
+                continue
+            data = read_entry(apk_file, entry)
+            if stats is not None:
+                stats["dex_files"] = stats.get("dex_files", 0) + 1
+                stats["dex_bytes"] = stats.get("dex_bytes", 0) + len(data)
+            try:
+                yield from scan_dex(data, rules, f"{apk_path}!/{entry.name}")
+            except ValueError:
+                if stats is not None:
+                    stats.setdefault("undecoded", []).append(entry.name)
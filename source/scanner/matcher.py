@@ -0,0 +1,96 @@
+import re
+
+class MultiPatternMatcher:
+    """
+    Finds every occurrence of a set of literal patterns in one pass over a buffer.
+
+    The patterns are folded into a trie and compiled into a single regular
+    expression, so the regex engine walks each buffer once no matter how many
+    patterns there are. Every regex match is the longest pattern starting at
+    that offset; shorter patterns that are prefixes of it are added back from
+    a precomputed table, and the search resumes one character later so
+    overlapping occurrences are reported too.
+
+    Works on str patterns/buffers or bytes patterns/buffers (not mixed).
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        if not self.patterns:
+            raise ValueError("MultiPatternMatcher needs at least one pattern")
+        if any(not pattern for pattern in self.patterns):
+            raise ValueError("MultiPatternMatcher patterns must not be empty")
+
+        self._is_bytes = isinstance(self.patterns[0], bytes)
+        self._regex = re.compile(self._trie_regex(self._build_trie()))
+
+        # For every pattern, all pattern indices it implies (itself and its prefixes)
+        self._implied = {}
+        for pattern in set(self.patterns):
+            self._implied[pattern] = [
+                index for index, other in enumerate(self.patterns) if pattern.startswith(other)
+            ]
+
+    def _build_trie(self):
+        trie = {}
+        for pattern in self.patterns:
+            node = trie
+            for position in range(len(pattern)):
+                node = node.setdefault(pattern[position:position + 1], {})
+            node[None] = True  # Marks the end of a pattern
+        return trie
+
+    def _trie_regex(self, node):
+        terminal = None in node
+        alternatives = [
+            re.escape(char) + self._trie_regex(child)
+            for char, child in sorted((k, v) for k, v in node.items() if k is not None)
+        ]
+        empty = b"" if self._is_bytes else ""
+        if not alternatives:
+            return empty
+
+        if len(alternatives) == 1 and not terminal:
+            return alternatives[0]
+
+        # Greedy optional group: longer continuations are tried before stopping here
+        join = b"|" if self._is_bytes else "|"
+        group = (b"(?:%s)" if self._is_bytes else "(?:%s)") % join.join(alternatives)
+        if terminal:
+            group += b"?" if self._is_bytes else "?"
+        return group
+
+    def finditer(self, buffer, start=0, end=None):
+        """
+        Yield (pattern_index, offset) for every occurrence of every pattern.
+
+        Offsets are increasing; patterns that start at the same offset come in
+        pattern order.
+        """
+        end = len(buffer) if end is None else end
+        search = self._regex.search
+        position = start
+        while True:
+            match = search(buffer, position, end)
+            if match is None:
+                return
+            offset = match.start()
+            for index in self._implied[match.group()]:
+                yield index, offset
+            position = offset + 1
+
+    def find_lines(self, text):
+        """
+        Return sorted (line_number, pattern_index) pairs, one per pattern per line,
+        the same pairs a line by line `pattern in line` loop would produce.
+        Newlines are only counted up to the last match, so buffers without a
+        match cost a single regex pass. Also accepts mmap objects.
+        """
+        newline = b"\n" if self._is_bytes else "\n"
+        found = set()
+        line_number, counted_to = 1, 0
+        for index, offset in self.finditer(text):
+            line_number += text[counted_to:offset].count(newline)
+            counted_to = offset
+            found.add((line_number, index))
+        return sorted(found)
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import re
+
+# Smali is only opened for rules that ask for it by file type, like the scan always did
+SOURCE_EXTENSION = '.smali'
+
+def glob_to_regex(pattern):
+    """
+    Translate a path glob into a regex on '/' separated paths relative to the decoded root:
+    '**' spans directories, '*' and '?' stay within one path segment.
+    """
+    regex, index = "", 0
+    while index < len(pattern):
+        if pattern.startswith("**/", index):
+            regex += "(?:.*/)?"
+            index += 3
+        elif pattern.startswith("**", index):
+            regex += ".*"
+            index += 2
+        elif pattern[index] == "*":
+            regex += "[^/]*"
+            index += 1
+        elif pattern[index] == "?":
+            regex += "[^/]"
+            index += 1
+        else:
+            regex += re.escape(pattern[index])
+            index += 1
+    return re.compile(regex + r"\Z")
+
+def _is_glob(pattern):
+    return any(char in pattern for char in "*?")
+
+class Rule:
+    """
+    One literal search pattern and where it can appear.
+
+    :param rule_id: Stable name of the rule
+    :param pattern: Literal text to look for
+    :param paths: Path globs relative to the decoded root, e.g. "AndroidManifest.xml", "res/values*/strings.xml"
+    :param file_types: Extensions the rule applies to (".xml", ".js"); empty means any file except smali
+    :param code: Literal looked up in the dex string and method reference tables, e.g.
+                 "Landroid/webkit/WebSettings;->setJavaScriptEnabled(Z)V" (see dex_scan.py);
+                 a rule with code and no paths only reads code
+    """
+
+    def __init__(self, rule_id, pattern, paths=("**",), file_types=(), code=None):
+        self.id = rule_id
+        self.pattern = pattern
+        self.paths = list(paths)
+        self.file_types = [file_type.lower() for file_type in file_types]
+        self.code = code
+
+    def accepts_type(self, extension):
+        if self.file_types:
+            return extension in self.file_types
+        return extension != SOURCE_EXTENSION
+
+    def to_dict(self):
+        rule = {"id": self.id, "pattern": self.pattern, "paths": self.paths, "file_types": self.file_types}
+        if self.code:
+            rule["code"] = self.code
+        return rule
+
+class RuleSet:
+    """
+    The scan rules compiled into a routing index: globs are grouped by their first
+    path segment, so a file is only tested against the globs of its top level directory
+    (plus the ones starting with a wildcard), and whole top level directories no rule
+    can reach (smali*, usually) are never walked.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.version = hashlib.sha256(json.dumps([rule.to_dict() for rule in self.rules],
+                                                 sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+        grouped = {}
+        for index, rule in enumerate(self.rules):
+            for path in rule.paths:
+                grouped.setdefault(path, []).append(index)
+
+        # Literal paths are a dict lookup. Globs are bucketed by their literal first segment,
+        # "" for globs on files at the root, "*" for globs starting with a wildcard directory
+        self.exact = {}
+        self.buckets = {}
+        for path, indices in grouped.items():
+            if not _is_glob(path):
+                self.exact.setdefault(path, []).extend(indices)
+                continue
+            first = path.split("/", 1)[0]
+            if "/" not in path and "**" not in path:
+                bucket = ""
+            elif _is_glob(first):
+                bucket = "*"
+            else:
+                bucket = first
+            self.buckets.setdefault(bucket, []).append((glob_to_regex(path), indices))
+        self.exact_dirs = {path.split("/", 1)[0] for path in self.exact if "/" in path}
+
+    @classmethod
+    def from_words(cls, search_words):
+        """Rules for plain search words, each matched in every file (the scan's old behaviour)."""
+        return cls(Rule(word, word) for word in search_words)
+
+    def patterns(self):
+        return [rule.pattern for rule in self.rules]
+
+    def walks(self, top_level_dir):
+        """Whether any rule can match a file under this top level directory of the decoded tree."""
+        return "*" in self.buckets or top_level_dir in self.buckets or top_level_dir in self.exact_dirs
+
+    def route(self, relpath):
+        """Indices of the rules that apply to a file, as a sorted tuple (empty: the file is not opened)."""
+        extension = os.path.splitext(relpath)[1].lower()
+        first = relpath.split("/", 1)[0] if "/" in relpath else ""
+
+        candidates = set(self.exact.get(relpath, ()))
+        for bucket in ("*", first):
+            for regex, indices in self.buckets.get(bucket, ()):
+                if regex.match(relpath):
+                    candidates.update(indices)
+        return tuple(sorted(index for index in candidates if self.rules[index].accepts_type(extension)))
+
+    def code_rules(self):
+        """Indices of the rules matched against the dex tables."""
+        return [index for index, rule in enumerate(self.rules) if rule.code]
+
+    def sources_required(self):
+        """Whether a rule reads smali, i.e. apktool has to baksmali the dex files."""
+        return any(SOURCE_EXTENSION in rule.file_types for rule in self.rules)
+
+def load_rules(rules_path):
+    """
+    Load a rule file:
+
+        {"rules": [{"id": "...", "pattern": "...", "paths": ["..."], "file_types": [".xml"], "code": "..."}, ...]}
+
+    Raises ValueError for a malformed rule.
+    """
+    with open(rules_path, "r", encoding="utf-8") as rules_file:
+        config = json.load(rules_file)
+
+    rules, seen = [], set()
+    for position, entry in enumerate(config.get("rules", []), start=1):
+        if not isinstance(entry, dict) or not entry.get("pattern"):
+            raise ValueError(f"Rule #{position} in {rules_path} has no pattern")
+        rule_id = entry.get("id") or entry["pattern"]
+        if rule_id in seen:
+            raise ValueError(f"Duplicate rule id {rule_id} in {rules_path}")
+        seen.add(rule_id)
+        if not entry.get("paths", ["**"]) and not entry.get("code"):
+            raise ValueError(f"Rule {rule_id} in {rules_path} applies to no path and has no code literal")
+        rules.append(Rule(rule_id, entry["pattern"], entry.get("paths", ["**"]), entry.get("file_types", []),
+                          entry.get("code")))
+    return RuleSet(rules)
@@ -0,0 +1,309 @@
+import hashlib
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from source.operations.modify_code import replacement_dict, patch_file
+from source.scanner.matcher import MultiPatternMatcher
+from source.scanner.rules import RuleSet
+from source.scanner.scan_cache import ScanCache
+from source.utils.hashing import file_sha256
+from source.utils.process_pool import pool_context
+
+# Files known to be binary are skipped without being opened
+BINARY_EXTENSIONS = (
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.ico',
+    '.ttf', '.otf', '.woff', '.woff2',
+    '.so', '.dex', '.arsc', '.jar', '.zip', '.apk', '.bin',
+    '.mp3', '.mp4', '.ogg', '.wav', '.m4a', '.webm',
+)
+
+# Bytes sniffed at the start of a file to detect binary content
+SNIFF_SIZE = 8192
+
+# Files at least this large are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 1024 * 1024
+
+# Lines kept on each side of a hit, the same window the screenshots show
+CONTEXT_BEFORE = 5
+CONTEXT_AFTER = 5
+
+# Shards per worker; more shards than workers keeps every core busy until the end
+SHARDS_PER_JOB = 4
+
+# Rules of the current worker process, their compiled patterns and its ScanCache, set by _init_worker
+_worker_rules = None
+_worker_patterns = {}
+_worker_cache = None
+
+def as_rule_set(rules):
+    """Accept a RuleSet or, like before rule files existed, a plain list of search words."""
+    return rules if isinstance(rules, RuleSet) else RuleSet.from_words(rules)
+
+def list_scan_files(root_directory, rules):
+    """
+    Return (filepath, size, rule_indices) for every file at least one rule applies to,
+    in a stable sorted order so results are the same from one run to the next.
+    Top level directories no rule can reach are not walked at all.
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root_directory):
+        reldir = os.path.relpath(dirpath, root_directory).replace(os.sep, "/")
+        if reldir == ".":
+            reldir = ""
+            dirnames[:] = [dirname for dirname in dirnames if rules.walks(dirname)]
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(BINARY_EXTENSIONS):
+                continue
+            rule_indices = rules.route(f"{reldir}/{filename}" if reldir else filename)
+            if not rule_indices:
+                continue
+            filepath = os.path.join(dirpath, filename)
+            files.append((filepath, os.path.getsize(filepath), rule_indices))
+    return files
+
+def sources_required(rules):
+    """
+    Whether the scan reads smali. When it does not, apktool can skip baksmaling the
+    dex files (decode with --no-src) and the rebuild reuses the original dex as is.
+    """
+    return as_rule_set(rules).sources_required()
+
+def shard_files(files, shard_count):
+    """
+    Split the file list into contiguous shards of roughly equal total size.
+    Shards keep the file order, so concatenating their results in shard order
+    gives the same order as a serial scan.
+    """
+    if shard_count <= 1 or len(files) <= 1:
+        return [files] if files else []
+
+    total = sum(entry[1] for entry in files) or 1
+    target = total / shard_count
+    shards, current, current_size = [], [], 0
+    for entry in files:
+        current.append(entry)
+        current_size += entry[1]
+        if current_size >= target and len(shards) < shard_count - 1:
+            shards.append(current)
+            current, current_size = [], 0
+    if current:
+        shards.append(current)
+    return shards
+
+class ScanPatterns:
+    """
+    The search words and the replacement_dict keys compiled into one matcher,
+    so a single pass over a file finds the hits and tells whether it needs patching.
+    """
+
+    def __init__(self, search_words):
+        self.search_words = list(search_words)
+        all_words = self.search_words + [key for key in replacement_dict if key not in self.search_words]
+        self.matcher = MultiPatternMatcher([word.encode("utf-8") for word in all_words])
+        self.patch_indices = {index for index, word in enumerate(all_words) if word in replacement_dict}
+
+def is_binary(head):
+    """Treat content with a NUL byte in its first block as binary, like git does."""
+    return b"\0" in head
+
+def _match_content(content, patterns, patch):
+    # Returns (hits, bytes to patch or None, whether a replacement_dict key is in the content)
+    if is_binary(content[:SNIFF_SIZE]):
+        return [], None, False
+
+    found = patterns.matcher.find_lines(content)
+    if not found:
+        return [], None, False
+
+    # Only files with a hit are split into lines, to hand the context to the screenshots
+    data = content[:]
+    lines = data.splitlines(keepends=True)
+    word_count = len(patterns.search_words)
+    hits = []
+    for line_number, word_index in found:
+        if word_index < word_count:
+            start = max(0, line_number - CONTEXT_BEFORE)
+            end = min(len(lines), line_number + CONTEXT_AFTER)
+            context = b"".join(lines[start:end]).decode("utf-8", errors="replace")
+            hits.append((line_number, word_index, context))
+
+    patchable = any(word_index in patterns.patch_indices for _, word_index in found)
+    return hits, (data if patch and patchable else None), patchable
+
+def _scan_content(content, patterns, patch, cached=None):
+    # With a CacheView, content scanned before (in any APK) is looked up by its SHA-256 instead
+    if cached is None:
+        hits, original, _ = _match_content(content, patterns, patch)
+        return hits, original
+
+    digest = hashlib.sha256(content).hexdigest()
+    result = cached.get(digest, len(content))
+    if result is not None:
+        hits, patchable = result
+        return hits, (content[:] if patch and patchable else None)
+    hits, original, patchable = _match_content(content, patterns, patch)
+    cached.put(digest, hits, patchable)
+    return hits, original
+
+def scan_file(filepath, patterns, patch=False, cached=None):
+    """
+    Scan one file and, when asked, patch it in the same pass.
+
+    The file is read as bytes, memory-mapped when large, and skipped when it
+    looks binary. Line numbers and context are only built for files with a hit.
+    A file is rewritten at most once, and only if a replacement_dict key is in it.
+
+    :param cached: Optional CacheView (see ScanCache) of the file's rules; content seen
+                   before is not matched again, only patched when it has to be
+    :return: (hits, bytes_written) where hits are sorted (line_number, word_index, context)
+    """
+    with open(filepath, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return [], 0
+
+        if size < MMAP_THRESHOLD:
+            hits, original = _scan_content(file.read(), patterns, patch, cached)
+        else:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                hits, original = _scan_content(content, patterns, patch, cached)
+
+    # Patch after the file is closed, reusing the bytes that were just scanned
+    bytes_written = patch_file(filepath, original) if original is not None else 0
+    return hits, bytes_written
+
+def patterns_for(rules, rule_indices, cache):
+    """ScanPatterns of a subset of the rules, compiled once per distinct subset."""
+    patterns = cache.get(rule_indices)
+    if patterns is None:
+        patterns = cache[rule_indices] = ScanPatterns([rules.rules[index].pattern for index in rule_indices])
+    return patterns
+
+def _routed_hits(hits, rule_indices):
+    # Matcher word indices are local to the file's rule subset; report them as rule indices
+    return [(line_number, rule_indices[word_index], context) for line_number, word_index, context in hits]
+
+def scan_buffer(content, rules, filepath, relpath=None, scan_cache=None):
+    """
+    Scan content that is not on disk (e.g. a manifest decoded in memory) and
+    yield (search_word, filepath, line_number, context) like scan_tree.
+
+    :param relpath: Path of the content inside the decoded tree, used to route the rules;
+                    None applies every rule
+    :param scan_cache: Optional ScanCache, looked up by the content's SHA-256
+    """
+    rules = as_rule_set(rules)
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    rule_indices = rules.route(relpath) if relpath is not None else tuple(range(len(rules.rules)))
+    if not rule_indices:
+        return
+    cached = scan_cache.view(rule_indices) if scan_cache is not None else None
+    hits, _ = _scan_content(content, patterns_for(rules, rule_indices, {}), False, cached)
+    for line_number, rule_index, context in _routed_hits(hits, rule_indices):
+        yield rules.rules[rule_index].pattern, filepath, line_number, context
+
+def _init_worker(rules, cache_args=None):
+    global _worker_rules, _worker_patterns, _worker_cache
+    _worker_rules = rules
+    _worker_patterns = {}
+    _worker_cache = ScanCache(*cache_args, create=False) if cache_args else None
+
+def _scan_shard(shard, patch):
+    results = []
+    for filepath, _, rule_indices in shard:
+        patterns = patterns_for(_worker_rules, rule_indices, _worker_patterns)
+        cached = _worker_cache.view(rule_indices) if _worker_cache is not None else None
+        hits, bytes_written = scan_file(filepath, patterns, patch, cached)
+        if hits or bytes_written:
+            results.append((filepath, _routed_hits(hits, rule_indices), bytes_written))
+    # New results go back to the parent, the only process writing the cache
+    return results, (_worker_cache.drain() if _worker_cache is not None else None)
+
+def _record_patch(stats, filepath, bytes_written, index=None):
+    if not bytes_written:
+        return
+    if index is not None:
+        index.set_patched(filepath)
+    if stats is None:
+        return
+    stats["files_patched"] = stats.get("files_patched", 0) + 1
+    stats["bytes_written"] = stats.get("bytes_written", 0) + bytes_written
+    stats.setdefault("patched_files", []).append(filepath)
+
+def carry_forward(files, root_directory, index, patch):
+    """
+    Split the file list into the files to scan and the findings carried forward from the
+    ScanIndex for files whose SHA-256 did not change, as (search_word, filepath, line_number, context).
+    """
+    to_scan, carried = [], []
+    for entry in files:
+        relpath = os.path.relpath(entry[0], root_directory).replace(os.sep, "/")
+        previous = index.carry(relpath, file_sha256(entry[0]), patch)
+        if previous is None:
+            to_scan.append(entry)
+        else:
+            carried.extend((word, os.path.join(root_directory, inner), line_number, context)
+                           for inner, word, line_number, context in previous)
+    return to_scan, carried
+
+def scan_tree(root_directory, rules, jobs=1, patch=False, stats=None, progress=None, index=None, scan_cache=None):
+    """
+    Scan a decoded tree and yield (search_word, filepath, line_number, context) tuples.
+    Each file is only opened if a rule applies to it, and only matched against those rules.
+    With a ScanIndex, files unchanged since the last scan of the package are not scanned again;
+    their findings are yielded first, as recorded then. With a ScanCache, files whose content was
+    scanned before, in any APK, reuse the cached results.
+
+    :param root_directory: Directory to scan
+    :param rules: RuleSet, or a list of literal words to look for in every file
+    :param jobs: Number of worker processes; 1 scans in this process
+    :param patch: Also apply replacement_dict to every scanned file in the same pass
+    :param stats: Optional dict receiving files_scanned, bytes_scanned, files_patched,
+                  bytes_written and patched_files
+    :param progress: Optional callable(files_done, files_total), called as files are scanned
+    :param index: Optional ScanIndex of the package
+    :param scan_cache: Optional ScanCache; the caller flushes it
+    """
+    rules = as_rule_set(rules)
+    files = list_scan_files(root_directory, rules)
+    if index is not None:
+        files, carried = carry_forward(files, root_directory, index, patch)
+        yield from carried
+    if stats is not None:
+        stats["files_scanned"] = len(files)
+        stats["bytes_scanned"] = sum(size for _, size, _ in files)
+
+    if jobs <= 1:
+        cache = {}
+        for done, (filepath, _, rule_indices) in enumerate(files, start=1):
+            cached = scan_cache.view(rule_indices) if scan_cache is not None else None
+            hits, bytes_written = scan_file(filepath, patterns_for(rules, rule_indices, cache), patch, cached)
+            _record_patch(stats, filepath, bytes_written, index)
+            for line_number, rule_index, context in _routed_hits(hits, rule_indices):
+                yield rules.rules[rule_index].pattern, filepath, line_number, context
+            if progress:
+                progress(done, len(files))
+        return
+
+    shards = shard_files(files, jobs * SHARDS_PER_JOB)
+    cache_args = scan_cache.worker_args() if scan_cache is not None else None
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=pool_context(), initializer=_init_worker,
+                             initargs=(rules, cache_args)) as executor:
+        futures = [executor.submit(_scan_shard, shard, patch) for shard in shards]
+
+        # Collect in shard order so the merged output is deterministic
+        done = 0
+        for shard, future in zip(shards, futures):
+            results, cache_results = future.result()
+            if cache_results is not None:
+                scan_cache.merge(*cache_results)
+            for filepath, hits, bytes_written in results:
+                _record_patch(stats, filepath, bytes_written, index)
+                for line_number, rule_index, context in hits:
+                    yield rules.rules[rule_index].pattern, filepath, line_number, context
+            done += len(shard)
+            if progress:
+                progress(done, len(files))
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import sqlite3
+from collections import Counter
+
+from source.operations.modify_code import replacement_dict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_results (
+    digest TEXT NOT NULL,
+    rules_version TEXT NOT NULL,
+    rule_subset TEXT NOT NULL,
+    hits TEXT NOT NULL,
+    patchable INTEGER NOT NULL,
+    PRIMARY KEY (digest, rules_version, rule_subset)
+)
+"""
+
+def cache_version(rules):
+    """
+    Everything a cached result depends on besides the content: the rules, for the hits, and
+    replacement_dict, for the patchable flag. Editing either starts from an empty cache.
+    """
+    replacements = json.dumps(sorted(replacement_dict.items()))
+    return hashlib.sha256(f"{rules.version}|{replacements}".encode("utf-8")).hexdigest()[:16]
+
+class ScanCache:
+    """
+    Fleet wide cache of scan results keyed by file content: SHA-256 of the content, rule set
+    version and the subset of rules the file was routed to. Third party code (Play Services,
+    OkHttp, AndroidX resources, ...) is byte identical across apps, so once a file was scanned
+    in any APK it is never matched again.
+
+    Lookups go straight to SQLite, from this process or a scan worker (see worker_args).
+    New results are queued and written by flush(), only from the process that owns the cache.
+    """
+
+    def __init__(self, db_path, rules_version, create=True):
+        """
+        :param db_path: SQLite database, shared by every run and every APK
+        :param rules_version: cache_version() of the rules; results of other rules or replacements are never returned
+        :param create: Create the table; scan workers open an existing database
+        """
+        self.db_path = db_path
+        self.rules_version = rules_version
+        self.connection = sqlite3.connect(db_path, timeout=30)
+        if create:
+            # WAL lets the workers and the other APKs of a batch read while results are written
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(SCHEMA)
+            self.connection.commit()
+        self.pending = []
+        # Results of this run, so identical files within one tree only cost one scan
+        self.recent = {}
+        self.stats = Counter()
+
+    def worker_args(self):
+        """Arguments a scan worker process needs to open the same cache read only."""
+        return self.db_path, self.rules_version
+
+    def view(self, rule_indices):
+        """Lookups and stores for files routed to these rules."""
+        return CacheView(self, ",".join(str(index) for index in rule_indices))
+
+    def lookup(self, digest, rule_subset, size=0):
+        """Return (hits, patchable) cached for the content, or None."""
+        key = (digest, rule_subset)
+        cached = self.recent.get(key)
+        if cached is None:
+            row = self.connection.execute(
+                "SELECT hits, patchable FROM scan_results WHERE digest = ? AND rules_version = ? AND rule_subset = ?",
+                (digest, self.rules_version, rule_subset)).fetchone()
+            if row is not None:
+                cached = [tuple(hit) for hit in json.loads(row[0])], bool(row[1])
+        if cached is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.stats["bytes_reused"] += size
+        return cached
+
+    def store(self, digest, rule_subset, hits, patchable):
+        self.recent[(digest, rule_subset)] = (hits, patchable)
+        self.pending.append((digest, rule_subset, hits, patchable))
+
+    def merge(self, pending, stats):
+        """Take over the new results and the counters of a scan worker."""
+        for digest, rule_subset, hits, patchable in pending:
+            self.store(digest, rule_subset, hits, patchable)
+        self.stats.update(stats)
+
+    def drain(self):
+        """Hand the queued results and counters to the process owning the cache, and reset them."""
+        pending, stats = self.pending, dict(self.stats)
+        self.pending, self.stats = [], Counter()
+        return pending, stats
+
+    def flush(self):
+        """Write the queued results in one transaction."""
+        if not self.pending:
+            return
+        rows = [(digest, self.rules_version, rule_subset, json.dumps(hits), int(patchable))
+                for digest, rule_subset, hits, patchable in self.pending]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO scan_results VALUES (?, ?, ?, ?, ?)", rows)
+        self.pending = []
+
+    def hit_rate(self):
+        looked_up = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / looked_up if looked_up else 0.0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+class CacheView:
+    def __init__(self, cache, rule_subset):
+        self.cache = cache
+        self.rule_subset = rule_subset
+
+    def get(self, digest, size=0):
+        return self.cache.lookup(digest, self.rule_subset, size)
+
+    def put(self, digest, hits, patchable):
+        self.cache.store(digest, self.rule_subset, hits, patchable)
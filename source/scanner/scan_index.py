@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+
+from source.operations.modify_code import replacement_dict
+from source.scanner.scan import CONTEXT_BEFORE
+
+# Carried forward findings keep their status; rescanned ones are compared with the last run
+NEW, UNCHANGED, FIXED = "new", "unchanged", "fixed"
+
+# Position of the hit line inside a context, see _match_content in scan.py
+CONTEXT_HIT_LINE = CONTEXT_BEFORE - 1
+
+def scan_version(rules, mode):
+    """
+    Everything that changes what a scan finds or patches besides the files themselves:
+    the rules, replacement_dict and the scan mode (decoded tree or APK entries, whose paths differ).
+    """
+    replacements = json.dumps(sorted(replacement_dict.items()))
+    return hashlib.sha256(f"{rules.version}|{replacements}|{mode}".encode("utf-8")).hexdigest()[:16]
+
+def unit_of(relpath):
+    # Findings inside resources.arsc or a dex (<unit>!/<inner path>) belong to the scanned entry
+    return relpath.split("!/", 1)[0]
+
+def finding_key(word, line_number, context):
+    """
+    What identifies a finding from one version to the next: its rule and the text of the hit line.
+    Line numbers are left out, so a finding that only moved is not reported as fixed and new.
+    """
+    lines = (context or "").splitlines()
+    offset = min(line_number - 1, CONTEXT_HIT_LINE)
+    line = lines[offset].strip() if line_number >= 1 and offset < len(lines) else (context or "").strip()
+    return word, line
+
+class ScanIndex:
+    """
+    Per package record of the content fingerprint and the findings of every scanned file,
+    from the last run. A file whose fingerprint did not change is not scanned again and its
+    findings are carried forward; the findings of the files that are scanned are marked new
+    or unchanged, and those that disappeared are reported as fixed.
+
+    Files are keyed by their path in the decoded tree, or in the APK for --from-apk scans.
+    """
+
+    def __init__(self, index_path, version, bases=(), reuse=True, report_dir=None):
+        """
+        :param index_path: JSON file of the package, rewritten by save()
+        :param version: scan_version() of this run; an index of another version is ignored
+        :param bases: Prefixes stripped from finding paths to get their relative path,
+                      e.g. the decoded directory + os.sep and "<apk>!/"
+        :param reuse: False rescans every file but still compares and saves the findings
+        :param report_dir: Report of this run, remembered as where new findings have their evidence
+        """
+        self.index_path = index_path
+        self.version = version
+        self.bases = list(bases)
+        self.reuse = reuse
+        self.report_dir = report_dir
+        # Earlier reports holding the evidence of this run's unchanged findings
+        self.origins = Counter()
+        self.previous_run = None
+        self.previous = {}
+        self.files = {}
+        self.stats = Counter()
+
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, "r", encoding="utf-8") as index_file:
+                    index = json.load(index_file)
+            except (OSError, ValueError):
+                index = {}
+            if index.get("version") == version:
+                self.previous = index.get("files", {})
+                self.previous_run = index.get("run")
+
+        # Findings of the last run not seen again yet, per file: finding key -> reports they come from
+        self.pending = {}
+        for unit, entry in self.previous.items():
+            pending = self.pending[unit] = {}
+            for _, word, line, context, origin in entry["findings"]:
+                pending.setdefault(finding_key(word, line, context), []).append(origin)
+
+    def relpath(self, filepath):
+        for base in self.bases:
+            if filepath.startswith(base):
+                return filepath[len(base):].replace(os.sep, "/")
+        return filepath.replace(os.sep, "/")
+
+    def carry(self, relpath, fingerprint, patch=False):
+        """
+        Register a file of this run. Return its findings of the last run as
+        (inner path, word, line, context) when its content did not change, or None when it has
+        to be scanned. Files that were patched last time are always scanned again when patching.
+        """
+        previous = self.previous.get(relpath)
+        self.files[relpath] = {"fingerprint": fingerprint, "patched": False, "findings": []}
+        if not self.reuse or previous is None or previous["fingerprint"] != fingerprint:
+            self.stats["files_rescanned"] += 1
+            return None
+        if patch and previous["patched"]:
+            self.stats["files_rescanned"] += 1
+            return None
+        self.stats["files_reused"] += 1
+        return [tuple(finding[:4]) for finding in previous["findings"]]
+
+    def set_patched(self, filepath):
+        entry = self.files.get(unit_of(self.relpath(filepath)))
+        if entry is not None:
+            entry["patched"] = True
+
+    def mark(self, search_word, filepath, line_number, context):
+        """Record a finding of this run and return its status, NEW or UNCHANGED."""
+        relpath = self.relpath(filepath)
+        unit = unit_of(relpath)
+        entry = self.files.setdefault(unit, {"fingerprint": None, "patched": False, "findings": []})
+
+        origins = self.pending.get(unit, {}).get(finding_key(search_word, line_number, context))
+        if origins:
+            # Unchanged findings keep pointing at the report that has their evidence
+            origin = origins.pop()
+            self.origins[origin] += 1
+            status = UNCHANGED
+        else:
+            origin = self.report_dir
+            status = NEW
+        entry["findings"].append([relpath, search_word, line_number, context, origin])
+        self.stats[status] += 1
+        return status
+
+    def fixed(self):
+        """Yield (relpath, word, line, context) of the last run's findings that are gone, once every hit is marked."""
+        for unit, pending in sorted(self.pending.items()):
+            for relpath, word, line, context, _ in self.previous[unit]["findings"]:
+                origins = pending.get(finding_key(word, line, context))
+                if origins:
+                    origins.pop()
+                    self.stats[FIXED] += 1
+                    yield relpath, word, line, context
+
+    def save(self, run):
+        """
+        Replace the package's index with the files and findings of this run.
+
+        :param run: Description of this run (APK, version, report directory), shown by the next one
+        """
+        index_dir = os.path.dirname(self.index_path)
+        if index_dir and not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        run = dict(run, time=time.strftime("%Y-%m-%d %H:%M:%S"))
+        # Written next to the index and swapped in, so a batch scanning two versions never reads half a file
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=index_dir or None)
+        with os.fdopen(fd, "w", encoding="utf-8") as index_file:
+            json.dump({"version": self.version, "run": run, "files": self.files}, index_file)
+        os.replace(temp_path, self.index_path)
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from source.operations.manifest_patch import is_signature_file
+from source.operations.zip_raw import (METHOD_DEFLATED, METHOD_STORED, LOCAL_HEADER_SIZE, central_record,
+                                       end_of_central_directory, new_entry, read_central_directory,
+                                       read_descriptor, read_local_header)
+from source.signing.jar_signature import jar_signature_files
+from source.signing.signing_block import (V2_BLOCK_ID, V3_BLOCK_ID, ChunkedDigest, apk_signing_block,
+                                          content_digest, v2_block, v3_block)
+from source.utils.process_pool import pool_context
+
+# Entry data is streamed through in blocks of this size, nothing is read whole
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# zipalign: stored data on 4 bytes, native libraries on a page so they can be mapped in place
+ALIGNMENT = 4
+LIBRARY_ALIGNMENT = 4096
+ALIGNMENT_EXTRA_ID = 0xD935
+
+DEFAULT_SCHEMES = (1, 2, 3)
+
+# Key of the current worker process, set once by _init_worker
+_worker_key = None
+
+class _SectionWriter:
+    # Writes the entries section and digests it for v2/v3 at the same time
+    def __init__(self, file):
+        self.file = file
+        self.position = 0
+        self.digest = ChunkedDigest()
+
+    def write(self, data):
+        self.file.write(data)
+        self.digest.update(data)
+        self.position += len(data)
+
+def _strip_alignment(extra):
+    # Extra fields without previous alignment padding (0xD935 fields or zipalign's zero bytes)
+    kept, position = b"", 0
+    while position + 4 <= len(extra):
+        field_id, size = struct.unpack_from("<HH", extra, position)
+        if field_id == 0 or position + 4 + size > len(extra):
+            break
+        if field_id != ALIGNMENT_EXTRA_ID:
+            kept += extra[position:position + 4 + size]
+        position += 4 + size
+    return kept
+
+def aligned_local_header(local_header, entry, offset):
+    """
+    Return the local header of an entry written at offset, with the extra field padded
+    so stored data starts on ALIGNMENT (LIBRARY_ALIGNMENT for .so files), like zipalign -p.
+    """
+    if entry.method != METHOD_STORED:
+        return local_header
+    name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+    name_end = LOCAL_HEADER_SIZE + name_length
+    extra = _strip_alignment(local_header[name_end:name_end + extra_length])
+
+    alignment = LIBRARY_ALIGNMENT if entry.name.endswith(".so") else ALIGNMENT
+    data_start = offset + name_end + len(extra)
+    if data_start % alignment:
+        padding = (alignment - (data_start + 6) % alignment) % alignment
+        extra += struct.pack("<HHH", ALIGNMENT_EXTRA_ID, 2 + padding, alignment) + b"\0" * padding
+    return local_header[:26] + struct.pack("<HH", name_length, len(extra)) + local_header[LOCAL_HEADER_SIZE:name_end] + extra
+
+def _copy_entry(src, entry, writer, with_digest):
+    # Copy the compressed data as is; the SHA-256 of the uncompressed content is computed on the way for v1
+    if entry.method not in (METHOD_STORED, METHOD_DEFLATED):
+        raise ValueError(f"Unsupported compression method {entry.method} for {entry.name}")
+    content_hash = hashlib.sha256() if with_digest else None
+    decompressor = zlib.decompressobj(-15) if with_digest and entry.method == METHOD_DEFLATED else None
+
+    remaining = entry.compressed_size
+    while remaining:
+        data = src.read(min(COPY_CHUNK_SIZE, remaining))
+        if not data:
+            raise ValueError(f"Truncated entry {entry.name}")
+        remaining -= len(data)
+        writer.write(data)
+        if content_hash:
+            content_hash.update(decompressor.decompress(data) if decompressor else data)
+    if decompressor:
+        content_hash.update(decompressor.flush())
+    return content_hash.digest() if content_hash else None
+
+def sign_apk_file(apk_path, output_path, signing_key, schemes=DEFAULT_SCHEMES):
+    """
+    Zipalign and sign an APK in a single pass over its entries.
+
+    Entries are copied without recompression; v1 digests of their content and the
+    v2/v3 chunk digests of the written archive are computed while copying. Old v1
+    signature files and any previous APK Signing Block are dropped.
+
+    :param apk_path: Unsigned (or previously signed) APK
+    :param output_path: Signed APK, may be apk_path itself
+    :param signing_key: SigningKey from load_signing_key()
+    :param schemes: Signature schemes to write, any of 1, 2, 3
+    """
+    fd, temp_path = tempfile.mkstemp(suffix=".apk", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with open(apk_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            entries = [entry for entry in read_central_directory(src) if not is_signature_file(entry.name)]
+            writer = _SectionWriter(dst)
+            records, entry_digests = [], []
+
+            for entry in sorted(entries, key=lambda e: e.header_offset):
+                offset = writer.position
+                writer.write(aligned_local_header(read_local_header(src, entry), entry, offset))
+                is_file = not entry.name.endswith("/")
+                digest = _copy_entry(src, entry, writer, 1 in schemes and is_file)
+                writer.write(read_descriptor(src, entry))
+                records.append(central_record(entry, offset))
+                if digest:
+                    entry_digests.append((entry.name, digest))
+
+            if 1 in schemes:
+                apk_schemes = [scheme for scheme in schemes if scheme != 1]
+                for name, content in jar_signature_files(entry_digests, signing_key, apk_schemes).items():
+                    local, record = new_entry(name, content, writer.position)
+                    writer.write(local)
+                    records.append(record)
+
+            central_directory = b"".join(records)
+            cd_offset = writer.position
+            pairs = []
+            if 2 in schemes or 3 in schemes:
+                # The digested end of central directory points at the signing block, i.e. where the CD would start
+                cd_digest, eocd_digest = ChunkedDigest(), ChunkedDigest()
+                cd_digest.update(central_directory)
+                eocd_digest.update(end_of_central_directory(len(records), len(central_directory), cd_offset))
+                digest = content_digest(writer.digest, cd_digest, eocd_digest)
+                if 2 in schemes:
+                    pairs.append((V2_BLOCK_ID, v2_block(signing_key, digest, with_v3=3 in schemes)))
+                if 3 in schemes:
+                    pairs.append((V3_BLOCK_ID, v3_block(signing_key, digest)))
+                signing_block = apk_signing_block(pairs)
+                dst.write(signing_block)
+                cd_offset += len(signing_block)
+
+            dst.write(central_directory)
+            dst.write(end_of_central_directory(len(records), len(central_directory), cd_offset))
+        # mkstemp creates the file 0600; the signed APK keeps the permissions of the one it was built from
+        shutil.copymode(apk_path, temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _init_worker(signing_key):
+    global _worker_key
+    _worker_key = signing_key
+
+def _sign_one(apk_path, schemes):
+    try:
+        sign_apk_file(apk_path, apk_path, _worker_key, schemes)
+        return None
+    except (OSError, ValueError) as e:
+        return str(e)
+
+def sign_apk_files(apk_paths, signing_key, workers=None, schemes=DEFAULT_SCHEMES):
+    """
+    Sign many APKs in place with one key, across worker processes.
+    The key is handed to each worker once instead of reopening the keystore per APK.
+
+    :return: {apk path: error message or None}
+    """
+    workers = min(workers or os.cpu_count() or 1, len(apk_paths))
+    if workers <= 1:
+        _init_worker(signing_key)
+        return {apk_path: _sign_one(apk_path, schemes) for apk_path in apk_paths}
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(), initializer=_init_worker,
+                             initargs=(signing_key,)) as executor:
+        futures = {apk_path: executor.submit(_sign_one, apk_path, schemes) for apk_path in apk_paths}
+        return {apk_path: future.result() for apk_path, future in futures.items()}
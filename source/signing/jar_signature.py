@@ -0,0 +1,63 @@
+import base64
+import hashlib
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.serialization import pkcs7
+
+# Manifest lines are at most 72 bytes, longer ones continue on lines starting with a space
+MAX_LINE_LENGTH = 72
+CREATED_BY = "apkmech-tools"
+
+SIGNATURE_NAME = "CERT"
+
+def _header(line):
+    # One manifest header, wrapped to the JAR line length
+    data = line.encode("utf-8")
+    parts = [data[:MAX_LINE_LENGTH]]
+    data = data[MAX_LINE_LENGTH:]
+    while data:
+        parts.append(b" " + data[:MAX_LINE_LENGTH - 1])
+        data = data[MAX_LINE_LENGTH - 1:]
+    return b"\r\n".join(parts) + b"\r\n"
+
+def _b64(digest):
+    return base64.b64encode(digest).decode("ascii")
+
+def jar_signature_files(entry_digests, signing_key, apk_signed_schemes=()):
+    """
+    Build the v1 (JAR) signature files.
+
+    :param entry_digests: (entry name, SHA-256 of the uncompressed content) in archive order
+    :param signing_key: SigningKey used for the PKCS#7 signature
+    :param apk_signed_schemes: Newer schemes the APK also carries (2, 3); recorded in the
+                               .SF so verifiers reject the APK if those blocks are stripped
+    :return: {entry name: content} for MANIFEST.MF, CERT.SF and the signature block file
+    """
+    manifest = _header("Manifest-Version: 1.0") + _header(f"Created-By: 1.0 ({CREATED_BY})") + b"\r\n"
+    sections = []
+    for name, digest in entry_digests:
+        section = _header(f"Name: {name}") + _header(f"SHA-256-Digest: {_b64(digest)}") + b"\r\n"
+        manifest += section
+        sections.append((name, section))
+
+    signature_file = (_header("Signature-Version: 1.0") + _header(f"Created-By: 1.0 ({CREATED_BY})")
+                      + _header(f"SHA-256-Digest-Manifest: {_b64(hashlib.sha256(manifest).digest())}"))
+    if apk_signed_schemes:
+        signature_file += _header(f"X-Android-APK-Signed: {', '.join(str(s) for s in apk_signed_schemes)}")
+    signature_file += b"\r\n"
+    for name, section in sections:
+        signature_file += (_header(f"Name: {name}")
+                           + _header(f"SHA-256-Digest: {_b64(hashlib.sha256(section).digest())}") + b"\r\n")
+
+    builder = pkcs7.PKCS7SignatureBuilder().set_data(signature_file).add_signer(
+        signing_key.certificate, signing_key.private_key, hashes.SHA256())
+    for certificate in signing_key.certificates[1:]:
+        builder = builder.add_certificate(certificate)
+    signature_block = builder.sign(serialization.Encoding.DER, [
+        pkcs7.PKCS7Options.DetachedSignature, pkcs7.PKCS7Options.Binary, pkcs7.PKCS7Options.NoAttributes])
+
+    return {
+        "META-INF/MANIFEST.MF": manifest,
+        f"META-INF/{SIGNATURE_NAME}.SF": signature_file,
+        f"META-INF/{SIGNATURE_NAME}.{signing_key.v1_extension}": signature_block,
+    }
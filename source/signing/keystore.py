@@ -0,0 +1,86 @@
+import os
+import threading
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+# Signature algorithm ids of the APK signature schemes v2/v3 (SHA2-256 variants)
+SIGNATURE_RSA_PKCS1_V1_5_WITH_SHA256 = 0x0103
+SIGNATURE_ECDSA_WITH_SHA256 = 0x0201
+
+# Keys already loaded by this process, keystore decryption is the slow part
+_loaded_keys = {}
+_loaded_keys_lock = threading.Lock()
+
+class SigningKey:
+    """
+    Private key and certificate chain of one keystore alias, ready to sign.
+    Pickles as DER bytes so worker processes get the key without reopening the keystore.
+    """
+
+    def __init__(self, private_key, certificates):
+        self.private_key = private_key
+        self.certificates = certificates
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            self.algorithm_id = SIGNATURE_RSA_PKCS1_V1_5_WITH_SHA256
+            self.v1_extension = "RSA"
+        elif isinstance(private_key, ec.EllipticCurvePrivateKey):
+            self.algorithm_id = SIGNATURE_ECDSA_WITH_SHA256
+            self.v1_extension = "EC"
+        else:
+            raise ValueError(f"Unsupported signing key type: {type(private_key).__name__}")
+
+    @property
+    def certificate(self):
+        return self.certificates[0]
+
+    def sign(self, data):
+        """Signature of data with the algorithm of algorithm_id."""
+        if self.algorithm_id == SIGNATURE_RSA_PKCS1_V1_5_WITH_SHA256:
+            return self.private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        return self.private_key.sign(data, ec.ECDSA(hashes.SHA256()))
+
+    def public_key_der(self):
+        return self.certificate.public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    def certificates_der(self):
+        return [certificate.public_bytes(serialization.Encoding.DER) for certificate in self.certificates]
+
+    def __getstate__(self):
+        key_der = self.private_key.private_bytes(serialization.Encoding.DER, serialization.PrivateFormat.PKCS8,
+                                                 serialization.NoEncryption())
+        return {"key": key_der, "certificates": self.certificates_der()}
+
+    def __setstate__(self, state):
+        self.__init__(serialization.load_der_private_key(state["key"], password=None),
+                      [x509.load_der_x509_certificate(der) for der in state["certificates"]])
+
+def load_signing_key(keystore_path, key_alias, keystore_password):
+    """
+    Load the key of an alias from a PKCS#12 keystore (what keytool writes by default,
+    including sign_key.jks). Each keystore/alias is decrypted once per process.
+    Raises ValueError when the keystore cannot be read (legacy JKS format, wrong
+    password) or has no key for the alias.
+    """
+    cache_key = (os.path.abspath(keystore_path), key_alias, keystore_password)
+    with _loaded_keys_lock:
+        if cache_key in _loaded_keys:
+            return _loaded_keys[cache_key]
+
+        with open(keystore_path, "rb") as keystore_file:
+            keystore = pkcs12.load_pkcs12(keystore_file.read(), keystore_password.encode("utf-8"))
+
+        if keystore.key is None or keystore.cert is None:
+            raise ValueError(f"No private key found in {keystore_path}")
+        alias = keystore.cert.friendly_name
+        # keytool stores aliases in lower case
+        if alias is not None and alias.decode("utf-8", errors="replace").lower() != key_alias.lower():
+            raise ValueError(f"Alias {key_alias} not found in {keystore_path}")
+
+        chain = [keystore.cert.certificate] + [extra.certificate for extra in keystore.additional_certs]
+        signing_key = SigningKey(keystore.key, chain)
+        _loaded_keys[cache_key] = signing_key
+        return signing_key
@@ -0,0 +1,90 @@
+import hashlib
+import struct
+
+# APK Signing Block layout and ids (APK Signature Scheme v2/v3)
+APK_SIGNING_BLOCK_MAGIC = b"APK Sig Block 42"
+V2_BLOCK_ID = 0x7109871a
+V3_BLOCK_ID = 0xf05368c0
+
+# v2 attribute telling verifiers a v3 signature must be present, against stripping
+STRIPPING_PROTECTION_ATTRIBUTE_ID = 0xbeeff00d
+
+# v3 signatures apply from Android 9 (API 28) onwards
+V3_MIN_SDK = 28
+V3_MAX_SDK = 0x7FFFFFFF
+
+# Content is digested in 1 MiB chunks, the digests of the chunks are digested again
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+class ChunkedDigest:
+    """
+    Streaming SHA-256 chunk digests of one section of the APK, fed while the section is written.
+    At most one chunk is buffered.
+    """
+
+    def __init__(self):
+        self.digests = []
+        self.pending = bytearray()
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(DIGEST_CHUNK_SIZE - len(self.pending), len(view))
+            self.pending += view[:take]
+            view = view[take:]
+            if len(self.pending) == DIGEST_CHUNK_SIZE:
+                self._flush()
+
+    def _flush(self):
+        chunk_hash = hashlib.sha256(b"\xa5" + struct.pack("<I", len(self.pending)))
+        chunk_hash.update(self.pending)
+        self.digests.append(chunk_hash.digest())
+        self.pending = bytearray()
+
+    def finish(self):
+        if self.pending:
+            self._flush()
+        return self.digests
+
+def content_digest(*sections):
+    """
+    Top level digest over the chunk digests of the sections, in order: entries,
+    central directory, and end of central directory (pointing at the signing block).
+    """
+    digests = []
+    for section in sections:
+        digests.extend(section.finish())
+    top = hashlib.sha256(b"\x5a" + struct.pack("<I", len(digests)))
+    for digest in digests:
+        top.update(digest)
+    return top.digest()
+
+def _prefixed(data):
+    return struct.pack("<I", len(data)) + data
+
+def _sequence(items):
+    return _prefixed(b"".join(_prefixed(item) for item in items))
+
+def _signer(signing_key, digest, extra_signed=b"", extra_signer=b"", attributes=()):
+    # signed data = digests, certificates, [v3 sdk range], attributes; the signer wraps it with its signature
+    digests = _sequence([struct.pack("<I", signing_key.algorithm_id) + _prefixed(digest)])
+    signed_data = digests + _sequence(signing_key.certificates_der()) + extra_signed + _sequence(attributes)
+    signatures = _sequence([struct.pack("<I", signing_key.algorithm_id) + _prefixed(signing_key.sign(signed_data))])
+    return _prefixed(signed_data) + extra_signer + signatures + _prefixed(signing_key.public_key_der())
+
+def v2_block(signing_key, digest, with_v3=False):
+    attributes = [struct.pack("<II", STRIPPING_PROTECTION_ATTRIBUTE_ID, 3)] if with_v3 else []
+    return _sequence([_signer(signing_key, digest, attributes=attributes)])
+
+def v3_block(signing_key, digest):
+    sdk_range = struct.pack("<II", V3_MIN_SDK, V3_MAX_SDK)
+    return _sequence([_signer(signing_key, digest, extra_signed=sdk_range, extra_signer=sdk_range)])
+
+def apk_signing_block(pairs):
+    """
+    Assemble an APK Signing Block from (id, value) pairs.
+    It sits right before the central directory.
+    """
+    body = b"".join(struct.pack("<QI", len(value) + 4, block_id) + value for block_id, value in pairs)
+    size = len(body) + 8 + len(APK_SIGNING_BLOCK_MAGIC)
+    return struct.pack("<Q", size) + body + struct.pack("<Q", size) + APK_SIGNING_BLOCK_MAGIC
@@ -0,0 +1,83 @@
+import contextvars
+import threading
+from contextlib import contextmanager, nullcontext
+
+from rich.markup import escape
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, SpinnerColumn, TextColumn
+
+# Set by the stage scheduler so its worker threads may show displays for the main thread
+_live_allowed = contextvars.ContextVar("live_allowed", default=None)
+
+# rich allows a single live display at a time; stages running side by side take turns
+_live_lock = threading.Lock()
+
+# Characters of a tool output line shown next to a spinner
+STATUS_LINE_CHARS = 80
+
+def live_display_allowed():
+    '''
+    Whether the current code may show a spinner or progress bar: on the main thread, or in a
+    stage the main thread scheduled. Batch mode runs several APKs in worker threads, whose
+    output goes to log files, so they never show one.
+    '''
+    allowed = _live_allowed.get()
+    if allowed is None:
+        return threading.current_thread() is threading.main_thread()
+    return allowed
+
+def allow_live_display(allowed):
+    '''Allow or forbid live displays for the current context and the threads it starts; returns a reset token.'''
+    return _live_allowed.set(allowed)
+
+def reset_live_display(token):
+    _live_allowed.reset(token)
+
+@contextmanager
+def _exclusive(display):
+    if not _live_lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        with display as shown:
+            yield shown
+    finally:
+        _live_lock.release()
+
+def status(console, message, spinner="dots"):
+    '''
+    Show a rich spinner when live displays are allowed (see live_display_allowed)
+    and no other one is showing.
+    '''
+    if not live_display_allowed():
+        return nullcontext()
+    return _exclusive(console.status(message, spinner=spinner))
+
+@contextmanager
+def live_progress(console, message):
+    '''
+    Live progress bar with a findings counter, under the same rules as status().
+    Yields update(completed=..., total=..., findings=...); without a display it does nothing.
+    '''
+    if not live_display_allowed():
+        yield lambda **fields: None
+        return
+    columns = (SpinnerColumn(), TextColumn("{task.description}"), BarColumn(), MofNCompleteColumn(),
+               TextColumn("[yellow]{task.fields[findings]}[/yellow] finding(s)"))
+    with _exclusive(Progress(*columns, console=console, transient=True)) as progress:
+        if progress is None:
+            yield lambda **fields: None
+            return
+        task = progress.add_task(message, total=None, findings=0)
+        yield lambda **fields: progress.update(task, **fields)
+
+@contextmanager
+def status_lines(console, message, spinner="dots"):
+    '''
+    Spinner like status() that shows the last line of a running tool next to the message.
+    Yields update(line) for run_tool's progress; without a display it does nothing.
+    '''
+    with status(console, message, spinner) as shown:
+        if shown is None:
+            yield lambda line: None
+            return
+        yield lambda line: shown.update(f"{message} [dim]{escape(line[:STATUS_LINE_CHARS])}[/dim]")
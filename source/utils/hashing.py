@@ -0,0 +1,17 @@
+import hashlib
+
+# Read files in 1 MiB blocks so large APKs never sit in memory at once
+CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(filepath, chunk_size=CHUNK_SIZE):
+    """
+    Return the hex SHA-256 digest of a file, hashed in streaming chunks.
+
+    :param filepath: Path of the file to hash
+    :param chunk_size: Number of bytes read per block
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
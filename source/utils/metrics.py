@@ -0,0 +1,102 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_DIVISOR = 1024 if sys.platform == "darwin" else 1
+
+def _peak_rss_kb(who):
+    if resource is None:
+        return None
+    return resource.getrusage(who).ru_maxrss // RSS_DIVISOR
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+class RunMetrics:
+    """
+    Per-stage instrumentation of one APK run.
+
+    Every stage appends one JSON line to metrics_path with its wall time, CPU time
+    (this thread, and reaped child processes such as apktool or pool workers), the
+    peak RSS so far and the counters the stage filled in (files and bytes scanned,
+    hits, images rendered, ...).
+    """
+
+    def __init__(self, metrics_path, apk_path, profile_dir=None):
+        self.metrics_path = metrics_path
+        self.apk_path = apk_path
+        self.profile_dir = profile_dir
+        self.stages = []
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(metrics_path)), exist_ok=True)
+        if os.path.exists(metrics_path):
+            os.remove(metrics_path)
+
+    @contextmanager
+    def stage(self, name, profile=False):
+        """
+        Measure the enclosed block as one stage and yield a dict for its counters.
+
+        :param name: Stage name (info, decompile, scan, screenshots, recompile, sign, ...)
+        :param profile: Python stage; with a profile_dir its cProfile stats are dumped to <profile_dir>/<name>.prof
+        """
+        counters = {}
+        profiler = self._start_profiler() if profile and self.profile_dir else None
+        started_wall = time.perf_counter()
+        started_cpu = time.thread_time()
+        started_children = _children_cpu()
+        try:
+            yield counters
+        finally:
+            record = {
+                "apk": self.apk_path,
+                "stage": name,
+                "wall_seconds": round(time.perf_counter() - started_wall, 4),
+                "cpu_seconds": round(time.thread_time() - started_cpu, 4),
+                "children_cpu_seconds": round(_children_cpu() - started_children, 4),
+                "peak_rss_kb": _peak_rss_kb(resource.RUSAGE_SELF) if resource else None,
+                "children_peak_rss_kb": _peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None,
+            }
+            record.update(counters)
+            if profiler is not None:
+                profiler.disable()
+                profile_path = os.path.join(self.profile_dir, f"{name}.prof")
+                profiler.dump_stats(profile_path)
+                record["profile"] = profile_path
+            self._write(record)
+
+    def _start_profiler(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another thread is already profiling (batch mode), this stage goes unprofiled
+            return None
+        return profiler
+
+    def _write(self, record):
+        with self.lock:
+            self.stages.append(record)
+            with open(self.metrics_path, "a", encoding="utf-8") as metrics_file:
+                metrics_file.write(json.dumps(record) + "\n")
+
+    def wall_times(self):
+        """{stage name: wall seconds}, summed when a stage ran more than once."""
+        times = {}
+        for record in self.stages:
+            times[record["stage"]] = round(times.get(record["stage"], 0) + record["wall_seconds"], 4)
+        return times
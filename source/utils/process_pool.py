@@ -0,0 +1,17 @@
+import multiprocessing
+import threading
+
+def pool_context():
+    """
+    Start method for a ProcessPoolExecutor created by the calling thread.
+
+    batch.py runs APKs in threads, and forking while other threads hold locks (logging,
+    stdout, the decode cache index) can leave a worker blocked on a lock nobody releases.
+    Pools created off the main thread therefore spawn fresh interpreters; the main thread
+    keeps the platform default.
+
+    :return: multiprocessing context for mp_context=, or None for the default
+    """
+    if threading.current_thread() is threading.main_thread():
+        return None
+    return multiprocessing.get_context("spawn")
@@ -0,0 +1,184 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+# Lines of output kept in memory for error messages and the output image; the log file has all of them
+OUTPUT_TAIL_LINES = 200
+
+# Seconds between two checks of the timeout and the memory limit
+WATCH_INTERVAL = 0.5
+
+# External tool settings read from tools_config.json, with their defaults
+DEFAULT_TOOL_OPTIONS = {
+    "java": "java",
+    # JVM maximum heap (-Xmx) and processors the JVM sizes its GC and JIT threads for
+    "jvm_heap_mb": None,
+    "jvm_threads": None,
+    # Extra JVM flags, e.g. "-XX:TieredStopAtLevel=1" for a faster start on small APKs
+    "jvm_options": [],
+    # apktool -j, threads decoding and building resources and smali
+    "apktool_jobs": None,
+    # Temporary files of the JVM and its tools (aapt) go here instead of the system temp directory
+    "tool_temp_dir": None,
+    # An apktool run is stopped after this many seconds, or above this resident memory (Linux only)
+    "tool_timeout_seconds": None,
+    "tool_memory_limit_mb": None,
+    # Draw the apktool output as an image in images evidence mode
+    "tool_output_image": True,
+}
+
+class ToolError(RuntimeError):
+    """An external tool failed, or was stopped because it ran too long or used too much memory."""
+
+class ToolRun:
+    """Outcome of run_tool: exit code, the last lines of output and where the full output was logged."""
+
+    def __init__(self, returncode, output, log_path, seconds):
+        self.returncode = returncode
+        self.output = output
+        self.log_path = log_path
+        self.seconds = seconds
+
+def tool_options(config=None):
+    """The external tool settings of tools_config.json, defaults filled in."""
+    config = config or {}
+    return {key: config.get(key, default) for key, default in DEFAULT_TOOL_OPTIONS.items()}
+
+def apktool_paths():
+    """Paths of the apktool jar and of the Windows wrapper script installed by setup.py."""
+    apktool_dir = os.path.join(os.getcwd(), "tools", "apktool")
+    return os.path.join(apktool_dir, "apktool.jar"), os.path.join(apktool_dir, "apktool.bat")
+
+def apktool_path():
+    """The apktool file that runs: the wrapper script on Windows, the jar elsewhere."""
+    jar_path, bat_path = apktool_paths()
+    return bat_path if os.name == 'nt' else jar_path
+
+def jvm_flags(options):
+    flags = []
+    if options["jvm_heap_mb"]:
+        flags.append(f"-Xmx{options['jvm_heap_mb']}m")
+    if options["jvm_threads"]:
+        flags.append(f"-XX:ActiveProcessorCount={options['jvm_threads']}")
+    if options["tool_temp_dir"]:
+        flags.append(f"-Djava.io.tmpdir={options['tool_temp_dir']}")
+    return flags + list(options["jvm_options"] or [])
+
+def apktool_command(options, action, args):
+    """
+    Return (command, environment) running apktool with the JVM and apktool settings.
+    The Windows wrapper script gets its JVM flags through JAVA_TOOL_OPTIONS.
+
+    :param options: tool_options()
+    :param action: "d" (decode) or "b" (build)
+    :param args: apktool arguments after the action
+    """
+    args = list(args)
+    if options["apktool_jobs"]:
+        args += ["-j", str(options["apktool_jobs"])]
+
+    env = dict(os.environ)
+    if options["tool_temp_dir"]:
+        os.makedirs(options["tool_temp_dir"], exist_ok=True)
+        env["TMPDIR"] = env["TEMP"] = env["TMP"] = options["tool_temp_dir"]
+
+    if os.name == 'nt':
+        env["JAVA_TOOL_OPTIONS"] = " ".join(jvm_flags(options))
+        return [apktool_path(), action] + args, env
+    return [options["java"]] + jvm_flags(options) + ["-jar", apktool_path(), action] + args, env
+
+def _rss_mb(pid):
+    # Resident memory of a process from /proc; None where there is no /proc
+    try:
+        with open(f"/proc/{pid}/status", "r") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        return None
+    return None
+
+def _stop(process):
+    # The tool's own children (aapt, ...) go with it
+    try:
+        if os.name == 'nt':
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _watch(process, timeout, memory_limit_mb, stopped):
+    started = time.perf_counter()
+    while True:
+        try:
+            process.wait(timeout=WATCH_INTERVAL)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+        if timeout and time.perf_counter() - started > timeout:
+            stopped.append(f"timed out after {timeout} seconds")
+        elif memory_limit_mb and (_rss_mb(process.pid) or 0) > memory_limit_mb:
+            stopped.append(f"went over the {memory_limit_mb} MB memory limit")
+        if stopped:
+            _stop(process)
+            return
+
+def run_tool(command, log_path=None, timeout=None, memory_limit_mb=None, env=None, progress=None):
+    """
+    Run an external tool, streaming its output (stdout and stderr) line by line to a log file
+    instead of holding it in memory. Only the last OUTPUT_TAIL_LINES lines are kept.
+
+    :param command: Argument list, run without a shell
+    :param log_path: File receiving the whole output, or None
+    :param timeout: Seconds after which the tool is killed, or None
+    :param memory_limit_mb: Resident memory above which the tool is killed (Linux), or None
+    :param env: Environment of the tool, defaults to this process's
+    :param progress: Optional callable(line) called for every non empty output line
+    :return: ToolRun, with exit code 127 when the tool cannot be started;
+             raises ToolError when the tool was killed for the timeout or the memory limit
+    """
+    if log_path:
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    log_file = open(log_path, "w", encoding="utf-8") if log_path else None
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    started = time.perf_counter()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                   text=True, encoding="utf-8", errors="replace", env=env,
+                                   start_new_session=os.name != 'nt')
+    except OSError as e:
+        # Like a shell would: the tool is missing or not executable, exit code 127
+        if log_file:
+            log_file.write(f"{e}\n")
+            log_file.close()
+        return ToolRun(127, str(e), log_path, 0.0)
+
+    stopped = []
+    watcher = threading.Thread(target=_watch, args=(process, timeout, memory_limit_mb, stopped), daemon=True)
+    watcher.start()
+    try:
+        for line in process.stdout:
+            if log_file:
+                log_file.write(line)
+            line = line.rstrip("\n")
+            tail.append(line)
+            if progress and line.strip():
+                progress(line.strip())
+        returncode = process.wait()
+    finally:
+        if process.poll() is None:
+            _stop(process)
+            process.wait()
+        process.stdout.close()
+        if log_file:
+            log_file.close()
+        watcher.join()
+
+    if stopped:
+        where = f", output in {log_path}" if log_path else ""
+        raise ToolError(f"{os.path.basename(command[0])} {stopped[0]}{where}")
+    return ToolRun(returncode, "\n".join(tail), log_path, round(time.perf_counter() - started, 4))
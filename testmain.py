@@ -2,18 +2,19 @@ import os
 import json
 import sys
 from rich.console import Console
-from contextlib import redirect_stdout, redirect_stderr
-from fpdf import FPDF
 
 # Importing functions from source directories
 from source.ui.banner import banner
 from source.operations.decompile_apk import decompile_apk
 from source.operations.recompile_apk import recompile_apk
+from source.operations.report import apk_info, write_report
 from source.operations.modify_code import modify_code
-from source.operations.screenshot import take_screenshot
 from source.operations.sign_apk import sign_apk
+from source.utils.metrics import RunMetrics
+from source.utils.tool_runner import ToolError
 
 # Importing functions from APK_INFO directories
+from source.APK_INFO.apk_metadata import load_apk_metadata
 from source.APK_INFO.apk_activities import get_apk_activities
 from source.APK_INFO.apk_info import get_apk_info
 from source.APK_INFO.apk_permissions import get_apk_permissions
@@ -37,120 +38,83 @@ search_words_before_modification = [
     'websettings.setAllowFileAccess(true)', 'setPluginState()', '.firebaseio.com'
 ]
 
-# Generate PDF report from the log file
-def generate_pdf_report(log_file_path):
-    try:
-        # Initialize PDF object
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-
-        # Set title and header
-        pdf.set_font('Arial', 'B', 16)
-        pdf.cell(200, 10, txt="APK Process Report", ln=True, align='C')
-
-        # Set font for content
-        pdf.set_font('Arial', '', 12)
-
-        # Read the log file and write its content to the PDF
-        if os.path.exists(log_file_path):
-            with open(log_file_path, 'r', encoding='utf-8') as log_file:  # Use 'utf-8' encoding
-                for line in log_file:
-                    # Handle encoding errors gracefully by replacing unsupported characters
-                    sanitized_line = line.encode('latin-1', 'replace').decode('latin-1')
-                    pdf.multi_cell(0, 10, sanitized_line)
-        else:
-            console.print(f"[red][!][/red] [bold red]Error:[/bold red] Log file not found!")
-
-        # Save the PDF
-        pdf_output_path = os.path.join(report_base_dir, 'apk_process_report.pdf')
-        pdf.output(pdf_output_path)
-
-        console.print(f"[green][+][/green] [bold green]PDF report saved as:[/bold green] {pdf_output_path}")
-    
-    except Exception as e:
-        console.print(f"[red][!][/red] [bold red]Failed to generate PDF report:[/bold red] {e}")
-
-
-# Tee class for sending output to both the console and the log file
-class Tee:
-    def __init__(self, log_file, console):
-        self.log_file = log_file
-        self.console = console
-
-    def write(self, data):
-        self.log_file.write(data)
-        self.console.write(data)
-
-    def flush(self):
-        self.log_file.flush()
-        self.console.flush()
-
 # Collect APK information
 def collect_apk_info(apk_path):
-    get_apk_info(apk_path)
-    get_apk_activities(apk_path)
-    get_apk_permissions(apk_path)
-    get_apk_services(apk_path)
+    # Parse the APK once and hand the same metadata to every table
+    metadata = load_apk_metadata(apk_path, os.path.join(report_base_dir, '.cache', 'metadata'))
+    get_apk_info(metadata)
+    get_apk_activities(metadata)
+    get_apk_permissions(metadata)
+    get_apk_services(metadata)
     console.print("\n")
+    return metadata
 
 
 def main():
-    log_file_path = os.path.join(report_base_dir, 'apk_process_log.txt')
-
-    # Open the log file
-    with open(log_file_path, 'w', encoding='utf-8') as log_file:  # Use 'utf-8' encoding for the log file
-        # Create a Tee object that writes to both the console and the log file
-        tee_stdout = Tee(log_file, sys.stdout)
-        tee_stderr = Tee(log_file, sys.stderr)
-
-        # Redirect stdout and stderr to both the log file and console
-        with redirect_stdout(tee_stdout), redirect_stderr(tee_stderr):
-            # Load tool paths from configuration file
-            try:
-                with open('tools_config.json', 'r') as config_file:
-                    config = json.load(config_file)
-            except FileNotFoundError:
-                console.print("[red][!][/red] [bold red]Error:[/bold red] tools_config.json file not found!")
-                sys.exit(1)
-
-            banner()
-
-            # Check if APK path is provided as a command-line argument
-            if len(sys.argv) < 2:
-                console.print("[red][-][/red] [bold red]Error:[/bold red] APK path is required!", style="bold red")
-                sys.exit(1)
-
-            apk_path = sys.argv[1]
-            apk_name = os.path.splitext(os.path.basename(apk_path))[0]
-            output_dir = os.path.join(report_base_dir, apk_name)
-
-            # Collect APK Info
-            console.print("[cyan][+][/cyan][bold cyan] Collecting APK info ...[/bold cyan]")
-            collect_apk_info(apk_path)
-
-            # Decompile APK
-            console.print("[cyan][+][/cyan][bold cyan] Decompiling APK...[/bold cyan]")
-            decompile_img_path = os.path.join(report_base_dir, 'decompile.png')
-            decompile_apk(apk_path, output_dir, decompile_img_path)
+    # Load tool paths from configuration file
+    try:
+        with open('tools_config.json', 'r') as config_file:
+            config = json.load(config_file)
+    except FileNotFoundError:
+        console.print("[red][!][/red] [bold red]Error:[/bold red] tools_config.json file not found!")
+        sys.exit(1)
+
+    banner()
+
+    # Check if APK path is provided as a command-line argument
+    if len(sys.argv) < 2:
+        console.print("[red][-][/red] [bold red]Error:[/bold red] APK path is required!", style="bold red")
+        sys.exit(1)
+
+    apk_path = sys.argv[1]
+    apk_name = os.path.splitext(os.path.basename(apk_path))[0]
+    output_dir = os.path.join(report_base_dir, apk_name)
+    # The report is built from the stage timings and the APK info, not from the console output
+    metrics = RunMetrics(os.path.join(report_base_dir, 'metrics.jsonl'), apk_path)
+    summary = {"apk": apk_path, "status": "failed", "findings": 0, "files_patched": 0}
 
+    try:
+        # Collect APK Info
+        console.print("[cyan][+][/cyan][bold cyan] Collecting APK info ...[/bold cyan]")
+        with metrics.stage("info"):
+            summary["apk_info"] = apk_info(collect_apk_info(apk_path))
+
+        # Decompile APK
+        console.print("[cyan][+][/cyan][bold cyan] Decompiling APK...[/bold cyan]")
+        decompile_img_path = os.path.join(report_base_dir, 'decompile.png')
+        with metrics.stage("decompile"):
+            decompile_apk(apk_path, output_dir, decompile_img_path)
 
-            # Recompile the APK
-            console.print("[cyan][+][/cyan][bold cyan] Recompiling APK ...[/bold cyan]")
-            recompile_apk_path = os.path.join(report_base_dir, f"new_{apk_name}.apk")
+        # Recompile the APK
+        console.print("[cyan][+][/cyan][bold cyan] Recompiling APK ...[/bold cyan]")
+        recompile_apk_path = os.path.join(report_base_dir, f"new_{apk_name}.apk")
+        with metrics.stage("recompile"):
             recompile_apk(output_dir, recompile_apk_path)
-            console.print("\n" * 1)
-
-            # Signing the recompiled APK
-            console.print("[cyan][+][/cyan][bold cyan] Signing APK ...[/bold cyan]")
-            sig_key_path = os.path.join(os.getcwd(), 'sign_key.jks')
-            sign_apk(recompile_apk_path, sig_key_path, 'root_alias', 'root@123')
-
-            console.print("\n" * 1)
+        console.print("\n" * 1)
+
+        # Signing the recompiled APK
+        console.print("[cyan][+][/cyan][bold cyan] Signing APK ...[/bold cyan]")
+        sig_key_path = os.path.join(os.getcwd(), 'sign_key.jks')
+        with metrics.stage("sign"):
+            error = sign_apk(recompile_apk_path, sig_key_path, 'root_alias', 'root@123')
+        console.print("\n" * 1)
+        if error:
+            console.print(f"[red][-][/red] [bold red]Error:[/bold red] Signing failed: {error}")
+            summary["error"] = f"Signing failed: {error}"
+        else:
+            summary["signed_apk"] = recompile_apk_path
+            summary["status"] = "ok"
             console.print("[green][+][/green] [bold green]Process completed successfully![/bold green]")
-
-    # After finishing the console output capture, generate the PDF report
-    generate_pdf_report(log_file_path)
+    except ToolError as e:
+        console.print(f"[red][-][/red] [bold red]Error:[/bold red] {e}")
+        summary["error"] = str(e)
+    finally:
+        # Generate the report from what the stages recorded, whether they all ran or not
+        summary["stage_seconds"] = metrics.wall_times()
+        for report_path in write_report(summary, report_base_dir, apk_name):
+            console.print(f"[green][+][/green] [bold green]Report saved as:[/bold green] {report_path}")
+    if summary["status"] != "ok":
+        sys.exit(1)
 
 
 # Run the main function
@@ -0,0 +1,188 @@
+import base64
+import datetime
+import hashlib
+import os
+import stat
+import struct
+import zipfile
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.x509.oid import NameOID
+
+from source.signing.apk_signer import LIBRARY_ALIGNMENT, sign_apk_file
+from source.signing.keystore import SigningKey
+from source.signing.signing_block import APK_SIGNING_BLOCK_MAGIC, STRIPPING_PROTECTION_ATTRIBUTE_ID, V2_BLOCK_ID, V3_BLOCK_ID
+
+CONTENTS = {
+    "AndroidManifest.xml": (b"\x03\x00\x08\x00" + b"manifest" * 100, zipfile.ZIP_DEFLATED),
+    "resources.arsc": (b"\x02\x00\x0c\x00" + bytes(range(256)) * 3, zipfile.ZIP_STORED),
+    "classes.dex": (b"dex\n035\0" + os.urandom(3000), zipfile.ZIP_DEFLATED),
+    "lib/arm64-v8a/libnative.so": (b"\x7fELF" + os.urandom(5000), zipfile.ZIP_STORED),
+    "assets/a.txt": (b"odd", zipfile.ZIP_STORED),
+    "lib/x86/libother.so": (b"\x7fELF" + os.urandom(77), zipfile.ZIP_STORED),
+}
+
+def make_key(kind):
+    private_key = rsa.generate_private_key(65537, 2048) if kind == "rsa" else ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(private_key.public_key())
+                   .serial_number(1).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+                   .sign(private_key, hashes.SHA256()))
+    return SigningKey(private_key, [certificate])
+
+@pytest.fixture(scope="module", params=["rsa", "ec"])
+def signing_key(request):
+    return make_key(request.param)
+
+def build_apk(path):
+    # An unaligned APK still carrying an old v1 signature
+    with zipfile.ZipFile(path, "w") as apk:
+        for name, (content, method) in CONTENTS.items():
+            apk.writestr(name, content, method)
+        apk.writestr("META-INF/OLD.SF", b"Signature-Version: 1.0\r\n")
+        apk.writestr("META-INF/OLD.RSA", b"\0" * 10)
+
+def signing_blocks(data):
+    """Return ({block id: value}, signing block offset, central directory offset) of a signed APK."""
+    eocd = data.rfind(b"PK\x05\x06")
+    cd_offset = struct.unpack_from("<I", data, eocd + 16)[0]
+    assert data[cd_offset - 16:cd_offset] == APK_SIGNING_BLOCK_MAGIC
+    size = struct.unpack_from("<Q", data, cd_offset - 24)[0]
+    start = cd_offset - size - 8
+    assert struct.unpack_from("<Q", data, start)[0] == size
+    blocks, position = {}, start + 8
+    while position < cd_offset - 24:
+        length, block_id = struct.unpack_from("<QI", data, position)
+        blocks[block_id] = data[position + 12:position + 8 + length]
+        position += 8 + length
+    return blocks, start, cd_offset
+
+def chunk_digests(section):
+    return [hashlib.sha256(b"\xa5" + struct.pack("<I", len(section[i:i + 1024 * 1024])) + section[i:i + 1024 * 1024]).digest()
+            for i in range(0, len(section), 1024 * 1024)]
+
+def expected_digest(data, block_start, cd_offset):
+    # Entries, central directory, and the end of central directory with its offset pointing at the block
+    eocd = data.rfind(b"PK\x05\x06")
+    end = bytearray(data[eocd:])
+    struct.pack_into("<I", end, 16, block_start)
+    digests = chunk_digests(data[:block_start]) + chunk_digests(data[cd_offset:eocd]) + chunk_digests(bytes(end))
+    return hashlib.sha256(b"\x5a" + struct.pack("<I", len(digests)) + b"".join(digests)).digest()
+
+def prefixed(data, position=0):
+    length = struct.unpack_from("<I", data, position)[0]
+    return data[position + 4:position + 4 + length], position + 4 + length
+
+def read_signer(block, v3):
+    """Return (signed data, algorithm id, signature, public key DER) of the only signer of a v2/v3 block."""
+    signers, _ = prefixed(block)
+    signer, _ = prefixed(signers)
+    signed_data, position = prefixed(signer)
+    if v3:
+        position += 8
+    signatures, position = prefixed(signer, position)
+    public_key, _ = prefixed(signer, position)
+    signature, _ = prefixed(signatures)
+    algorithm_id = struct.unpack_from("<I", signature)[0]
+    return signed_data, algorithm_id, prefixed(signature, 4)[0], public_key
+
+def verify(public_key_der, signature, data):
+    public_key = serialization.load_der_public_key(public_key_der)
+    if isinstance(public_key, rsa.RSAPublicKey):
+        public_key.verify(signature, data, padding.PKCS1v15(), hashes.SHA256())
+    else:
+        public_key.verify(signature, data, ec.ECDSA(hashes.SHA256()))
+
+def test_v2_v3_signing_block(tmp_path, signing_key):
+    apk_path, signed_path = tmp_path / "app.apk", tmp_path / "signed.apk"
+    build_apk(apk_path)
+    sign_apk_file(str(apk_path), str(signed_path), signing_key)
+
+    data = signed_path.read_bytes()
+    blocks, block_start, cd_offset = signing_blocks(data)
+    assert set(blocks) == {V2_BLOCK_ID, V3_BLOCK_ID}
+    digest = expected_digest(data, block_start, cd_offset)
+
+    for block_id, v3 in ((V2_BLOCK_ID, False), (V3_BLOCK_ID, True)):
+        signed_data, algorithm_id, signature, public_key = read_signer(blocks[block_id], v3)
+        assert algorithm_id == signing_key.algorithm_id
+        assert public_key == signing_key.public_key_der()
+        verify(public_key, signature, signed_data)
+
+        digests, position = prefixed(signed_data)
+        digest_entry, _ = prefixed(digests)
+        assert struct.unpack_from("<I", digest_entry)[0] == algorithm_id
+        assert prefixed(digest_entry, 4)[0] == digest
+        certificates, position = prefixed(signed_data, position)
+        assert prefixed(certificates)[0] == signing_key.certificates_der()[0]
+        if v3:
+            position += 8
+        attributes, _ = prefixed(signed_data, position)
+        # v2 tells verifiers a v3 signature must be there
+        assert (struct.pack("<II", STRIPPING_PROTECTION_ATTRIBUTE_ID, 3) in attributes) == (not v3)
+
+def test_zipalign_and_v1(tmp_path, signing_key):
+    apk_path = tmp_path / "app.apk"
+    build_apk(apk_path)
+    os.chmod(apk_path, 0o644)
+    # Signed in place, like sign_apk_files does
+    sign_apk_file(str(apk_path), str(apk_path), signing_key)
+    assert stat.S_IMODE(os.stat(apk_path).st_mode) == 0o644
+
+    data = apk_path.read_bytes()
+    with zipfile.ZipFile(apk_path) as apk:
+        assert apk.testzip() is None
+        for name, (content, method) in CONTENTS.items():
+            info = apk.getinfo(name)
+            assert apk.read(name) == content
+            if method == zipfile.ZIP_STORED:
+                name_length, extra_length = struct.unpack_from("<HH", data, info.header_offset + 26)
+                data_offset = info.header_offset + 30 + name_length + extra_length
+                assert data_offset % (LIBRARY_ALIGNMENT if name.endswith(".so") else 4) == 0, name
+
+        names = apk.namelist()
+        assert "META-INF/OLD.SF" not in names and "META-INF/OLD.RSA" not in names
+        manifest = apk.read("META-INF/MANIFEST.MF")
+        signature_file = apk.read("META-INF/CERT.SF")
+        assert f"META-INF/CERT.{signing_key.v1_extension}" in names
+
+    sections = manifest.split(b"\r\n\r\n")[1:-1]
+    assert len(sections) == len(CONTENTS)
+    for section in sections:
+        lines = section.split(b"\r\n")
+        name, digest = lines[0][len("Name: "):].decode(), lines[1][len("SHA-256-Digest: "):]
+        assert base64.b64decode(digest) == hashlib.sha256(CONTENTS[name][0]).digest()
+    assert b"X-Android-APK-Signed: 2, 3\r\n" in signature_file
+    manifest_digest = base64.b64encode(hashlib.sha256(manifest).digest())
+    assert b"SHA-256-Digest-Manifest: " + manifest_digest in signature_file
+
+def test_resigning_keeps_one_signature(tmp_path, signing_key):
+    apk_path = tmp_path / "app.apk"
+    build_apk(apk_path)
+    sign_apk_file(str(apk_path), str(apk_path), signing_key)
+    first = apk_path.read_bytes()
+    sign_apk_file(str(apk_path), str(apk_path), signing_key, schemes=(1, 2))
+    data = apk_path.read_bytes()
+
+    blocks, block_start, cd_offset = signing_blocks(data)
+    assert set(blocks) == {V2_BLOCK_ID}
+    signed_data, _, _, _ = read_signer(blocks[V2_BLOCK_ID], False)
+    digests, _ = prefixed(signed_data)
+    assert prefixed(prefixed(digests)[0], 4)[0] == expected_digest(data, block_start, cd_offset)
+    # Entries already aligned by the first pass do not move
+    assert data[:1000] == first[:1000]
+    with zipfile.ZipFile(apk_path) as apk:
+        assert apk.testzip() is None
+        assert sum(name.startswith("META-INF/") for name in apk.namelist()) == 3
+
+def test_v1_only_has_no_signing_block(tmp_path, signing_key):
+    apk_path, signed_path = tmp_path / "app.apk", tmp_path / "signed.apk"
+    build_apk(apk_path)
+    sign_apk_file(str(apk_path), str(signed_path), signing_key, schemes=(1,))
+    assert APK_SIGNING_BLOCK_MAGIC not in signed_path.read_bytes()
+    with zipfile.ZipFile(signed_path) as apk:
+        assert b"X-Android-APK-Signed" not in apk.read("META-INF/CERT.SF")
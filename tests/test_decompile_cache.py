@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+
+import pytest
+
+from source.operations import decompile_cache
+from source.operations.decompile_apk import decompile_apk
+from source.utils.hashing import file_sha256
+from source.utils.tool_runner import ToolError, apktool_path, tool_options
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="the fake java is a shell script")
+
+# Stands in for "java -jar apktool.jar d <apk> -o <dir>": writes a small tree, counts its runs,
+# and exits with the code found in the APK, after writing part of the tree as apktool would
+FAKE_JAVA = """#!{python}
+import os, sys
+args = sys.argv[1:]
+apk, target = args[args.index("d") + 1], args[args.index("-o") + 1]
+with open(os.path.join(os.path.dirname(apk), "runs"), "a") as runs:
+    runs.write("run\\n")
+os.makedirs(os.path.join(target, "res", "values"))
+with open(os.path.join(target, "AndroidManifest.xml"), "w") as manifest:
+    manifest.write('<manifest android:debuggable="true"/>')
+code = int(open(apk).read())
+if not code:
+    with open(os.path.join(target, "res", "values", "strings.xml"), "w") as strings:
+        strings.write("<resources/>")
+print("I: Decoding done" if not code else "Exception in thread main")
+sys.exit(code)
+"""
+
+@pytest.fixture
+def fake_apktool(tmp_path):
+    java = tmp_path / "java"
+    java.write_text(FAKE_JAVA.format(python=sys.executable))
+    java.chmod(0o755)
+    return dict(tool_options(), java=str(java))
+
+def write_apk(tmp_path, exit_code):
+    apk_path = tmp_path / "app.apk"
+    apk_path.write_text(str(exit_code))
+    return str(apk_path)
+
+def runs(tmp_path):
+    runs_path = tmp_path / "runs"
+    return len(runs_path.read_text().splitlines()) if runs_path.exists() else 0
+
+def tree(directory):
+    files = {}
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as file:
+                files[os.path.relpath(path, directory)] = file.read()
+    return files
+
+def cache_key(apk_path):
+    return decompile_cache.decode_cache_key(file_sha256(apk_path), apktool_path(), [])
+
+def test_failed_decode_is_not_cached(tmp_path, fake_apktool):
+    apk_path, cache_dir = write_apk(tmp_path, 3), str(tmp_path / "cache")
+    with pytest.raises(ToolError, match="code 3"):
+        decompile_apk(apk_path, str(tmp_path / "out"), None, cache_dir, options=fake_apktool)
+
+    assert decompile_cache.lookup(cache_dir, cache_key(apk_path)) is None
+    assert decompile_cache._load_index(cache_dir) == {}
+    # Neither the partial tree nor its staging directory is left behind
+    assert sorted(os.listdir(cache_dir)) == [decompile_cache.LOCK_FILE]
+
+    # The next run decodes again instead of getting the partial tree
+    with pytest.raises(ToolError):
+        decompile_apk(apk_path, str(tmp_path / "out"), None, cache_dir, options=fake_apktool)
+    assert runs(tmp_path) == 2
+
+def test_cache_hit_gives_the_same_tree(tmp_path, fake_apktool):
+    apk_path, cache_dir = write_apk(tmp_path, 0), str(tmp_path / "cache")
+    first, second = str(tmp_path / "first"), str(tmp_path / "second")
+
+    assert decompile_apk(apk_path, first, None, cache_dir, options=fake_apktool) is False
+    assert decompile_apk(apk_path, second, None, cache_dir, options=fake_apktool) is True
+
+    assert runs(tmp_path) == 1
+    assert tree(second) == tree(first)
+    assert set(tree(first)) == {"AndroidManifest.xml", os.path.join("res", "values", "strings.xml")}
+    entry_dir = decompile_cache.lookup(cache_dir, cache_key(apk_path))
+    # The working copy is hardlinked to the cache entry, and the apktool output kept for the image
+    assert os.path.samefile(os.path.join(second, "AndroidManifest.xml"), os.path.join(entry_dir, "AndroidManifest.xml"))
+    assert decompile_cache.cached_output(cache_dir, cache_key(apk_path)).strip() == "I: Decoding done"
+    assert [name for name in os.listdir(cache_dir) if name.endswith(".partial")] == []
+
+def store_tree(cache_dir, key, size, max_mb):
+    decoded_dir = decompile_cache.staging_dir(cache_dir, key)
+    os.makedirs(decoded_dir)
+    with open(os.path.join(decoded_dir, "classes.dex"), "wb") as dex:
+        dex.write(b"\0" * size)
+    entry_dir = decompile_cache.store(cache_dir, key, decoded_dir, f"decoded {key}", max_mb)
+    # Entries must not share a last_used timestamp
+    time.sleep(0.01)
+    return entry_dir
+
+def test_eviction_respects_max_mb(tmp_path):
+    cache_dir, kib = str(tmp_path / "cache"), 1024
+    store_tree(cache_dir, "a", 400 * kib, max_mb=1)
+    store_tree(cache_dir, "b", 400 * kib, max_mb=1)
+    # a is used again, so b is now the least recently used entry
+    assert decompile_cache.lookup(cache_dir, "a")
+    time.sleep(0.01)
+    store_tree(cache_dir, "c", 400 * kib, max_mb=1)
+
+    index = decompile_cache._load_index(cache_dir)
+    assert sorted(index) == ["a", "c"]
+    assert sum(entry["size"] for entry in index.values()) <= 1024 * kib
+    assert decompile_cache.lookup(cache_dir, "b") is None
+    assert not os.path.exists(os.path.join(cache_dir, "b"))
+    assert decompile_cache.cached_output(cache_dir, "b") == ""
+
+    # An entry larger than the whole cache is still kept: it is the one being used
+    big_entry = store_tree(cache_dir, "big", 2048 * kib, max_mb=1)
+    assert sorted(decompile_cache._load_index(cache_dir)) == ["big"]
+    assert os.path.isdir(big_entry)
+    assert sorted(name for name in os.listdir(cache_dir) if not name.startswith("index")) == ["big", "big.log"]
@@ -0,0 +1,133 @@
+import struct
+import zipfile
+
+import pytest
+
+from source.scanner.dex_scan import DexTables, scan_apk_code, scan_dex
+from source.scanner.rules import Rule, RuleSet
+
+STRINGS = ["Landroid/webkit/WebSettings;", "Lcom/example/Main;", "Ljava/lang/Object;", "V", "Z", "VZ", "onCreate",
+           "setJavaScriptEnabled", "https://demo.firebaseio.com", "ann.firebaseio.com only"]
+FIREBASE_STRING, UNUSED_STRING = 8, 9
+
+JAVASCRIPT = Rule("javascript", ".setJavaScriptEnabled(true)", paths=(),
+                  code="Landroid/webkit/WebSettings;->setJavaScriptEnabled(Z)V")
+FIREBASE = Rule("firebase", ".firebaseio.com", code=".firebaseio.com")
+RULES = RuleSet([JAVASCRIPT, FIREBASE, Rule("manifest", 'android:debuggable="true"', paths=("AndroidManifest.xml",))])
+
+def uleb128(value):
+    out = b""
+    while True:
+        byte, value = value & 0x7f, value >> 7
+        if not value:
+            return out + bytes([byte])
+        out += bytes([byte | 0x80])
+
+def build_dex(jumbo=False, debug_info=True):
+    """
+    A dex with one class, com.example.Main, whose onCreate() loads the firebase URL, calls
+    WebSettings.setJavaScriptEnabled(Z) and ends with an array data table. A second firebase
+    string is used by no code; the table holds units that look like a const-string of it.
+    """
+    data = bytearray(0x70)
+
+    def align():
+        data.extend(b"\0" * (-len(data) % 4))
+
+    string_ids = len(data)
+    data += b"\0" * 4 * len(STRINGS)
+    type_ids = len(data)
+    types = [0, 1, 2, 3, 4]
+    data += b"".join(struct.pack("<I", string_index) for string_index in types)
+    proto_ids = len(data)
+    data += b"\0" * 24
+    method_ids = len(data)
+    # WebSettings.setJavaScriptEnabled(Z)V and Main.onCreate()V
+    data += struct.pack("<HHI", 0, 0, 7) + struct.pack("<HHI", 1, 1, 6)
+    class_defs = len(data)
+    data += b"\0" * 32
+
+    for index, string in enumerate(STRINGS):
+        struct.pack_into("<I", data, string_ids + 4 * index, len(data))
+        data += uleb128(len(string)) + string.encode("utf-8") + b"\0"
+    align()
+    type_list = len(data)
+    data += struct.pack("<IH", 1, 4)
+    align()
+    struct.pack_into("<III", data, proto_ids, 5, 3, type_list)
+    struct.pack_into("<III", data, proto_ids + 12, 3, 3, 0)
+
+    debug = 0
+    if debug_info:
+        # Line 10 at address 0, line 12 from address 2 (special opcodes)
+        debug = len(data)
+        data += uleb128(10) + uleb128(0) + bytes([0x0e, 0x2d, 0x1e, 0x00])
+        align()
+
+    load = [0x001b, FIREBASE_STRING, 0] if jumbo else [0x001a, FIREBASE_STRING]
+    instructions = load + [0x1012, 0x206e, 0, 0x0010, 0x000e]
+    instructions += [0x0000] * (len(instructions) % 2)
+    # fill-array-data payload of two 16-bit elements
+    instructions += [0x0300, 2, 2, 0, 0x001a, UNUSED_STRING]
+    code = len(data)
+    data += struct.pack("<HHHHII", 2, 1, 2, 0, debug, len(instructions))
+    data += struct.pack(f"<{len(instructions)}H", *instructions)
+    align()
+
+    class_data = len(data)
+    data += b"".join(uleb128(value) for value in (0, 0, 0, 1, 1, 1, code))
+    struct.pack_into("<8I", data, class_defs, 1, 1, 2, 0, 0xFFFFFFFF, 0, class_data, 0)
+
+    data[:8] = b"dex\n035\0"
+    struct.pack_into("<II", data, 32, len(data), 0x70)
+    struct.pack_into("<12I", data, 56, len(STRINGS), string_ids, len(types), type_ids, 2, proto_ids, 0, 0,
+                     2, method_ids, 1, class_defs)
+    return bytes(data)
+
+def test_tables():
+    dex = DexTables(build_dex())
+    assert dex.strings == STRINGS
+    assert dex.types == STRINGS[:5]
+    assert [dex.method_reference(index) for index in range(2)] == [JAVASCRIPT.code, "Lcom/example/Main;->onCreate()V"]
+    assert [method_index for method_index, _ in dex.code_items()] == [1]
+
+@pytest.mark.parametrize("jumbo", [False, True])
+def test_scan_dex(jumbo):
+    hits = list(scan_dex(build_dex(jumbo=jumbo), RULES, "app.apk!/classes.dex"))
+    instruction = "const-string/jumbo" if jumbo else "const-string"
+    assert hits == [
+        (FIREBASE.pattern, "app.apk!/classes.dex!/com.example.Main", 10,
+         f'Lcom/example/Main;->onCreate()V\n    {instruction} "https://demo.firebaseio.com"\n'),
+        (JAVASCRIPT.pattern, "app.apk!/classes.dex!/com.example.Main", 12,
+         f"Lcom/example/Main;->onCreate()V\n    invoke-virtual {JAVASCRIPT.code}\n"),
+        # Not used by any code, reported against the dex itself
+        (FIREBASE.pattern, "app.apk!/classes.dex", 0, "ann.firebaseio.com only\n"),
+    ]
+
+def test_stripped_debug_info():
+    hits = list(scan_dex(build_dex(debug_info=False), RULES, "classes.dex"))
+    assert [line_number for _, _, line_number, _ in hits] == [0, 0, 0]
+
+def test_no_code_rules():
+    assert list(scan_dex(b"not a dex", RuleSet.from_words(["firebaseio"]), "classes.dex")) == []
+
+@pytest.mark.parametrize("data", [b"not a dex", build_dex()[:200]])
+def test_malformed_dex(data):
+    with pytest.raises(ValueError):
+        list(scan_dex(data, RULES, "classes.dex"))
+
+def test_scan_apk_code(tmp_path):
+    apk_path = tmp_path / "app.apk"
+    with zipfile.ZipFile(apk_path, "w", zipfile.ZIP_DEFLATED) as apk:
+        apk.writestr("AndroidManifest.xml", b"\x03\x00\x08\x00")
+        apk.writestr("classes.dex", build_dex())
+        apk.writestr("classes2.dex", build_dex()[:300])
+        apk.writestr("assets/classes.dex", build_dex())
+
+    stats = {}
+    hits = list(scan_apk_code(str(apk_path), RULES, stats))
+    assert {filepath for _, filepath, _, _ in hits} == {f"{apk_path}!/classes.dex!/com.example.Main",
+                                                        f"{apk_path}!/classes.dex"}
+    assert len(hits) == 3
+    assert stats["dex_files"] == 2
+    assert stats["undecoded"] == ["classes2.dex"]
@@ -0,0 +1,77 @@
+from source.operations.screenshot import GAP_ROW, evidence_blocks, evidence_pages, page_filename
+from source.scanner.rules import RuleSet
+from source.scanner.scan import scan_buffer
+
+WORD = "api_key"
+
+def file_hits(hit_lines, line_count=60, filler="line", filepath="app/res/file.xml"):
+    """(line_number, context) of a file with WORD on hit_lines, contexts as the scanner reads them."""
+    content = "".join(f"{WORD} {number}\n" if number in hit_lines else f"{filler} {number}\n"
+                      for number in range(1, line_count + 1))
+    return [(line_number, context) for _, _, line_number, context in
+            scan_buffer(content.encode("utf-8"), RuleSet.from_words([WORD]), filepath, filepath)]
+
+def test_overlapping_windows_merge():
+    blocks = evidence_blocks(file_hits({10, 13}))
+    # Windows 6-15 and 9-18 become one block, each line once
+    assert len(blocks) == 1
+    first_line, lines, hit_lines, window = blocks[0]
+    assert (first_line, hit_lines, window) == (6, {10, 13}, True)
+    assert lines == [f"{WORD} {n}" if n in (10, 13) else f"line {n}" for n in range(6, 19)]
+
+def test_touching_windows_merge_without_gap():
+    # Windows 6-15 and 16-25
+    pages = evidence_pages(file_hits({10, 20}))
+    assert [line_number for line_number, _, _ in pages[0]] == list(range(6, 26))
+    assert GAP_ROW not in pages[0]
+
+def test_separate_windows_get_a_gap_row():
+    pages = evidence_pages(file_hits({3, 40}))
+    assert len(pages) == 1
+    rows = pages[0]
+    # The first window is cut at the top of the file
+    assert rows[:8] == [(n, f"{WORD} 3" if n == 3 else f"line {n}", n == 3) for n in range(1, 9)]
+    assert rows[8] == GAP_ROW
+    assert [row[0] for row in rows[9:]] == list(range(36, 46))
+    assert [row[0] for row in rows if row[2]] == [3, 40]
+
+def test_same_hit_twice_is_drawn_once():
+    hits = file_hits({10})
+    assert evidence_blocks(hits + hits) == evidence_blocks(hits)
+
+def test_code_contexts_are_not_merged():
+    context = "Lcom/example/Main;->onCreate()V\n    const-string \"https://demo.firebaseio.com\"\n"
+    hits = file_hits({12}) + [(12, context), (0, "ann.firebaseio.com only\n")]
+    blocks = evidence_blocks(hits)
+
+    # Each code context is a block of its own, and the window after it starts a new block too
+    assert [(first_line, window) for first_line, _, _, window in blocks] == [(0, False), (12, False), (8, True)]
+    rows = evidence_pages(hits)[0]
+    # Only the hit line of a code context has a line number
+    assert rows[:6] == [(0, "ann.firebaseio.com only", True), GAP_ROW,
+                        (12, "Lcom/example/Main;->onCreate()V", True),
+                        (None, "    const-string \"https://demo.firebaseio.com\"", False), GAP_ROW,
+                        (8, "line 8", False)]
+
+def test_page_splitting():
+    hits = file_hits({5, 30, 55})
+    rows = evidence_pages(hits)[0]
+    pages = evidence_pages(hits, page_rows=7)
+    assert [len(page) for page in pages] == [7] * (len(rows) // 7) + ([len(rows) % 7] if len(rows) % 7 else [])
+    assert [row for page in pages for row in page] == rows
+
+def test_long_lines_are_cut():
+    context = "x" * 500 + "\n"
+    rows = evidence_pages([(1, context)])[0]
+    assert rows[0][1] == "x" * 200 + "..."
+
+def test_identical_snippets_share_a_filename():
+    # The same snippet in two files (a library copied into two apps) is one image
+    first = evidence_pages(file_hits({20}))
+    second = evidence_pages(file_hits({20}, line_count=300, filepath="other_app/res/copy.xml"))
+    assert page_filename(first[0]) == page_filename(second[0])
+    assert page_filename(first[0]).endswith(".png")
+
+    # Any other line, hit or line number gives another image
+    assert page_filename(evidence_pages(file_hits({21}))[0]) != page_filename(first[0])
+    assert page_filename(evidence_pages(file_hits({20}, filler="other"))[0]) != page_filename(first[0])
@@ -0,0 +1,111 @@
+import struct
+import zipfile
+
+import pytest
+
+from source.operations.manifest_patch import (ANDROID_NAMESPACE, ATTRIBUTE_IDS, MANIFEST_NAME, boolean_flips,
+                                              decode_manifest, patch_apk_manifest, patch_manifest_xml)
+from source.operations.zip_raw import read_central_directory
+
+TRUE, FALSE = 0xFFFFFFFF, 0
+NO_INDEX = 0xFFFFFFFF
+STRINGS = ["exported", "debuggable", "allowBackup", "android", ANDROID_NAMESPACE, "manifest", "activity",
+           "application", "label"]
+EXPORTED, DEBUGGABLE, ALLOW_BACKUP, PREFIX, NAMESPACE, MANIFEST, ACTIVITY, APPLICATION, LABEL = range(len(STRINGS))
+
+def string_pool(strings, utf8=False):
+    offsets, body = [], b""
+    for string in strings:
+        offsets.append(len(body))
+        if utf8:
+            encoded = string.encode("utf-8")
+            body += bytes([len(string), len(encoded)]) + encoded + b"\0"
+        else:
+            body += struct.pack("<H", len(string)) + string.encode("utf-16-le") + b"\0\0"
+    body += b"\0" * (-len(body) % 4)
+    header_size = 28
+    data = b"".join(struct.pack("<I", offset) for offset in offsets) + body
+    return struct.pack("<HHIIIIII", 0x0001, header_size, header_size + len(data), len(strings), 0,
+                       0x100 if utf8 else 0, header_size + 4 * len(strings), 0) + data
+
+def start_element(name, attributes):
+    # attributes: (name index, value type, value), all in the android namespace
+    body = struct.pack("<IIHHHHHH", NO_INDEX, name, 20, 20, len(attributes), 0, 0, 0)
+    body += b"".join(struct.pack("<IIIHBBI", NAMESPACE, attribute, NO_INDEX, 8, 0, value_type, value)
+                     for attribute, value_type, value in attributes)
+    return struct.pack("<HHIII", 0x0102, 16, 16 + len(body), 1, NO_INDEX) + body
+
+def end_element(name):
+    return struct.pack("<HHIIIII", 0x0103, 16, 24, 1, NO_INDEX, NO_INDEX, name)
+
+def namespace(chunk_type):
+    return struct.pack("<HHIIIII", chunk_type, 16, 24, 1, NO_INDEX, PREFIX, NAMESPACE)
+
+def build_manifest(resource_map=True, utf8=False):
+    """
+    A binary manifest: an application that is debuggable and does not allow backup,
+    two nested exported activities, and a string typed label that is left alone.
+    """
+    body = string_pool(STRINGS, utf8)
+    if resource_map:
+        ids = [ATTRIBUTE_IDS["exported"], ATTRIBUTE_IDS["debuggable"], ATTRIBUTE_IDS["allowBackup"]]
+        body += struct.pack("<HHI", 0x0180, 8, 8 + 4 * len(ids)) + b"".join(struct.pack("<I", i) for i in ids)
+    body += namespace(0x0100) + start_element(MANIFEST, [])
+    body += start_element(APPLICATION, [(DEBUGGABLE, 0x12, TRUE), (ALLOW_BACKUP, 0x12, FALSE), (LABEL, 0x03, LABEL)])
+    body += start_element(ACTIVITY, [(EXPORTED, 0x12, TRUE)]) + start_element(ACTIVITY, [(EXPORTED, 0x12, TRUE)])
+    body += end_element(ACTIVITY) + end_element(ACTIVITY) + end_element(APPLICATION) + end_element(MANIFEST)
+    body += namespace(0x0101)
+    return struct.pack("<HHI", 0x0003, 8, 8 + len(body)) + body
+
+@pytest.mark.parametrize("resource_map, utf8", [(True, False), (False, False), (False, True)])
+def test_flips_only_the_boolean_values(resource_map, utf8):
+    # Without the resource map the attributes are matched by name in the string pool
+    original = build_manifest(resource_map, utf8)
+    patched, counts = patch_manifest_xml(original, {"exported": False, "debuggable": False, "allowBackup": False})
+
+    assert counts == {"exported": 2, "debuggable": 1}
+    assert len(patched) == len(original)
+    changed = [index for index in range(len(original)) if original[index] != patched[index]]
+    assert len(changed) == 3 * 4
+
+    xml = decode_manifest(patched)
+    assert 'android:debuggable="false"' in xml
+    assert 'android:allowBackup="false"' in xml
+    assert 'android:exported="true"' not in xml
+    assert xml.count('android:exported="false"') == 2
+
+def test_patching_twice_changes_nothing():
+    flips = {"exported": False, "debuggable": False}
+    patched, _ = patch_manifest_xml(build_manifest(), flips)
+    assert patch_manifest_xml(patched, flips) == (patched, {})
+
+def test_rejects_text_xml():
+    with pytest.raises(ValueError):
+        patch_manifest_xml(b'<?xml version="1.0"?><manifest/>', {"exported": False})
+
+def test_replacement_dict_is_boolean_flips():
+    assert boolean_flips() == {"debuggable": False, "allowBackup": False, "usesCleartextTraffic": False,
+                               "exported": False}
+
+def test_patch_apk_manifest(tmp_path):
+    apk_path, output_path = tmp_path / "app.apk", tmp_path / "patched.apk"
+    with zipfile.ZipFile(apk_path, "w", zipfile.ZIP_DEFLATED) as apk:
+        apk.writestr(MANIFEST_NAME, build_manifest())
+        apk.writestr(zipfile.ZipInfo("resources.arsc"), b"\0" * 64, zipfile.ZIP_STORED)
+        apk.writestr("classes.dex", b"dex\n035\0" + b"\1" * 200)
+        apk.writestr("META-INF/MANIFEST.MF", b"Manifest-Version: 1.0\r\n")
+        apk.writestr("META-INF/CERT.SF", b"Signature-Version: 1.0\r\n")
+        apk.writestr("META-INF/CERT.RSA", b"\0")
+
+    original_xml, counts = patch_apk_manifest(str(apk_path), str(output_path))
+
+    assert 'android:debuggable="true"' in original_xml
+    assert counts == {"exported": 2, "debuggable": 1}
+    with zipfile.ZipFile(apk_path) as apk, zipfile.ZipFile(output_path) as patched:
+        assert patched.testzip() is None
+        assert patched.namelist() == [MANIFEST_NAME, "resources.arsc", "classes.dex"]
+        assert patched.read("classes.dex") == apk.read("classes.dex")
+        assert patched.getinfo("resources.arsc").compress_type == zipfile.ZIP_STORED
+        assert 'android:exported="true"' not in decode_manifest(patched.read(MANIFEST_NAME))
+    with open(output_path, "rb") as patched_file:
+        assert [entry.name for entry in read_central_directory(patched_file)] == patched.namelist()
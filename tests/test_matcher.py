@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from source.scanner.matcher import MultiPatternMatcher
+
+# Small alphabet so random patterns overlap and share prefixes, with regex metacharacters in it
+ALPHABET = "ab.*(|\\\n"
+
+def find_all(buffer, patterns):
+    """Brute-force oracle: every (pattern_index, offset) found by str.find, in finditer order."""
+    found = []
+    for index, pattern in enumerate(patterns):
+        offset = buffer.find(pattern)
+        while offset != -1:
+            found.append((offset, index))
+            offset = buffer.find(pattern, offset + 1)
+    return [(index, offset) for offset, index in sorted(found)]
+
+def find_lines(buffer, patterns):
+    """Brute-force oracle of find_lines: the `pattern in line` loop the scanner used to run."""
+    found = set()
+    for line_number, line in enumerate(buffer.split("\n"), start=1):
+        for index, pattern in enumerate(patterns):
+            if pattern in line:
+                found.add((line_number, index))
+    return sorted(found)
+
+def random_text(rng, length, alphabet=ALPHABET):
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+def test_matches_brute_force_oracle():
+    rng = random.Random(1234)
+    for _ in range(500):
+        patterns = [random_text(rng, rng.randint(1, 4), ALPHABET.replace("\n", ""))
+                    for _ in range(rng.randint(1, 8))]
+        buffer = random_text(rng, rng.randint(0, 200))
+        matcher = MultiPatternMatcher(patterns)
+
+        assert list(matcher.finditer(buffer)) == find_all(buffer, patterns), (patterns, buffer)
+        assert matcher.find_lines(buffer) == find_lines(buffer, patterns), (patterns, buffer)
+
+        encoded = [pattern.encode() for pattern in patterns]
+        bytes_matcher = MultiPatternMatcher(encoded)
+        assert bytes_matcher.find_lines(buffer.encode()) == find_lines(buffer, patterns)
+
+def test_overlaps_prefixes_and_duplicates():
+    patterns = ["aa", "a", "aaa", "a.", "(a|b)", "a"]
+    buffer = "aaaa.(a|b)\na*"
+    assert list(MultiPatternMatcher(patterns).finditer(buffer)) == find_all(buffer, patterns)
+    assert MultiPatternMatcher(patterns).find_lines(buffer) == find_lines(buffer, patterns)
+
+def test_rejects_empty_patterns():
+    with pytest.raises(ValueError):
+        MultiPatternMatcher([])
+    with pytest.raises(ValueError):
+        MultiPatternMatcher(["api_key", ""])
@@ -0,0 +1,68 @@
+from source.operations import modify_code
+from source.scanner.rules import RuleSet
+from source.scanner.scan import scan_tree
+from source.scanner.scan_cache import ScanCache, cache_version
+
+RULES = RuleSet.from_words(['android:debuggable="true"', ".firebaseio.com"])
+DIGEST = "ab" * 32
+HITS = [(3, 0, 'android:debuggable="true"\n'), (7, 1, "https://demo.firebaseio.com\n")]
+
+def open_cache(tmp_path, rules=RULES):
+    return ScanCache(str(tmp_path / "scan_cache.sqlite"), cache_version(rules))
+
+def test_store_flush_lookup(tmp_path):
+    cache = open_cache(tmp_path)
+    assert cache.lookup(DIGEST, "0,1") is None
+    cache.store(DIGEST, "0,1", HITS, True)
+    cache.close()
+
+    # A later run reads the result back from SQLite, hits as tuples
+    cache = open_cache(tmp_path)
+    assert cache.lookup(DIGEST, "0,1", size=100) == (HITS, True)
+    # Other rule subsets of the same content are separate results
+    assert cache.lookup(DIGEST, "1") is None
+    assert cache.stats == {"hits": 1, "misses": 1, "bytes_reused": 100}
+    assert cache.hit_rate() == 0.5
+    cache.close()
+
+def test_replacement_dict_change_misses(tmp_path, monkeypatch):
+    cache = open_cache(tmp_path)
+    cache.store(DIGEST, "0,1", HITS, True)
+    cache.close()
+
+    # The patchable flag depends on replacement_dict, results of another one are not reused
+    monkeypatch.setitem(modify_code.replacement_dict, '"google_api_key"', '"removed"')
+    cache = open_cache(tmp_path)
+    assert cache.lookup(DIGEST, "0,1") is None
+    cache.close()
+
+    monkeypatch.undo()
+    cache = open_cache(tmp_path)
+    assert cache.lookup(DIGEST, "0,1") == (HITS, True)
+    cache.close()
+
+def test_rules_change_misses(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.store(DIGEST, "0,1", HITS, True)
+    cache.close()
+
+    cache = open_cache(tmp_path, RuleSet.from_words(['android:debuggable="true"', ".firebaseio.com", "api_key"]))
+    assert cache.lookup(DIGEST, "0,1") is None
+    cache.close()
+
+def test_scan_tree_reuses_results(tmp_path):
+    tree = tmp_path / "app"
+    (tree / "res" / "values").mkdir(parents=True)
+    (tree / "AndroidManifest.xml").write_text('<application android:debuggable="true"/>\n')
+    (tree / "res" / "values" / "strings.xml").write_text("<string>https://demo.firebaseio.com</string>\n")
+
+    cache = open_cache(tmp_path)
+    first = sorted(scan_tree(str(tree), RULES, scan_cache=cache))
+    assert cache.stats["misses"] == 2 and cache.stats["hits"] == 0
+    cache.close()
+
+    cache = open_cache(tmp_path)
+    assert sorted(scan_tree(str(tree), RULES, scan_cache=cache)) == first
+    assert cache.stats["hits"] == 2 and cache.stats["misses"] == 0
+    cache.close()
+    assert len(first) == 2
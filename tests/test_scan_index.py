@@ -0,0 +1,62 @@
+import os
+
+from source.scanner.rules import RuleSet
+from source.scanner.scan import scan_tree
+from source.scanner.scan_index import FIXED, NEW, UNCHANGED, ScanIndex, scan_version
+
+RULES = RuleSet.from_words(["api_key", ".firebaseio.com"])
+
+def run_scan(tree, index_path, report_dir):
+    """Scan like main.py does: mark every hit, then collect the fixed findings and save the index."""
+    index = ScanIndex(str(index_path), scan_version(RULES, "decoded"), [str(tree) + os.sep], report_dir=report_dir)
+    statuses = {}
+    for word, filepath, line_number, context in scan_tree(str(tree), RULES, index=index):
+        status = index.mark(word, filepath, line_number, context)
+        statuses.setdefault(status, set()).add((index.relpath(filepath), word, line_number))
+    for relpath, word, line_number, _ in index.fixed():
+        statuses.setdefault(FIXED, set()).add((relpath, word, line_number))
+    index.save({"report": report_dir})
+    return index, statuses
+
+def test_rescan_reports_new_unchanged_and_fixed(tmp_path):
+    tree = tmp_path / "app"
+    (tree / "res").mkdir(parents=True)
+    (tree / "res" / "changed.xml").write_text("api_key one\nfiller\nhttps://a.firebaseio.com\n")
+    (tree / "res" / "removed.xml").write_text("filler\napi_key two\n")
+    (tree / "res" / "untouched.xml").write_text("api_key three\n")
+    index_path = tmp_path / "index" / "com.example_decoded.json"
+
+    index, statuses = run_scan(tree, index_path, "report_1")
+    assert set(statuses) == {NEW}
+    assert len(statuses[NEW]) == 4
+    assert index.stats["files_rescanned"] == 3
+
+    # One finding moved down a line, one is gone and one was added; a file was removed
+    (tree / "res" / "changed.xml").write_text("new line\napi_key one\nfiller\nhttps://b.firebaseio.com\n")
+    (tree / "res" / "removed.xml").unlink()
+
+    index, statuses = run_scan(tree, index_path, "report_2")
+    assert statuses[NEW] == {("res/changed.xml", ".firebaseio.com", 4)}
+    assert statuses[UNCHANGED] == {("res/changed.xml", "api_key", 2), ("res/untouched.xml", "api_key", 1)}
+    assert statuses[FIXED] == {("res/changed.xml", ".firebaseio.com", 3), ("res/removed.xml", "api_key", 2)}
+    # Only the changed file was read again; the untouched one was carried forward
+    assert (index.stats["files_rescanned"], index.stats["files_reused"]) == (1, 1)
+    # Unchanged findings point at the report holding their evidence
+    assert index.origins == {"report_1": 2}
+
+    # Nothing changed since: everything is unchanged, nothing is fixed, no file is read
+    index, statuses = run_scan(tree, index_path, "report_3")
+    assert set(statuses) == {UNCHANGED}
+    assert len(statuses[UNCHANGED]) == 3
+    assert index.stats["files_rescanned"] == 0
+
+def test_other_version_is_ignored(tmp_path):
+    tree = tmp_path / "app"
+    tree.mkdir()
+    (tree / "strings.xml").write_text("api_key\n")
+    index_path = tmp_path / "index.json"
+    run_scan(tree, index_path, "report_1")
+
+    index = ScanIndex(str(index_path), scan_version(RuleSet.from_words(["api_key"]), "decoded"))
+    assert index.previous == {}
+    assert index.carry("strings.xml", "fingerprint") is None
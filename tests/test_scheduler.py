@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from main import run_stages
+from source.pipeline.scheduler import StageError, StageGraph
+from source.utils.metrics import RunMetrics
+
+def apk_graph(calls, decompile=None):
+    """
+    Stub stages in the shape of one APK run: info alongside decompile, scan after both,
+    then screenshots alongside recompile and sign.
+    """
+    # info and decompile only finish once both have started, so they must run at the same time
+    overlap = threading.Barrier(2, timeout=10)
+    lock = threading.Lock()
+
+    def stage(name, result=None, wait=None):
+        def function(results):
+            with lock:
+                calls.append(name)
+            if wait:
+                wait.wait()
+            return result(results) if callable(result) else name
+        return function
+
+    def failing_decompile(results):
+        with lock:
+            calls.append("decompile")
+        overlap.wait()
+        raise decompile
+
+    graph = StageGraph()
+    graph.add("info", stage("info", wait=overlap))
+    graph.add("decompile", failing_decompile if decompile else stage("decompile", wait=overlap))
+    graph.add("scan", stage("scan", lambda results: (results["info"], results["decompile"])), after=("decompile", "info"))
+    graph.add("screenshots", stage("screenshots"), after=("scan",))
+    graph.add("recompile", stage("recompile"), after=("scan",))
+    graph.add("sign", stage("sign"), after=("recompile",))
+    return graph
+
+def test_stages_run_after_their_dependencies():
+    calls = []
+    results = apk_graph(calls).run()
+
+    assert results == {"info": "info", "decompile": "decompile", "scan": ("info", "decompile"),
+                       "screenshots": "screenshots", "recompile": "recompile", "sign": "sign"}
+    assert sorted(calls[:2]) == ["decompile", "info"]
+    assert calls[2] == "scan"
+    assert sorted(calls[3:]) == ["recompile", "screenshots", "sign"]
+    assert calls.index("recompile") < calls.index("sign")
+
+def test_failed_stage_skips_its_dependents():
+    calls = []
+    with pytest.raises(StageError, match="Decompilation failed"):
+        apk_graph(calls, StageError("Decompilation failed")).run()
+    # info is independent and still ran; scan, recompile and sign were never called
+    assert sorted(calls) == ["decompile", "info"]
+
+def test_independent_stages_finish_before_the_error_is_raised():
+    calls = []
+    release = threading.Event()
+
+    def slow(results):
+        release.wait(10)
+        calls.append("slow")
+        return "slow"
+
+    def failing(results):
+        release.set()
+        raise StageError("failed")
+
+    graph = StageGraph()
+    graph.add("failing", failing)
+    graph.add("slow", slow)
+    graph.add("after_failing", lambda results: calls.append("after_failing"), after=("failing",))
+    with pytest.raises(StageError):
+        graph.run()
+    assert calls == ["slow"]
+
+def test_unknown_dependency():
+    graph = StageGraph()
+    with pytest.raises(ValueError, match="unknown stage decompile"):
+        graph.add("scan", lambda results: None, after=("decompile",))
+
+def test_run_stages_marks_the_apk_failed(tmp_path):
+    calls, summary = [], {"status": "success"}
+    metrics = RunMetrics(str(tmp_path / "metrics.jsonl"), "app.apk")
+    run_stages(apk_graph(calls, StageError("Decompilation failed: code 1")), summary, metrics)
+
+    assert summary["status"] == "failed"
+    assert summary["error"] == "Decompilation failed: code 1"
+    assert "scan" not in calls and "sign" not in calls
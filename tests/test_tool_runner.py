@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+
+import pytest
+
+from source.operations.recompile_apk import recompile_apk
+from source.utils.tool_runner import OUTPUT_TAIL_LINES, ToolError, apktool_command, run_tool, tool_options
+
+def python_tool(code):
+    """Command running a small Python child process, like an external tool."""
+    return [sys.executable, "-c", code]
+
+def test_streams_output_to_the_log(tmp_path):
+    log_path = tmp_path / "logs" / "tool.log"
+    lines = OUTPUT_TAIL_LINES + 50
+    seen = []
+    result = run_tool(python_tool(
+        f"import sys\nfor i in range({lines}):\n    print('line', i)\nprint('error line', file=sys.stderr)"),
+        str(log_path), progress=seen.append)
+
+    assert result.returncode == 0
+    assert result.log_path == str(log_path)
+    # The log has every line, stdout and stderr; only the tail is kept in memory
+    logged = log_path.read_text().splitlines()
+    assert logged == [f"line {i}" for i in range(lines)] + ["error line"]
+    assert result.output.splitlines() == logged[-OUTPUT_TAIL_LINES:]
+    assert seen == logged
+
+def test_non_zero_exit(tmp_path):
+    result = run_tool(python_tool("import sys\nprint('brut.androlib.AndrolibException')\nsys.exit(3)"),
+                      str(tmp_path / "tool.log"))
+    assert result.returncode == 3
+    assert result.output == "brut.androlib.AndrolibException"
+
+def test_missing_tool(tmp_path):
+    result = run_tool([str(tmp_path / "no-such-java")], str(tmp_path / "tool.log"))
+    assert result.returncode == 127
+    assert (tmp_path / "tool.log").read_text()
+
+def test_timeout_kills_the_tool(tmp_path):
+    started = time.perf_counter()
+    with pytest.raises(ToolError, match="timed out after 1 seconds"):
+        run_tool(python_tool("import time\nprint('started', flush=True)\ntime.sleep(60)"),
+                 str(tmp_path / "tool.log"), timeout=1)
+    assert time.perf_counter() - started < 10
+    assert (tmp_path / "tool.log").read_text() == "started\n"
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="the memory limit reads /proc")
+def test_memory_limit_kills_the_tool(tmp_path):
+    with pytest.raises(ToolError, match="went over the 50 MB memory limit"):
+        run_tool(python_tool("import time\nblock = bytearray(200 * 1024 * 1024)\ntime.sleep(60)"),
+                 memory_limit_mb=50, timeout=30)
+
+@pytest.mark.skipif(os.name == 'nt', reason="apktool runs through the .bat wrapper on Windows")
+def test_apktool_command_settings(tmp_path):
+    options = dict(tool_options(), java="/opt/java", jvm_heap_mb=512, jvm_threads=2, apktool_jobs=4,
+                   tool_temp_dir=str(tmp_path / "tmp"))
+    command, env = apktool_command(options, "b", ["app", "-o", "app.apk"])
+    assert command[:4] == ["/opt/java", "-Xmx512m", "-XX:ActiveProcessorCount=2", f"-Djava.io.tmpdir={tmp_path / 'tmp'}"]
+    assert command[-6:] == ["b", "app", "-o", "app.apk", "-j", "4"]
+    assert env["TMPDIR"] == str(tmp_path / "tmp")
+
+@pytest.mark.skipif(os.name == 'nt', reason="the fake java is a shell script")
+def test_failed_rebuild_raises_and_leaves_no_apk(tmp_path):
+    java = tmp_path / "java"
+    java.write_text(f"#!{sys.executable}\nimport sys\nprint('W: could not build')\nsys.exit(1)\n")
+    java.chmod(0o755)
+    output_apk = tmp_path / "new_app.apk"
+    # An APK of an earlier run must not pass for the output of this one
+    output_apk.write_bytes(b"stale")
+
+    with pytest.raises(ToolError, match="apktool exited with code 1"):
+        recompile_apk(str(tmp_path / "app"), str(output_apk), dict(tool_options(), java=str(java)),
+                      str(tmp_path / "recompile.log"))
+    assert not output_apk.exists()
+    assert (tmp_path / "recompile.log").read_text() == "W: could not build\n"
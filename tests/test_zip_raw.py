@@ -0,0 +1,110 @@
+import io
+import struct
+import zipfile
+import zlib
+
+import pytest
+
+from source.operations.zip_raw import (CENTRAL_HEADER_SIGNATURE, DATA_DESCRIPTOR_SIGNATURE, FLAG_DATA_DESCRIPTOR,
+                                       LOCAL_HEADER_SIGNATURE, METHOD_DEFLATED, end_of_central_directory,
+                                       read_central_directory, read_entry, rewrite_zip)
+
+CONTENTS = {
+    "AndroidManifest.xml": b"\x03\x00\x08\x00" + b"manifest" * 50,
+    "resources.arsc": b"\x02\x00\x0c\x00" + bytes(range(256)),
+    "classes.dex": b"dex\n035\0" + b"code" * 300,
+    "res/raw/café.txt": "café crème".encode("utf-8"),
+}
+STORED = ("resources.arsc",)
+
+def build_zip(path):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr(zipfile.ZipInfo("res/"), b"")
+        for name, content in CONTENTS.items():
+            archive.writestr(name, content, zipfile.ZIP_STORED if name in STORED else zipfile.ZIP_DEFLATED)
+
+def build_descriptor_zip(path, with_signature):
+    """
+    A zip whose entries are streamed: sizes and CRC are zero in the local headers and follow
+    the data in a data descriptor, with or without its optional signature.
+    """
+    local_part, central_part = b"", b""
+    for name, content in CONTENTS.items():
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        data = compressor.compress(content) + compressor.flush()
+        crc = zlib.crc32(content)
+        raw_name = name.encode("utf-8")
+        flags = FLAG_DATA_DESCRIPTOR | (0x800 if not name.isascii() else 0)
+        central_part += struct.pack("<IHHHHHHIIIHHHHHII", CENTRAL_HEADER_SIGNATURE, 20, 20, flags, METHOD_DEFLATED,
+                                    0, 0x21, crc, len(data), len(content), len(raw_name), 0, 0, 0, 0, 0,
+                                    len(local_part)) + raw_name
+        descriptor = struct.pack("<III", crc, len(data), len(content))
+        if with_signature:
+            descriptor = struct.pack("<I", DATA_DESCRIPTOR_SIGNATURE) + descriptor
+        local_part += struct.pack("<IHHHHHIIIHH", LOCAL_HEADER_SIGNATURE, 20, flags, METHOD_DEFLATED, 0, 0x21,
+                                  0, 0, 0, len(raw_name), 0) + raw_name + data + descriptor
+    with open(path, "wb") as archive:
+        archive.write(local_part + central_part)
+        archive.write(end_of_central_directory(len(CONTENTS), len(central_part), len(local_part)))
+
+def raw_data(path, name):
+    # Compressed bytes of one entry as stored in the archive
+    with open(path, "rb") as archive:
+        entry = next(entry for entry in read_central_directory(archive) if entry.name == name)
+        archive.seek(entry.header_offset + 26)
+        name_length, extra_length = struct.unpack("<HH", archive.read(4))
+        archive.seek(name_length + extra_length, 1)
+        return archive.read(entry.compressed_size)
+
+def test_reads_central_directory(tmp_path):
+    path = tmp_path / "app.apk"
+    build_zip(path)
+    with open(path, "rb") as archive:
+        entries = read_central_directory(archive)
+        assert [entry.name for entry in entries] == ["res/"] + list(CONTENTS)
+        for entry in entries[1:]:
+            content = CONTENTS[entry.name]
+            assert read_entry(archive, entry) == content
+            assert entry.fingerprint() == f"{zlib.crc32(content):08x}:{len(content)}"
+    with zipfile.ZipFile(path) as archive:
+        assert [entry.header_offset for entry in entries] == [info.header_offset for info in archive.infolist()]
+
+def test_rejects_non_zip():
+    with pytest.raises(ValueError):
+        read_central_directory(io.BytesIO(b"not a zip" * 10))
+
+def test_rewrite_copies_untouched_entries(tmp_path):
+    src, dst = tmp_path / "app.apk", tmp_path / "new.apk"
+    build_zip(src)
+    new_manifest = b"\x03\x00\x08\x00patched"
+    written = rewrite_zip(str(src), str(dst),
+                          {"AndroidManifest.xml": new_manifest, "resources.arsc": b"\0" * 32, "assets/new.txt": b"new"},
+                          drop=lambda name: name.startswith("res/"))
+
+    assert written == 4
+    with zipfile.ZipFile(dst) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["AndroidManifest.xml", "resources.arsc", "classes.dex", "assets/new.txt"]
+        assert archive.read("AndroidManifest.xml") == new_manifest
+        assert archive.read("assets/new.txt") == b"new"
+        # Replaced entries keep their compression method
+        assert archive.getinfo("resources.arsc").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("AndroidManifest.xml").compress_type == zipfile.ZIP_DEFLATED
+    assert raw_data(dst, "classes.dex") == raw_data(src, "classes.dex")
+
+@pytest.mark.parametrize("with_signature", [True, False])
+def test_data_descriptors(tmp_path, with_signature):
+    src, dst = tmp_path / "streamed.apk", tmp_path / "new.apk"
+    build_descriptor_zip(src, with_signature)
+    with open(src, "rb") as archive:
+        assert {entry.name: read_entry(archive, entry) for entry in read_central_directory(archive)} == CONTENTS
+
+    rewrite_zip(str(src), str(dst), {"classes.dex": b"dex\n035\0replaced"})
+    with zipfile.ZipFile(dst) as archive:
+        assert archive.testzip() is None
+        assert archive.read("classes.dex") == b"dex\n035\0replaced"
+        assert archive.read("res/raw/café.txt") == CONTENTS["res/raw/café.txt"]
+        # A replaced entry is written with its sizes in the header, the copied ones keep their descriptor
+        assert not archive.getinfo("classes.dex").flag_bits & FLAG_DATA_DESCRIPTOR
+        assert archive.getinfo("resources.arsc").flag_bits & FLAG_DATA_DESCRIPTOR
+    assert raw_data(dst, "resources.arsc") == raw_data(src, "resources.arsc")